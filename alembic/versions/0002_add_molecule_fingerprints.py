@@ -0,0 +1,62 @@
+from alembic import op
+import sqlalchemy as sa
+from rdkit import Chem
+
+revision = '0002'
+down_revision = '0001'
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 1000
+FP_SIZE = 2048
+
+# as src.db defined it at this revision
+FP_CONTAINS_PG_DDL = """
+CREATE OR REPLACE FUNCTION fp_contains(fp bytea, q bytea) RETURNS boolean AS $$
+    SELECT (('x' || encode(fp, 'hex'))::bit(2048) & ('x' || encode(q, 'hex'))::bit(2048))
+           = ('x' || encode(q, 'hex'))::bit(2048)
+$$ LANGUAGE sql IMMUTABLE STRICT PARALLEL SAFE
+"""
+
+
+def _to_bytes(fp):
+    value = 0
+    for bit in fp.GetOnBits():
+        value |= 1 << bit
+    return value.to_bytes(fp.GetNumBits() // 8, 'little')
+
+
+def _fingerprint(smiles):
+    try:
+        mol = Chem.MolFromSmiles(smiles)
+        return _to_bytes(Chem.RDKFingerprint(mol, fpSize=FP_SIZE)) if mol is not None else None
+    except Exception:
+        return None
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+
+    op.add_column('molecules', sa.Column('fingerprint', sa.LargeBinary(), nullable=True))
+    if bind.dialect.name == 'postgresql':
+        op.execute(FP_CONTAINS_PG_DDL)
+
+    molecules = sa.table(
+        'molecules',
+        sa.column('id'),
+        sa.column('smiles', sa.String),
+        sa.column('fingerprint', sa.LargeBinary),
+    )
+    update = molecules.update().where(molecules.c.id == sa.bindparam('_id'))
+    batches = sa.select(molecules.c.id, molecules.c.smiles).order_by(molecules.c.id).limit(BATCH_SIZE)
+    batch = bind.execute(batches).fetchall()
+    while batch:
+        bind.execute(update, [{'_id': row.id, 'fingerprint': _fingerprint(row.smiles)} for row in batch])
+        batch = bind.execute(batches.where(molecules.c.id > batch[-1].id)).fetchall()
+
+
+def downgrade() -> None:
+    bind = op.get_bind()
+    if bind.dialect.name == 'postgresql':
+        op.execute('DROP FUNCTION IF EXISTS fp_contains(bytea, bytea)')
+    op.drop_column('molecules', 'fingerprint')
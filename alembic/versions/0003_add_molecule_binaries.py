@@ -0,0 +1,38 @@
+from alembic import op
+import sqlalchemy as sa
+from rdkit import Chem
+
+revision = '0003'
+down_revision = '0002'
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 1000
+
+
+def _mol_pkl(smiles):
+    mol = Chem.MolFromSmiles(smiles)
+    return mol.ToBinary() if mol is not None else None
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+
+    op.add_column('molecules', sa.Column('mol_pkl', sa.LargeBinary(), nullable=True))
+
+    molecules = sa.table(
+        'molecules',
+        sa.column('id'),
+        sa.column('smiles', sa.String),
+        sa.column('mol_pkl', sa.LargeBinary),
+    )
+    update = molecules.update().where(molecules.c.id == sa.bindparam('_id'))
+    batches = sa.select(molecules.c.id, molecules.c.smiles).order_by(molecules.c.id).limit(BATCH_SIZE)
+    batch = bind.execute(batches).fetchall()
+    while batch:
+        bind.execute(update, [{'_id': row.id, 'mol_pkl': _mol_pkl(row.smiles)} for row in batch])
+        batch = bind.execute(batches.where(molecules.c.id > batch[-1].id)).fetchall()
+
+
+def downgrade() -> None:
+    op.drop_column('molecules', 'mol_pkl')
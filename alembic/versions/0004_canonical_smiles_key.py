@@ -0,0 +1,119 @@
+import hashlib
+import logging
+
+from alembic import op
+import sqlalchemy as sa
+from rdkit import Chem
+
+revision = '0004'
+down_revision = '0003'
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 1000
+
+logger = logging.getLogger('alembic.runtime.migration')
+
+# lets batch mode on SQLite address the unnamed UNIQUE(smiles) constraint from 0001
+NAMING_CONVENTION = {'uq': 'uq_%(table_name)s_%(column_0_name)s'}
+
+
+def _batches(bind, molecules):
+    """The table's ``(id, smiles)`` rows, BATCH_SIZE at a time in id order."""
+    last = None
+    while True:
+        stmt = sa.select(molecules.c.id, molecules.c.smiles).order_by(molecules.c.id).limit(BATCH_SIZE)
+        if last is not None:
+            stmt = stmt.where(molecules.c.id > last)
+        rows = bind.execute(stmt).fetchall()
+        if not rows:
+            return
+        yield rows
+        last = rows[-1].id
+
+
+# src.chemistry's canonical form and structure key at this revision, kept here so later changes there cannot alter it
+def _canonical(smiles):
+    try:
+        mol = Chem.MolFromSmiles(smiles) if smiles else None
+    except Exception:
+        mol = None
+    return Chem.MolToSmiles(mol) if mol is not None else smiles
+
+
+def _smiles_key(canonical):
+    return hashlib.blake2b(canonical.encode(), digest_size=16).hexdigest()
+
+
+def _report_duplicates(bind, molecules) -> int:
+    """Log every group of rows sharing a structure; returns the number of groups."""
+    keys = (
+        sa.select(molecules.c.smiles_key)
+        .group_by(molecules.c.smiles_key)
+        .having(sa.func.count() > 1)
+        .subquery()
+    )
+    rows = bind.execute(
+        sa.select(molecules.c.smiles_key, molecules.c.id, molecules.c.smiles)
+        .where(molecules.c.smiles_key.in_(sa.select(keys.c.smiles_key)))
+        .order_by(molecules.c.smiles_key, molecules.c.id)
+    )
+    groups = 0
+    current = None
+    for key, id, smiles in rows:
+        if key != current:
+            groups += 1
+            current = key
+            logger.error('Duplicate structure %s:', key)
+        logger.error('    molecule %s (%s)', id, smiles)
+    return groups
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+
+    # SQLite does not roll back DDL, so a run aborted on duplicates may have left the column behind
+    if 'smiles_key' not in {column['name'] for column in sa.inspect(bind).get_columns('molecules')}:
+        op.add_column('molecules', sa.Column('smiles_key', sa.String(length=32), nullable=True))
+
+    molecules = sa.table(
+        'molecules',
+        sa.column('id'),
+        sa.column('smiles', sa.String),
+        sa.column('smiles_key', sa.String),
+    )
+    update = molecules.update().where(molecules.c.id == sa.bindparam('_id'))
+
+    # keys first: rewriting SMILES before duplicates are ruled out could trip the UNIQUE(smiles) constraint
+    for batch in _batches(bind, molecules):
+        bind.execute(update, [{'_id': row.id, 'smiles_key': _smiles_key(_canonical(row.smiles))} for row in batch])
+
+    # which copy of a structure to keep is the operator's call, not the migration's
+    groups = _report_duplicates(bind, molecules)
+    if groups:
+        raise RuntimeError(
+            f'{groups} structures are stored more than once (listed above). Keep one molecule of each '
+            f'group, delete the others and run the migration again.'
+        )
+
+    for batch in _batches(bind, molecules):
+        canonical = [(row.id, row.smiles, _canonical(row.smiles)) for row in batch]
+        changed = [{'_id': id, 'smiles': new} for id, old, new in canonical if new != old]
+        if changed:
+            bind.execute(update, changed)
+
+    if bind.dialect.name == 'postgresql':
+        op.drop_constraint('molecules_smiles_key', 'molecules', type_='unique')
+        op.alter_column('molecules', 'smiles_key', nullable=False)
+    else:
+        with op.batch_alter_table('molecules', naming_convention=NAMING_CONVENTION) as batch_op:
+            batch_op.drop_constraint('uq_molecules_smiles', type_='unique')
+            batch_op.alter_column('smiles_key', existing_type=sa.String(length=32), nullable=False)
+    op.create_index('ix_molecules_smiles_key', 'molecules', ['smiles_key'], unique=True)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_molecules_smiles_key', table_name='molecules')
+    with op.batch_alter_table('molecules') as batch_op:
+        batch_op.drop_column('smiles_key')
+        batch_op.create_unique_constraint('molecules_smiles_key', ['smiles'])
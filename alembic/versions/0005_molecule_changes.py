@@ -0,0 +1,26 @@
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+revision = '0005'
+down_revision = '0004'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    if op.get_bind().dialect.name == 'postgresql':
+        id_col = postgresql.UUID(as_uuid=True)
+    else:
+        id_col = sa.String(36)
+
+    # change journal: indexes held in memory by web and worker processes refresh from seq
+    op.create_table(
+        'molecule_changes',
+        sa.Column('seq', sa.BigInteger().with_variant(sa.Integer(), 'sqlite'), primary_key=True, autoincrement=True),
+        sa.Column('molecule_id', id_col, nullable=False),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('molecule_changes')
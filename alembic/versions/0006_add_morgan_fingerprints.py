@@ -0,0 +1,53 @@
+from alembic import op
+import sqlalchemy as sa
+from rdkit import Chem
+from rdkit.Chem import AllChem
+
+revision = '0006'
+down_revision = '0005'
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 1000
+MORGAN_RADIUS = 2
+SIM_FP_SIZE = 2048
+
+
+def _to_bytes(fp):
+    value = 0
+    for bit in fp.GetOnBits():
+        value |= 1 << bit
+    return value.to_bytes(fp.GetNumBits() // 8, 'little')
+
+
+def _morgan_fp(smiles):
+    try:
+        mol = Chem.MolFromSmiles(smiles)
+        if mol is None:
+            return None
+        return _to_bytes(AllChem.GetMorganFingerprintAsBitVect(mol, MORGAN_RADIUS, nBits=SIM_FP_SIZE))
+    except Exception:
+        return None
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+
+    op.add_column('molecules', sa.Column('morgan_fp', sa.LargeBinary(), nullable=True))
+
+    molecules = sa.table(
+        'molecules',
+        sa.column('id'),
+        sa.column('smiles', sa.String),
+        sa.column('morgan_fp', sa.LargeBinary),
+    )
+    update = molecules.update().where(molecules.c.id == sa.bindparam('_id'))
+    batches = sa.select(molecules.c.id, molecules.c.smiles).order_by(molecules.c.id).limit(BATCH_SIZE)
+    batch = bind.execute(batches).fetchall()
+    while batch:
+        bind.execute(update, [{'_id': row.id, 'morgan_fp': _morgan_fp(row.smiles)} for row in batch])
+        batch = bind.execute(batches.where(molecules.c.id > batch[-1].id)).fetchall()
+
+
+def downgrade() -> None:
+    op.drop_column('molecules', 'morgan_fp')
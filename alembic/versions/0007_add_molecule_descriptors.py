@@ -0,0 +1,67 @@
+from alembic import op
+import sqlalchemy as sa
+from rdkit import Chem
+from rdkit.Chem import Crippen, Descriptors, rdMolDescriptors
+
+revision = '0007'
+down_revision = '0006'
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 1000
+
+COLUMNS = {
+    'mw': sa.Float(),
+    'clogp': sa.Float(),
+    'hbd': sa.Integer(),
+    'hba': sa.Integer(),
+    'tpsa': sa.Float(),
+    'heavy_atoms': sa.Integer(),
+}
+
+
+def _descriptors(smiles):
+    try:
+        mol = Chem.MolFromSmiles(smiles)
+        return {
+            'mw': Descriptors.MolWt(mol),
+            'clogp': Crippen.MolLogP(mol),
+            'hbd': rdMolDescriptors.CalcNumHBD(mol),
+            'hba': rdMolDescriptors.CalcNumHBA(mol),
+            'tpsa': rdMolDescriptors.CalcTPSA(mol),
+            'heavy_atoms': mol.GetNumHeavyAtoms(),
+        }
+    except Exception:
+        return dict.fromkeys(COLUMNS)
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+
+    for name, type_ in COLUMNS.items():
+        op.add_column('molecules', sa.Column(name, type_, nullable=True))
+
+    molecules = sa.table(
+        'molecules',
+        sa.column('id'),
+        sa.column('smiles', sa.String),
+        *(sa.column(name, type_) for name, type_ in COLUMNS.items()),
+    )
+    update = molecules.update().where(molecules.c.id == sa.bindparam('_id'))
+    batches = sa.select(molecules.c.id, molecules.c.smiles).order_by(molecules.c.id).limit(BATCH_SIZE)
+    batch = bind.execute(batches).fetchall()
+    while batch:
+        bind.execute(update, [{'_id': row.id, **_descriptors(row.smiles)} for row in batch])
+        batch = bind.execute(batches.where(molecules.c.id > batch[-1].id)).fetchall()
+
+    # indexes after the backfill, so the updates do not maintain them row by row
+    for name in COLUMNS:
+        op.create_index(f'ix_molecules_{name}', 'molecules', [name])
+
+
+def downgrade() -> None:
+    for name in COLUMNS:
+        op.drop_index(f'ix_molecules_{name}', table_name='molecules')
+    with op.batch_alter_table('molecules') as batch_op:
+        for name in COLUMNS:
+            batch_op.drop_column(name)
@@ -0,0 +1,51 @@
+from alembic import op
+import sqlalchemy as sa
+from rdkit import Chem
+
+revision = '0008'
+down_revision = '0007'
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 1000
+FP_SIZE = 2048
+
+
+def _to_bytes(fp):
+    value = 0
+    for bit in fp.GetOnBits():
+        value |= 1 << bit
+    return value.to_bytes(fp.GetNumBits() // 8, 'little')
+
+
+def _refill(fingerprint) -> None:
+    bind = op.get_bind()
+    molecules = sa.table(
+        'molecules',
+        sa.column('id'),
+        sa.column('smiles', sa.String),
+        sa.column('fingerprint', sa.LargeBinary),
+    )
+
+    def _packed(smiles):
+        try:
+            mol = Chem.MolFromSmiles(smiles)
+            return _to_bytes(fingerprint(mol, fpSize=FP_SIZE)) if mol is not None else None
+        except Exception:
+            return None
+
+    update = molecules.update().where(molecules.c.id == sa.bindparam('_id'))
+    batches = sa.select(molecules.c.id, molecules.c.smiles).order_by(molecules.c.id).limit(BATCH_SIZE)
+    batch = bind.execute(batches).fetchall()
+    while batch:
+        bind.execute(update, [{'_id': row.id, 'fingerprint': _packed(row.smiles)} for row in batch])
+        batch = bind.execute(batches.where(molecules.c.id > batch[-1].id)).fetchall()
+
+
+def upgrade() -> None:
+    # screening fingerprints switch from RDKit path fingerprints to pattern fingerprints
+    _refill(Chem.PatternFingerprint)
+
+
+def downgrade() -> None:
+    _refill(Chem.RDKFingerprint)
@@ -0,0 +1,42 @@
+"""Compare rebuilding molecules from SMILES vs. stored RDKit binaries.
+
+Runs on the same seeded synthetic dataset as ``bench_suite.py`` (see ``datasets.py``).
+
+    PYTHONPATH=. python benchmarks/bench_mol_loading.py [--size 100k] [--seed 0]
+"""
+import argparse
+import time
+
+from rdkit import Chem, RDLogger
+
+from benchmarks.datasets import load_dataset
+
+RDLogger.DisableLog("rdApp.*")
+
+
+def _time(fn, items):
+    start = time.perf_counter()
+    for item in items:
+        fn(item)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size", default="100k", help="10k, 100k, 1m or a molecule count")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    smiles = load_dataset(args.size, args.seed)
+    pkls = [Chem.MolFromSmiles(s).ToBinary() for s in smiles]
+
+    t_smiles = _time(Chem.MolFromSmiles, smiles)
+    t_pkl = _time(Chem.Mol, pkls)
+    print(f"molecules:         {len(smiles)}")
+    print(f"MolFromSmiles:     {t_smiles:.3f}s ({len(smiles) / t_smiles:,.0f} mol/s)")
+    print(f"Mol(ToBinary()):   {t_pkl:.3f}s ({len(smiles) / t_pkl:,.0f} mol/s)")
+    print(f"speedup:           {t_smiles / t_pkl:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,234 @@
+"""End-to-end timings of the ingest, listing, search and cache hot paths.
+
+Runs the app in-process (FastAPI TestClient) against a fresh SQLite file and an in-memory fake
+Redis, on a seeded synthetic dataset (see ``datasets.py``), and writes the results as JSON so
+runs can be compared between commits:
+
+    PYTHONPATH=. python benchmarks/bench_suite.py --size 100k --out bench-100k.json
+    PYTHONPATH=. python benchmarks/bench_suite.py --size 100k --baseline bench-100k.json
+
+With ``--baseline`` every metric is printed next to the baseline value and flagged when it is
+more than ``--tolerance`` worse.
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+# the app reads its configuration at import time
+_DB_DIR = tempfile.mkdtemp(prefix="chem-bench-")
+os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{_DB_DIR}/bench.db"
+os.environ["CELERY_TASK_ALWAYS_EAGER"] = "1"
+
+import numpy as np  # noqa: E402
+import rdkit  # noqa: E402
+import sqlalchemy  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+
+from benchmarks.datasets import dataset_path, parse_size  # noqa: E402
+from src.cache import get_cache, local_cache  # noqa: E402
+from src.chemistry import compile_pattern  # noqa: E402
+from src.db import create_all_sync  # noqa: E402
+from src.executor import cpu_executor  # noqa: E402
+from src.index import molecule_index  # noqa: E402
+from src.main import app  # noqa: E402
+from src.settings import SEARCH_WORKERS  # noqa: E402
+from tests.fakes import FakeCache  # noqa: E402
+
+# (pattern, kind): selective ones screen out most of the library, unselective ones keep most of it
+PATTERNS = [
+    ("c1ccc2[nH]ccc2c1", "selective"),
+    ("C(F)(F)F", "selective"),
+    ("S(=O)(=O)N", "selective"),
+    ("[Br]", "selective"),
+    ("c1ccccc1", "unselective"),
+    ("[#6]~[#7]", "unselective"),
+    ("[R]", "unselective"),
+    ("C", "unselective"),
+]
+# metrics where a larger value is better; everything else is a duration
+HIGHER_IS_BETTER = ("per_s",)
+
+
+def _median_ms(fn, repeat: int) -> float:
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return round(statistics.median(samples), 3)
+
+
+def _git_commit() -> dict:
+    def _git(*args):
+        try:
+            return subprocess.run(["git", *args], capture_output=True, text=True, check=True).stdout.strip()
+        except Exception:
+            return None
+
+    return {"commit": _git("rev-parse", "HEAD"), "dirty": bool(_git("status", "--porcelain", "--untracked-files=no"))}
+
+
+def bench_ingest(client: TestClient, path: Path) -> dict:
+    start = time.perf_counter()
+    with open(path, "rb") as f:
+        r = client.post("/molecules/upload/", files={"file": (path.name, f, "text/plain")})
+    seconds = time.perf_counter() - start
+    r.raise_for_status()
+    stats = r.json()
+    return {**stats, "seconds": round(seconds, 3), "mol_per_s": round(stats["created"] / seconds, 1)}
+
+
+def bench_list_stream(client: TestClient) -> dict:
+    start = time.perf_counter()
+    rows = 0
+    with client.stream("GET", "/molecules/", params={"stream": "true"}) as r:
+        for line in r.iter_lines():
+            rows += bool(line)
+    seconds = time.perf_counter() - start
+    return {"rows": rows, "seconds": round(seconds, 3), "rows_per_s": round(rows / seconds, 1)}
+
+
+def bench_search(client: TestClient, cache: FakeCache, limit, repeat: int, hit_repeat: int, sql_screen: bool) -> list:
+    payload_limit = {"limit": limit} if limit else {}
+    # untimed: the first search pays for loading the index and starting the worker pools
+    client.post("/substructure-search", json={"substructure": "CCCCCCCCCCCCCCCCCCCC"}).raise_for_status()
+    results = []
+    for pattern, kind in PATTERNS:
+        body = {"substructure": pattern, **payload_limit}
+
+        def search():
+            r = client.post("/substructure-search", json=body)
+            r.raise_for_status()
+            return r.json()
+
+        def cold():
+            cache.store.clear()
+            local_cache.clear()
+            search()
+
+        def redis_hit():
+            local_cache.clear()
+            search()
+
+        result = {
+            "pattern": pattern,
+            "kind": kind,
+            "candidates": int(len(molecule_index.screen(compile_pattern(pattern)[1]))),
+            "miss_ms": _median_ms(cold, repeat),
+        }
+        result["hits"] = search()["count"]
+        result["hit_local_ms"] = _median_ms(search, hit_repeat)
+        result["hit_redis_ms"] = _median_ms(redis_hit, hit_repeat)
+        if sql_screen:
+            # the same miss with the fingerprint screen done by the database instead of the index
+            molecule_index.loaded = False
+            try:
+                result["miss_sql_screen_ms"] = _median_ms(cold, repeat)
+            finally:
+                molecule_index.loaded = True
+        results.append(result)
+        print(f"  {pattern:<18} {kind:<12} hits={result['hits']:<8} miss={result['miss_ms']:.1f}ms "
+              f"hit={result['hit_local_ms']:.2f}ms", file=sys.stderr)
+    return results
+
+
+def _flatten(results: dict) -> dict:
+    metrics = {}
+    for section in ("ingest", "list_stream"):
+        for name, value in results.get(section, {}).items():
+            if name.endswith(("seconds", "per_s")):
+                metrics[f"{section}.{name}"] = value
+    for entry in results.get("search", []):
+        for name, value in entry.items():
+            if name.endswith("_ms"):
+                metrics[f"search.{entry['pattern']}.{name}"] = value
+    return metrics
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> int:
+    """Print every metric next to the baseline; returns how many regressed by more than ``tolerance``."""
+    current, previous = _flatten(results), _flatten(baseline)
+    regressions = 0
+    print(f"{'metric':<48} {'baseline':>12} {'current':>12} {'change':>8}")
+    for name, value in current.items():
+        old = previous.get(name)
+        if not old:
+            print(f"{name:<48} {'-':>12} {value:>12}")
+            continue
+        change = value / old - 1
+        worse = -change if name.endswith(HIGHER_IS_BETTER) else change
+        flag = "  REGRESSION" if worse > tolerance else ""
+        regressions += bool(flag)
+        print(f"{name:<48} {old:>12} {value:>12} {change:>+8.1%}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--size", default="10k", help="10k, 100k, 1m or a molecule count")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--limit", type=int, default=None, help="limit for the timed searches (default: all hits)")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per cache-miss timing")
+    parser.add_argument("--hit-repeat", type=int, default=20, help="runs per cache-hit timing")
+    parser.add_argument("--sql-screen", action="store_true", help="also time misses with the SQL fingerprint screen")
+    parser.add_argument("--out", help="write the results here (default: stdout)")
+    parser.add_argument("--baseline", help="results JSON of an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="relative slowdown flagged as a regression")
+    args = parser.parse_args()
+    logging.getLogger("app").setLevel(logging.WARNING)
+
+    path = dataset_path(args.size, args.seed)
+    results = {
+        "meta": {
+            **_git_commit(),
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "rdkit": rdkit.__version__,
+            "numpy": np.__version__,
+            "sqlalchemy": sqlalchemy.__version__,
+            "database": "sqlite",
+            "cache": "fake-redis",
+            "cpu_workers": cpu_executor.workers,
+            "search_workers": SEARCH_WORKERS,
+        },
+        "dataset": {"size": parse_size(args.size), "seed": args.seed, "file": path.name},
+        "params": {"limit": args.limit, "repeat": args.repeat, "hit_repeat": args.hit_repeat},
+    }
+
+    create_all_sync()
+    cache = FakeCache()
+    app.dependency_overrides[get_cache] = lambda: cache
+    try:
+        with TestClient(app) as client:
+            print(f"ingest {path.name}", file=sys.stderr)
+            results["ingest"] = bench_ingest(client, path)
+            print("list stream", file=sys.stderr)
+            results["list_stream"] = bench_list_stream(client)
+            print("search", file=sys.stderr)
+            results["search"] = bench_search(client, cache, args.limit, args.repeat, args.hit_repeat, args.sql_screen)
+    finally:
+        shutil.rmtree(_DB_DIR, ignore_errors=True)
+
+    output = json.dumps(results, indent=2)
+    if args.out:
+        Path(args.out).write_text(output + "\n")
+    else:
+        print(output)
+    if args.baseline:
+        compare(results, json.loads(Path(args.baseline).read_text()), args.tolerance)
+
+
+if __name__ == "__main__":
+    main()
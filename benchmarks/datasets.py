@@ -0,0 +1,92 @@
+"""Seeded synthetic SMILES datasets for the benchmarks.
+
+Molecules are assembled from 1-3 ring systems joined by linkers, with optional ring
+substituents, a head and a tail. Every SMILES is valid and structurally unique (distinct
+canonical forms), so an ingest of ``n`` molecules creates ``n`` rows. The same seed and
+size always give the same file; generated files are kept under ``benchmarks/data/``.
+
+    PYTHONPATH=. python benchmarks/datasets.py --size 100k
+"""
+import argparse
+import random
+from pathlib import Path
+
+from rdkit import Chem, RDLogger
+
+RDLogger.DisableLog("rdApp.*")
+
+SIZES = {"10k": 10_000, "100k": 100_000, "1m": 1_000_000}
+DATA_DIR = Path(__file__).resolve().parent / "data"
+
+# "{}" takes a ring substituent; ring closure digits 1/2 are renumbered per ring system
+CORES = [
+    "c1cc{}ccc1", "c1cc{}ncc1", "c1nc{}ncc1", "C1CC{}CCC1", "C1CC{}NCC1", "C1COC{}CN1", "C1C{}C1",
+    "c1cc{}oc1", "c1cc{}sc1", "c1cc{}[nH]c1", "c1nc{}[nH]c1", "c1ccc2cc{}ccc2c1", "c1ccc2[nH]cc{}c2c1",
+]
+SUBSTITUENTS = ["", "", "", "(C)", "(F)", "(Cl)", "(Br)", "(O)", "(N)", "(OC)", "(C(F)(F)F)", "(C#N)",
+                "(C(=O)O)", "(N(C)C)", "(S(C)(=O)=O)"]
+LINKERS = ["", "C", "CC", "O", "N", "C(=O)", "C(=O)N", "NC(=O)", "S(=O)(=O)", "OCC", "C(C)", "CN", "CO"]
+HEADS = ["", "C", "CC(C)", "Cl", "F", "N", "O", "COC", "CCO", "N#C", "OC(=O)"]
+TAILS = ["", "C", "O", "N", "Cl", "F", "C(=O)O", "C#N", "OC", "CC", "C(=O)N", "S(=O)(=O)N"]
+
+
+def _ring(rng: random.Random, index: int) -> str:
+    digits = str.maketrans("12", f"{2 * index + 1}{2 * index + 2}")
+    return rng.choice(CORES).translate(digits).format(rng.choice(SUBSTITUENTS))
+
+
+def generate_smiles(n: int, seed: int = 0) -> list[str]:
+    """``n`` valid, structurally distinct SMILES; deterministic for a given ``seed``."""
+    rng = random.Random(seed)
+    seen = set()
+    out = []
+    while len(out) < n:
+        rings = rng.choices((1, 2, 3), weights=(3, 5, 2))[0]
+        parts = [rng.choice(HEADS), "C" * rng.randint(0, 3)]
+        for i in range(rings):
+            if i:
+                parts.append(rng.choice(LINKERS))
+            parts.append(_ring(rng, i))
+        parts.append(rng.choice(TAILS))
+        smiles = "".join(parts)
+        mol = Chem.MolFromSmiles(smiles)
+        if mol is None:
+            continue
+        canonical = Chem.MolToSmiles(mol)
+        if canonical in seen:
+            continue
+        seen.add(canonical)
+        out.append(smiles)
+    return out
+
+
+def parse_size(size: str) -> int:
+    return SIZES[size.lower()] if size.lower() in SIZES else int(size)
+
+
+def dataset_path(size: str, seed: int = 0) -> Path:
+    """Path of the ``.smi`` file for ``size`` (10k / 100k / 1m or a count), generating it on first use."""
+    n = parse_size(size)
+    path = DATA_DIR / f"synthetic-{n}-s{seed}.smi"
+    if not path.exists():
+        DATA_DIR.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(".tmp")
+        tmp.write_text("\n".join(generate_smiles(n, seed)) + "\n")
+        tmp.replace(path)
+    return path
+
+
+def load_dataset(size: str, seed: int = 0) -> list[str]:
+    return dataset_path(size, seed).read_text().split()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size", default="10k", help="10k, 100k, 1m or a molecule count")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    print(dataset_path(args.size, args.seed))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,37 +1,81 @@
+import json
+import secrets
 from typing import Optional, List
 from uuid import uuid4
 
 import redis.asyncio as redis
-from fastapi import APIRouter, Depends, HTTPException, Query, UploadFile, File
+from fastapi import APIRouter, BackgroundTasks, Depends, Header, HTTPException, Query, Request, Response, UploadFile, File
 from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from sqlalchemy import select
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from src.chemistry import validate_smiles, substructure_search
-from src.db import Molecule, get_db, db_session_scope
+from src.chemistry import canonicalize_smiles, molecule_columns, smiles_key
+from src.db import Molecule, SessionLocal, get_db, get_read_db, read_session_scope
+from src.executor import run_cpu
+from src.index import stage_remove, stage_upsert
+from src.ingest import ingest_records, parse_records, upload_chunks
 from src.schemas import (
+    BatchSearchRequest,
+    BatchSearchResponse,
+    BatchSearchResult,
     MoleculeCreate,
     MoleculeOut,
     MoleculeUpdate,
+    SimilarityHit,
+    SimilarityQuery,
+    SearchExplain,
+    SimilaritySearchResponse,
     SubstructureQueryParams,
     SubstructureSearchResponse,
     TaskRequest,
     TaskStatus,
 )
 from src.cache import get_cache
+from src.celery_app import celery_app
 from src.utils import (
+    _cached_batch_search,
+    _caught_up,
     _to_out,
-    _cache_get_json,
-    _cache_set_json,
-    _get_smiles_list,
-    _make_cache_key,
+    _cached_search,
+    _bump_committed,
+    _commit_and_bump,
+    _decode_cursor,
+    _encode_cursor,
+    _explain_search,
+    _search_cache_get,
+    _search_cache_key,
+    _search_cache_set,
+    _search_shard,
+    _search_substructure_db,
+    _shard_bounds,
+    _shard_progress,
+    _similarity_search,
     _is_eager_mode,
+    _iter_search_chunks,
     _get_molecule_by_id,
+    _get_task_meta,
+    _cancel_search,
+    _spool_upload,
+)
+from src.settings import ADMIN_TOKEN, SEARCH_TASK_SHARDS
+from src.tasks import (
+    ingest_file,
+    similarity_search_db,
+    start_sharded_search,
+    substructure_batch_search_db,
+    substructure_search_db,
 )
-from src.tasks import substructure_search_db
 
 router = APIRouter()
 
+
+def _require_admin(token: Optional[str]):
+    if not ADMIN_TOKEN or token is None or not secrets.compare_digest(token, ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Profiling requires a valid X-Admin-Token")
+
+
 molecules = APIRouter(prefix="/molecules", tags=["molecules"])
 
 
@@ -40,12 +84,18 @@ molecules = APIRouter(prefix="/molecules", tags=["molecules"])
     response_model=MoleculeOut,
     status_code=201,
     summary="Create a molecule",
-    description="Create a new molecule with SMILES notation. Each SMILES must be unique."
+    description="Create a new molecule with SMILES notation. SMILES are stored canonicalized; each structure must be unique."
 )
-async def create_molecule(payload: MoleculeCreate, db: AsyncSession = Depends(get_db)):
-    if not validate_smiles(payload.smiles):
+async def create_molecule(
+        payload: MoleculeCreate,
+        background_tasks: BackgroundTasks,
+        db: AsyncSession = Depends(get_db),
+        cache: redis.Redis = Depends(get_cache),
+):
+    columns = await run_cpu(molecule_columns, payload.smiles)
+    if columns is None:
         raise HTTPException(status_code=400, detail="Invalid SMILES string")
-    mol = Molecule(smiles=payload.smiles)
+    mol = Molecule(**columns)
     try:
         db.add(mol)
         await db.flush()
@@ -53,6 +103,28 @@ async def create_molecule(payload: MoleculeCreate, db: AsyncSession = Depends(ge
     except IntegrityError:
         await db.rollback()
         raise HTTPException(status_code=409, detail="Molecule with this SMILES already exists")
+    stage_upsert(db, mol)
+    await _commit_and_bump(db, cache, background_tasks)
+    return _to_out(mol)
+
+
+@molecules.get(
+    "/lookup",
+    response_model=MoleculeOut,
+    summary="Exact structure lookup",
+    description="Find the molecule with the same structure as the given SMILES (any valid spelling, e.g. OCC for CCO)."
+)
+async def lookup_molecule(
+        smiles: str = Query(..., min_length=1, max_length=4096, description="SMILES notation"),
+        db: AsyncSession = Depends(get_read_db),
+):
+    canonical = await run_cpu(canonicalize_smiles, smiles)
+    if canonical is None:
+        raise HTTPException(status_code=400, detail="Invalid SMILES string")
+    res = await db.execute(select(Molecule).where(Molecule.smiles_key == smiles_key(canonical)))
+    mol = res.scalar_one_or_none()
+    if mol is None:
+        raise HTTPException(status_code=404, detail="Molecule not found")
     return _to_out(mol)
 
 
@@ -62,7 +134,7 @@ async def create_molecule(payload: MoleculeCreate, db: AsyncSession = Depends(ge
     summary="Get a molecule",
     description="Retrieve a molecule by its UUID."
 )
-async def get_molecule(id: str, db: AsyncSession = Depends(get_db)):
+async def get_molecule(id: str, db: AsyncSession = Depends(get_read_db)):
     mol = await _get_molecule_by_id(db, id)
     return _to_out(mol)
 
@@ -73,18 +145,30 @@ async def get_molecule(id: str, db: AsyncSession = Depends(get_db)):
     summary="Update a molecule",
     description="Update a molecule's SMILES notation by UUID."
 )
-async def update_molecule(id: str, payload: MoleculeUpdate, db: AsyncSession = Depends(get_db)) -> MoleculeOut:
+async def update_molecule(
+        id: str,
+        payload: MoleculeUpdate,
+        background_tasks: BackgroundTasks,
+        db: AsyncSession = Depends(get_db),
+        cache: redis.Redis = Depends(get_cache),
+) -> MoleculeOut:
     mol = await _get_molecule_by_id(db, id)
     if payload.smiles is not None:
-        if not validate_smiles(payload.smiles):
+        columns = await run_cpu(molecule_columns, payload.smiles)
+        if columns is None:
             raise HTTPException(status_code=400, detail="Invalid SMILES string")
-        mol.smiles = payload.smiles
+        if columns["smiles"] != mol.smiles:
+            stage_remove(db, mol.id, mol.smiles)
+        for name, value in columns.items():
+            setattr(mol, name, value)
     try:
         await db.flush()
         await db.refresh(mol)
     except IntegrityError:
         await db.rollback()
         raise HTTPException(status_code=409, detail="Molecule with this SMILES already exists")
+    stage_upsert(db, mol)
+    await _commit_and_bump(db, cache, background_tasks)
     return _to_out(mol)
 
 
@@ -94,42 +178,52 @@ async def update_molecule(id: str, payload: MoleculeUpdate, db: AsyncSession = D
     summary="Delete a molecule",
     description="Permanently delete a molecule by UUID."
 )
-async def delete_molecule(id: str, db: AsyncSession = Depends(get_db)):
+async def delete_molecule(
+        id: str,
+        background_tasks: BackgroundTasks,
+        db: AsyncSession = Depends(get_db),
+        cache: redis.Redis = Depends(get_cache),
+):
     mol = await _get_molecule_by_id(db, id)
     await db.delete(mol)
     await db.flush()
+    stage_remove(db, mol.id, mol.smiles)
+    await _commit_and_bump(db, cache, background_tasks)
 
 
 @molecules.get(
     "/",
     response_model=List[MoleculeOut],
     summary="List molecules",
-    description="List molecules with pagination. Use stream=true for NDJSON format (not compatible with Swagger UI)."
+    description="List molecules ordered by id with keyset pagination: pass the X-Next-Cursor response header back as "
+                "cursor to get the next page. Use stream=true for NDJSON format (not compatible with Swagger UI); "
+                "the stream starts after cursor and runs to the end of the table."
 )
 async def list_molecules(
+        response: Response,
         limit: int = Query(100, ge=1, le=10_000, description="Max molecules to return"),
+        cursor: Optional[str] = Query(None, description="Opaque cursor from a previous page's X-Next-Cursor header"),
         stream: bool = Query(False,
                              description="Enable NDJSON streaming (returns newline-delimited JSON, not parseable by Swagger UI)"),
-        db: AsyncSession = Depends(get_db)
+        db: AsyncSession = Depends(get_read_db)
 ):
-    from sqlalchemy import select
-    stmt = select(Molecule).limit(limit)
+    stmt = select(Molecule.id, Molecule.smiles).order_by(Molecule.id)
+    if cursor is not None:
+        stmt = stmt.where(Molecule.id > _decode_cursor(cursor))
 
     if not stream:
-        res = await db.execute(stmt)
-        rows = res.scalars().all()
+        res = await db.execute(stmt.limit(limit))
+        rows = res.all()
+        if len(rows) == limit:
+            response.headers["X-Next-Cursor"] = _encode_cursor(rows[-1].id)
         return [_to_out(m) for m in rows]
 
-    async def _agen(batch_size: int = 100):
-        offset = 0
-        while True:
-            res = await db.execute(stmt.offset(offset).limit(batch_size))
-            rows = res.scalars().all()
-            if not rows:
-                break
-            for m in rows:
-                yield _to_out(m).model_dump_json().encode() + b"\n"
-            offset += batch_size
+    async def _agen(batch_size: int = 1000):
+        # one server-side cursor for the whole stream instead of repeated OFFSET queries
+        async with read_session_scope() as session:
+            result = await session.stream(stmt.execution_options(yield_per=batch_size))
+            async for rows in result.partitions():
+                yield b"".join(_to_out(m).model_dump_json().encode() + b"\n" for m in rows)
 
     return StreamingResponse(_agen(), media_type="application/x-ndjson")
 
@@ -137,28 +231,30 @@ async def list_molecules(
 @molecules.post(
     "/upload/",
     summary="Bulk upload molecules",
-    description="Upload multiple molecules from a text file. One SMILES per line. Invalid/duplicate entries are skipped."
+    description="Upload molecules from a SMILES (one per line), CSV/TSV (SMILES column picked from the header) or SDF "
+                "file, optionally gzip-compressed. The file is parsed as a stream and committed in batches, so a failed "
+                "upload keeps the batches before the error. Returns counts of created, duplicate and invalid entries, "
+                "or a task id when background=true."
 )
 async def upload_molecules(
-        file: UploadFile = File(..., description="Text file with SMILES (one per line)"),
-        db: AsyncSession = Depends(get_db)
+        file: UploadFile = File(..., description="SMILES, CSV/TSV or SDF file, plain or gzipped"),
+        format: str = Query("auto", pattern="^(auto|smi|csv|tsv|sdf)$", description="File format (auto-detected by default)"),
+        background: bool = Query(False, description="Spool the file and ingest it in a Celery task that reports progress"),
+        cache: redis.Redis = Depends(get_cache),
 ):
-    content = (await file.read()).decode()
-    created = 0
-    for line in content.splitlines():
-        line = line.strip()
-        if not line or line.lower().startswith("smiles"):
-            continue
-        smiles = line
-        if not validate_smiles(smiles):
-            continue
-        try:
-            db.add(Molecule(smiles=smiles))
-            await db.flush()
-            created += 1
-        except Exception:
-            await db.rollback()
-    return {"created": created}
+    if background and not _is_eager_mode():
+        path = await _spool_upload(file)
+        res = ingest_file.delay(path, file.filename, format)
+        return TaskStatus(task_id=res.id, status=res.status, result=None)
+
+    kind, records = await parse_records(upload_chunks(file), file.filename, format)
+    # ingest commits batch by batch, so it gets a plain session rather than one scoped to a single transaction
+    async with SessionLocal() as db:
+        # each committed batch retires cached searches at once, not when the whole file is done
+        stats = await ingest_records(db, records, kind, on_commit=lambda: _bump_committed(db, cache))
+    if background:
+        return TaskStatus(task_id=str(uuid4()), status="SUCCESS", result=stats)
+    return stats
 
 
 search_router = APIRouter(prefix="", tags=["search"])
@@ -171,55 +267,125 @@ search_router = APIRouter(prefix="", tags=["search"])
     description="Find molecules containing a SMILES/SMARTS pattern. Results are cached."
 )
 async def substructure_search_endpoint(
-        substructure: str = Query(..., min_length=1, description="SMILES/SMARTS pattern"),
+        substructure: str = Query(..., min_length=1, max_length=4096, description="SMILES/SMARTS pattern"),
         limit: Optional[int] = Query(None, ge=1, le=10_000, description="Maximum number of results to return"),
-        db: AsyncSession = Depends(get_db),
+        db: AsyncSession = Depends(get_read_db),
         cache: redis.Redis = Depends(get_cache),
 ):
-    key = _make_cache_key(substructure, limit)
-    cached = await _cache_get_json(cache, key)
-    if cached is not None:
-        return cached
-    smiles_list = await _get_smiles_list(db)
-    hits = substructure_search(smiles_list, substructure, limit)
-    if limit is not None:
-        hits = hits[:limit]
-    await _cache_set_json(cache, key, hits)
+    hits, _ = await _cached_search(db, cache, substructure, limit)
     return hits
 
 
+@search_router.get(
+    "/substructure-search/stream",
+    summary="Search by substructure (streaming)",
+    description="Stream matching SMILES as NDJSON ({\"smiles\": ...} per line) while the scan runs. "
+                "The scan stops at limit or when the client disconnects; complete results are cached."
+)
+async def substructure_search_stream(
+        request: Request,
+        substructure: str = Query(..., min_length=1, max_length=4096, description="SMILES/SMARTS pattern"),
+        limit: Optional[int] = Query(None, ge=1, le=10_000, description="Maximum number of results to return"),
+        cache: redis.Redis = Depends(get_cache),
+):
+    key = await _search_cache_key(cache, substructure)
+    cached = await _search_cache_get(cache, key, limit)
+
+    def _line(smiles: str) -> bytes:
+        return json.dumps({"smiles": smiles}).encode() + b"\n"
+
+    async def _agen():
+        if cached is not None:
+            yield b"".join(_line(smiles) for smiles in cached)
+            return
+        hits = []
+        async with read_session_scope() as db:
+            cacheable = key is not None and await _caught_up(db, cache)
+            async for chunk in _iter_search_chunks(db, substructure, limit):
+                if chunk:
+                    hits.extend(chunk)
+                    yield b"".join(_line(smiles) for smiles in chunk)
+                if await request.is_disconnected():
+                    return
+        if cacheable:
+            await _search_cache_set(cache, key, hits, limit, substructure)
+
+    return StreamingResponse(_agen(), media_type="application/x-ndjson")
+
+
 @search_router.post(
     "/substructure-search",
     response_model=SubstructureSearchResponse,
     summary="Search by substructure (POST)",
-    description="Find molecules containing a pattern. Returns results with metadata (count, cached status)."
+    description="Find molecules containing a pattern, optionally within descriptor windows (mw, clogp, hbd, hba, "
+                "tpsa, heavy_atoms; *_min / *_max). Returns results with metadata (count, cached status). "
+                "explain=true adds how the search ran; profile=true (X-Admin-Token) adds a cProfile report."
 )
 async def substructure_search_post(
         payload: SubstructureQueryParams,
-        db: AsyncSession = Depends(get_db),
+        db: AsyncSession = Depends(get_read_db),
         cache: redis.Redis = Depends(get_cache),
+        x_admin_token: Optional[str] = Header(None),
 ):
-    key = _make_cache_key(payload.substructure, payload.limit)
-    cached_hits = await _cache_get_json(cache, key)
-    if cached_hits is not None:
-        return SubstructureSearchResponse(
-            substructure=payload.substructure,
-            limit=payload.limit,
-            count=len(cached_hits),
-            hits=cached_hits,
-            cached=True,
+    explain = None
+    if payload.explain or payload.profile:
+        if payload.profile:
+            _require_admin(x_admin_token)
+        hits, report = await _explain_search(
+            db, payload.substructure, payload.limit, payload.property_ranges(), payload.profile
         )
-    smiles_list = await _get_smiles_list(db)
-    hits = substructure_search(smiles_list, payload.substructure, payload.limit)
-    if payload.limit is not None:
-        hits = hits[:payload.limit]
-    await _cache_set_json(cache, key, hits)
+        cached, explain = False, SearchExplain(**report)
+    else:
+        hits, cached = await _cached_search(db, cache, payload.substructure, payload.limit, payload.property_ranges())
     return SubstructureSearchResponse(
         substructure=payload.substructure,
         limit=payload.limit,
         count=len(hits),
         hits=hits,
-        cached=False,
+        cached=cached,
+        explain=explain,
+    )
+
+
+@search_router.post(
+    "/substructure-search/batch",
+    response_model=BatchSearchResponse,
+    summary="Search many patterns at once",
+    description="Find molecules containing each of up to 1000 patterns in one pass over the library. "
+                "Results are per pattern, in request order, and cached like single searches."
+)
+async def substructure_batch_search(
+        payload: BatchSearchRequest,
+        db: AsyncSession = Depends(get_read_db),
+        cache: redis.Redis = Depends(get_cache),
+):
+    results = await _cached_batch_search(db, cache, payload.substructures, payload.limit)
+    return BatchSearchResponse(
+        limit=payload.limit,
+        results=[
+            BatchSearchResult(substructure=substructure, count=len(hits), hits=hits, cached=cached)
+            for substructure, (hits, cached) in zip(payload.substructures, results)
+        ],
+    )
+
+
+@search_router.post(
+    "/similarity-search",
+    response_model=SimilaritySearchResponse,
+    summary="Search by similarity",
+    description="Top-k molecules by Tanimoto similarity of Morgan fingerprints (radius 2, 2048 bits) to a query "
+                "SMILES, keeping those at or above threshold. Best first."
+)
+async def similarity_search_post(payload: SimilarityQuery, db: AsyncSession = Depends(get_read_db)):
+    hits = await _similarity_search(db, payload.smiles, payload.threshold, payload.k)
+    if hits is None:
+        raise HTTPException(status_code=400, detail="Invalid SMILES string")
+    return SimilaritySearchResponse(
+        smiles=payload.smiles,
+        threshold=payload.threshold,
+        k=payload.k,
+        count=len(hits),
+        hits=[SimilarityHit(smiles=smiles, similarity=score) for smiles, score in hits],
     )
 
 
@@ -230,51 +396,147 @@ tasks_router = APIRouter(prefix="/tasks", tags=["tasks"])
     "/substructure",
     response_model=TaskStatus,
     summary="Start async search task",
-    description="Submit a substructure search as background task. Use for large datasets. Returns task_id."
+    description="Submit a substructure search as background task. Use for large datasets. Returns task_id. "
+                "With explain / profile the result is {hits, explain}."
 )
-async def start_substructure_task(payload: TaskRequest):
+async def start_substructure_task(
+        payload: TaskRequest,
+        cache: redis.Redis = Depends(get_cache),
+        x_admin_token: Optional[str] = Header(None),
+):
+    shards = payload.shards or SEARCH_TASK_SHARDS
+    ranges = payload.property_ranges()
+    if payload.profile:
+        _require_admin(x_admin_token)
+    if payload.explain or payload.profile:
+        # one task timing the whole scan; explain does not shard
+        if _is_eager_mode():
+            async with read_session_scope() as db:
+                hits, report = await _explain_search(db, payload.substructure, payload.limit, ranges, payload.profile)
+            return TaskStatus(task_id=str(uuid4()), status="SUCCESS", result={"hits": hits, "explain": report})
+        res = substructure_search_db.delay(payload.substructure, payload.limit, ranges, True, payload.profile)
+        return TaskStatus(task_id=res.id, status=res.status, result=None)
     if _is_eager_mode():
+        task_id = str(uuid4())
+
         async def _run_inline():
-            async with db_session_scope() as db:
-                smiles_list = await _get_smiles_list(db)
-            hits = substructure_search(smiles_list, payload.substructure, payload.limit)
-            if payload.limit is not None:
-                hits = hits[:payload.limit]
-            return hits
+            async with read_session_scope() as db:
+                if shards == 1:
+                    return await _search_substructure_db(db, payload.substructure, payload.limit, ranges)
+                for shard, id_range in enumerate(_shard_bounds(shards)):
+                    await _search_shard(
+                        db, cache, payload.substructure, id_range, payload.limit, task_id, shard, ranges=ranges
+                    )
 
         try:
             await _run_inline()
         except Exception:
             pass
-        return TaskStatus(task_id=str(uuid4()), status="SUCCESS", result=None)
+        return TaskStatus(task_id=task_id, status="SUCCESS", result=None)
 
-    res = substructure_search_db.delay(payload.substructure, payload.limit)
+    if shards > 1:
+        res = start_sharded_search(payload.substructure, payload.limit, shards, ranges)
+    else:
+        res = substructure_search_db.delay(payload.substructure, payload.limit, ranges)
     task_id = getattr(res, "id", str(uuid4()))
     status = getattr(res, "status", "PENDING")
     return TaskStatus(task_id=task_id, status=status, result=None)
 
 
+@tasks_router.post(
+    "/substructure/batch",
+    response_model=TaskStatus,
+    summary="Start async batch search task",
+    description="Submit a batch substructure search as background task. "
+                "Result is a list of {substructure, hits} in request order."
+)
+async def start_batch_search_task(payload: BatchSearchRequest, cache: redis.Redis = Depends(get_cache)):
+    if _is_eager_mode():
+        async def _run_inline():
+            async with read_session_scope() as db:
+                return await _cached_batch_search(db, cache, payload.substructures, payload.limit)
+
+        try:
+            await _run_inline()
+        except Exception:
+            pass
+        return TaskStatus(task_id=str(uuid4()), status="SUCCESS", result=None)
+
+    res = substructure_batch_search_db.delay(payload.substructures, payload.limit)
+    return TaskStatus(task_id=res.id, status=res.status, result=None)
+
+
+@tasks_router.post(
+    "/similarity",
+    response_model=TaskStatus,
+    summary="Start async similarity search task",
+    description="Submit a similarity search as background task. Result is a list of {smiles, similarity}."
+)
+async def start_similarity_task(payload: SimilarityQuery):
+    if _is_eager_mode():
+        async def _run_inline():
+            async with read_session_scope() as db:
+                return await _similarity_search(db, payload.smiles, payload.threshold, payload.k)
+
+        try:
+            await _run_inline()
+        except Exception:
+            pass
+        return TaskStatus(task_id=str(uuid4()), status="SUCCESS", result=None)
+
+    res = similarity_search_db.delay(payload.smiles, payload.threshold, payload.k)
+    return TaskStatus(task_id=res.id, status=res.status, result=None)
+
+
 @tasks_router.get(
     "/{task_id}",
     response_model=TaskStatus,
     summary="Get task status",
-    description="Check async task status. Poll until status is SUCCESS or FAILURE. Result available when SUCCESS."
+    description="Check async task status. Poll until status is SUCCESS, FAILURE or REVOKED. Result available when "
+                "SUCCESS; while a search is in PROGRESS, progress counts and the hits found so far are reported."
 )
-async def get_task_status(task_id: str):
-    if _is_eager_mode():
-        return TaskStatus(task_id=task_id, status="SUCCESS", result=None)
-    try:
-        from celery.result import AsyncResult
-        ar = AsyncResult(task_id)
-        result = None
-        if ar.successful():
-            try:
-                result = ar.get(timeout=0)
-            except Exception:
-                result = None
-        return TaskStatus(task_id=task_id, status=ar.status, result=result)
-    except Exception:
-        return TaskStatus(task_id=task_id, status="SUCCESS", result=None)
+async def get_task_status(task_id: str, cache: redis.Redis = Depends(get_cache)):
+    meta = await _get_task_meta(cache, task_id)
+    shards = await _shard_progress(cache, task_id)
+    if meta is not None:
+        status = meta.get("status", "PENDING")
+    elif shards is not None:
+        status = "PROGRESS"
+    else:
+        # eager mode runs tasks inline without storing results
+        status = "SUCCESS" if _is_eager_mode() else "PENDING"
+
+    result = progress = partial = None
+    info = meta.get("result") if meta is not None else None
+    if status == "SUCCESS":
+        result = info
+    elif isinstance(info, dict):
+        progress = dict(info)
+        partial = progress.pop("partial", None)
+    if shards is not None:
+        progress = {
+            "scanned": sum(shard["scanned"] for shard in shards),
+            "hits": sum(shard["hits"] for shard in shards),
+            "shards": [{k: v for k, v in shard.items() if k != "partial"} for shard in shards],
+        }
+        if status != "SUCCESS":
+            partial = [smiles for shard in shards for smiles in shard.get("partial", [])]
+    return TaskStatus(task_id=task_id, status=status, result=result, progress=progress, partial=partial)
+
+
+@tasks_router.delete(
+    "/{task_id}",
+    response_model=TaskStatus,
+    status_code=202,
+    summary="Cancel a task",
+    description="Revoke a queued task and stop a running search (every shard of a sharded one) at its next chunk."
+)
+async def cancel_task(task_id: str, cache: redis.Redis = Depends(get_cache)):
+    await _cancel_search(cache, task_id)
+    if not _is_eager_mode():
+        # no terminate: killing the process could cut an ingest between batches; searches stop cooperatively
+        await run_in_threadpool(celery_app.control.revoke, task_id)
+    return TaskStatus(task_id=task_id, status="REVOKED", result=None)
 
 
 router.include_router(molecules)
@@ -1,14 +1,30 @@
+import base64
+import json
 import logging
-from typing import Optional
+import time
+import zlib
+from collections import OrderedDict
+from typing import Any, Optional
 
 import redis.asyncio as redis
 
-from .settings import REDIS_URL
+from .metrics import CACHE_LOOKUPS
+from .settings import (
+    CACHE_COMPRESS_MIN_BYTES,
+    CACHE_GENERATION_TTL_SECONDS,
+    LOCAL_CACHE_MAX_BYTES,
+    LOCAL_CACHE_MAX_ENTRIES,
+    LOCAL_CACHE_TTL_SECONDS,
+    REDIS_URL,
+)
 
 logger = logging.getLogger("app")
 
 _cache: Optional[redis.Redis] = None
 
+# prefix of zlib-compressed payloads; anything else is read as plain JSON
+COMPRESSED_PREFIX = "z1:"
+
 
 async def get_cache():
     global _cache
@@ -22,3 +38,183 @@ async def get_cache():
             _cache = None
             raise
     return _cache
+
+
+def encode_payload(value, min_bytes: int = CACHE_COMPRESS_MIN_BYTES) -> tuple[str, int]:
+    """Serialize ``value`` for Redis; returns ``(payload, json_size)``.
+
+    Payloads of ``min_bytes`` or more are zlib-compressed. The client decodes responses
+    as text, so the compressed bytes are base64-wrapped (SMILES lists still shrink ~4x).
+    """
+    text = json.dumps(value, separators=(",", ":"))
+    if len(text) < min_bytes:
+        return text, len(text)
+    packed = base64.b64encode(zlib.compress(text.encode(), 6)).decode("ascii")
+    return COMPRESSED_PREFIX + packed, len(text)
+
+
+def decode_payload(payload: str) -> tuple[Any, int]:
+    """Inverse of :func:`encode_payload`; raises ``ValueError`` on malformed input."""
+    if payload.startswith(COMPRESSED_PREFIX):
+        try:
+            text = zlib.decompress(base64.b64decode(payload[len(COMPRESSED_PREFIX):])).decode()
+        except (zlib.error, UnicodeDecodeError, ValueError) as e:
+            raise ValueError(f"Corrupt compressed cache payload: {e}") from e
+    else:
+        text = payload
+    return json.loads(text), len(text)
+
+
+class TierCounters:
+    def __init__(self, tier: str):
+        self.tier = tier
+        self.hits = 0
+        self.misses = 0
+
+    def record(self, hit: bool):
+        if hit:
+            self.hits += 1
+        else:
+            self.misses += 1
+        CACHE_LOOKUPS.labels(self.tier, "hit" if hit else "miss").inc()
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses}
+
+
+class LocalCache(TierCounters):
+    """In-process LRU with a per-entry TTL, bounded by entry count and approximate size in bytes.
+
+    Values are kept decoded, so a hit costs no ``json.loads``. Keys embed the dataset generation,
+    which is read through :data:`generation_memo`, so most hits need no Redis round trip either.
+    Only touched from the event loop thread, so it needs no locking.
+    """
+
+    def __init__(
+            self,
+            max_bytes: int = LOCAL_CACHE_MAX_BYTES,
+            max_entries: int = LOCAL_CACHE_MAX_ENTRIES,
+            ttl: float = LOCAL_CACHE_TTL_SECONDS,
+    ):
+        super().__init__("local")
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.size = 0
+        self.evictions = 0
+        self._entries: OrderedDict[str, tuple[float, int, Any]] = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0 and self.max_entries > 0 and self.ttl > 0
+
+    def get(self, key: str):
+        item = self._entries.get(key)
+        if item is not None and item[0] < time.monotonic():
+            self._discard(key)
+            item = None
+        self.record(item is not None)
+        if item is None:
+            return None
+        self._entries.move_to_end(key)
+        return item[2]
+
+    def set(self, key: str, value, size: int):
+        if not self.enabled or size > self.max_bytes:
+            return
+        self._discard(key)
+        self._entries[key] = (time.monotonic() + self.ttl, size, value)
+        self.size += size
+        while self.size > self.max_bytes or len(self._entries) > self.max_entries:
+            oldest = next(iter(self._entries))
+            self._discard(oldest)
+            self.evictions += 1
+
+    def _discard(self, key: str):
+        item = self._entries.pop(key, None)
+        if item is not None:
+            self.size -= item[1]
+
+    def clear(self):
+        self._entries.clear()
+        self.size = 0
+
+    def stats(self):
+        return {
+            **super().stats(),
+            "evictions": self.evictions,
+            "entries": len(self._entries),
+            "bytes": self.size,
+            "max_bytes": self.max_bytes,
+        }
+
+
+class GenerationMemo:
+    """The dataset generation and journal seq last read from (or bumped in) Redis, trusted for ``ttl`` seconds.
+
+    Writes in this process update it at once; other replicas' writes show up within ``ttl``.
+    """
+
+    def __init__(self, ttl: float = CACHE_GENERATION_TTL_SECONDS):
+        self.ttl = ttl
+        self._value: Optional[tuple[int, int]] = None
+        self._expires = 0.0
+
+    def get(self) -> Optional[tuple[int, int]]:
+        """``(generation, seq)``, or None once expired."""
+        if self._value is None or self._expires < time.monotonic():
+            return None
+        return self._value
+
+    def set(self, generation: int, seq: int):
+        # a slow read must not roll back a newer value
+        if self._value is not None and generation < self._value[0] and self._expires >= time.monotonic():
+            return
+        self._value = (generation, seq)
+        self._expires = time.monotonic() + self.ttl
+
+    def clear(self):
+        self._value = None
+        self._expires = 0.0
+
+
+class QueryMemo:
+    """Bounded LRU of ``normalize_query`` results, so repeated queries need no CPU pool hop.
+
+    Only touched from the event loop thread, so it needs no locking.
+    """
+
+    MISSING = object()
+
+    def __init__(self, max_entries: int = 4096):
+        self.max_entries = max_entries
+        self._entries: OrderedDict = OrderedDict()
+
+    def get(self, query: str):
+        """The normalized query, None if it does not parse, or :attr:`MISSING` if never seen."""
+        if query not in self._entries:
+            return self.MISSING
+        self._entries.move_to_end(query)
+        return self._entries[query]
+
+    def set(self, query: str, normalized: Optional[str]):
+        self._entries[query] = normalized
+        self._entries.move_to_end(query)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+
+
+local_cache = LocalCache()
+generation_memo = GenerationMemo()
+query_memo = QueryMemo()
+redis_counters = TierCounters("redis")
+
+
+def cache_stats():
+    return {"local": local_cache.stats(), "redis": redis_counters.stats()}
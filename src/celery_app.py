@@ -1,7 +1,11 @@
+import logging
 import os
+import time
 from celery import Celery
+from celery.signals import task_postrun, task_prerun, worker_process_init, worker_process_shutdown
 
-from src.settings import RABBITMQ_URL, REDIS_URL
+from src.metrics import TASK_DURATION
+from src.settings import RABBITMQ_URL, REDIS_URL, WORKER_INDEX
 
 celery_app = Celery(__name__, broker=RABBITMQ_URL, backend=REDIS_URL)
 
@@ -12,3 +16,41 @@ if os.getenv("CELERY_TASK_ALWAYS_EAGER") == "1":
     celery_app.conf.result_backend = "cache+memory://"
 
 from . import tasks  # noqa: F401, E402
+
+
+@worker_process_init.connect
+def _init_worker_process(**_kwargs):
+    from src.db import engine, read_engine
+
+    # connections inherited from the parent must not be shared with it across the fork
+    engine.sync_engine.dispose(close=False)
+    if read_engine is not engine:
+        read_engine.sync_engine.dispose(close=False)
+    if not WORKER_INDEX:
+        return
+    try:
+        tasks.warm_worker_index()
+    except Exception as e:
+        logging.getLogger("app").warning("Failed to build the worker search index, scanning the DB instead: %s", e)
+
+
+@worker_process_shutdown.connect
+def _shutdown_worker_process(**_kwargs):
+    from src.parallel import shutdown_search_engine
+
+    shutdown_search_engine()
+
+
+_task_started: dict[str, float] = {}
+
+
+@task_prerun.connect
+def _task_started_at(task_id=None, **_kwargs):
+    _task_started[task_id] = time.perf_counter()
+
+
+@task_postrun.connect
+def _observe_task_duration(task_id=None, task=None, state=None, **_kwargs):
+    start = _task_started.pop(task_id, None)
+    if start is not None and task is not None:
+        TASK_DURATION.labels(task.name, state or "UNKNOWN").observe(time.perf_counter() - start)
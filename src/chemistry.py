@@ -1,6 +1,20 @@
+import hashlib
+import heapq
+import time
+from itertools import islice
+
 from rdkit import Chem
-from rdkit.Chem import DataStructs
-from typing import Optional
+from rdkit.Chem import AllChem, Crippen, DataStructs, Descriptors, rdMolDescriptors
+from typing import Iterable, Optional
+
+from src.metrics import ScanTimer
+
+FP_SIZE = 2048
+# similarity search: Morgan (ECFP4-like) bit vectors
+SIM_FP_SIZE = 2048
+MORGAN_RADIUS = 2
+# precomputed property columns, filterable as ranges in searches
+DESCRIPTORS = ("mw", "clogp", "hbd", "hba", "tpsa", "heavy_atoms")
 
 
 def validate_smiles(smiles: str):
@@ -13,47 +27,317 @@ def validate_smiles(smiles: str):
         return False
 
 
-def substructure_search(molecules: list[str], substructure: str, limit: Optional[int] = None):
-    if not substructure:
-        return []
+def fingerprint_to_bytes(fp) -> bytes:
+    """Pack an RDKit bit vector into bytes, bit ``i`` stored at byte ``i // 8``, bit ``i % 8``."""
+    value = 0
+    for bit in fp.GetOnBits():
+        value |= 1 << bit
+    return value.to_bytes(fp.GetNumBits() // 8, "little")
 
-    return _substructure_search_rdkit(molecules, substructure, limit)
 
+def pattern_fingerprint(mol):
+    """RDKit pattern fingerprint of a molecule or query; the bit vector the screen is built on.
+
+    Pattern fingerprints are designed for substructure screening: a query only sets bits that
+    every molecule containing it also sets, including for generic SMARTS atoms and bonds.
+    """
+    return Chem.PatternFingerprint(mol, fpSize=FP_SIZE)
+
+
+def mol_fingerprint(mol) -> Optional[bytes]:
+    """Packed screening fingerprint of a molecule, or None if it cannot be computed."""
+    if mol is None:
+        return None
+    try:
+        return fingerprint_to_bytes(pattern_fingerprint(mol))
+    except Exception:
+        return None
+
+
+def smiles_fingerprint(smiles: str) -> Optional[bytes]:
+    try:
+        return mol_fingerprint(Chem.MolFromSmiles(smiles))
+    except Exception:
+        return None
+
+
+def similarity_fingerprint(mol) -> Optional[bytes]:
+    """Packed Morgan fingerprint used for Tanimoto similarity, or None if it cannot be computed."""
+    if mol is None:
+        return None
+    try:
+        return fingerprint_to_bytes(AllChem.GetMorganFingerprintAsBitVect(mol, MORGAN_RADIUS, nBits=SIM_FP_SIZE))
+    except Exception:
+        return None
+
+
+def smiles_similarity_fingerprint(smiles: str) -> Optional[bytes]:
+    try:
+        return similarity_fingerprint(Chem.MolFromSmiles(smiles))
+    except Exception:
+        return None
+
+
+def mol_descriptors(mol) -> dict:
+    """Values of the :data:`DESCRIPTORS` columns for a molecule (all None if they cannot be computed)."""
+    try:
+        return {
+            "mw": Descriptors.MolWt(mol),
+            "clogp": Crippen.MolLogP(mol),
+            "hbd": rdMolDescriptors.CalcNumHBD(mol),
+            "hba": rdMolDescriptors.CalcNumHBA(mol),
+            "tpsa": rdMolDescriptors.CalcTPSA(mol),
+            "heavy_atoms": mol.GetNumHeavyAtoms(),
+        }
+    except Exception:
+        return dict.fromkeys(DESCRIPTORS)
+
+
+def smiles_descriptors(smiles: str) -> dict:
+    try:
+        mol = Chem.MolFromSmiles(smiles)
+    except Exception:
+        mol = None
+    return mol_descriptors(mol) if mol is not None else dict.fromkeys(DESCRIPTORS)
+
+
+def smiles_key(canonical: str) -> str:
+    """Fixed-width (32 hex chars) hash of a canonical SMILES; carries the uniqueness constraint."""
+    return hashlib.blake2b(canonical.encode(), digest_size=16).hexdigest()
+
+
+def canonicalize_smiles(smiles: str) -> Optional[str]:
+    if not smiles or not isinstance(smiles, str):
+        return None
+    try:
+        mol = Chem.MolFromSmiles(smiles)
+    except Exception:
+        return None
+    if mol is None:
+        return None
+    return Chem.MolToSmiles(mol)
+
+
+def molblock_to_smiles(molblock: str) -> Optional[str]:
+    try:
+        mol = Chem.MolFromMolBlock(molblock)
+    except Exception:
+        return None
+    if mol is None:
+        return None
+    return Chem.MolToSmiles(mol)
+
+
+def molecule_columns(smiles: str) -> Optional[dict]:
+    """Derived column values stored alongside a molecule, or None if the SMILES is invalid."""
+    if not smiles or not isinstance(smiles, str):
+        return None
+    try:
+        mol = Chem.MolFromSmiles(smiles)
+    except Exception:
+        return None
+    if mol is None:
+        return None
+    canonical = Chem.MolToSmiles(mol)
+    return {
+        "smiles": canonical,
+        "smiles_key": smiles_key(canonical),
+        "fingerprint": mol_fingerprint(mol),
+        "mol_pkl": mol.ToBinary(),
+        "morgan_fp": similarity_fingerprint(mol),
+        **mol_descriptors(mol),
+    }
+
+
+def mol_from_row(smiles: str, mol_pkl: Optional[bytes] = None):
+    """Rebuild a molecule from its stored RDKit binary, falling back to parsing the SMILES."""
+    if mol_pkl:
+        try:
+            return Chem.Mol(mol_pkl)
+        except Exception:
+            pass
+    try:
+        return Chem.MolFromSmiles(smiles)
+    except Exception:
+        return None
+
+
+def compile_pattern(substructure: str):
+    """Parse a SMARTS/SMILES query and compute its screening fingerprint.
+
+    Returns ``(pattern, pattern_fp)``; ``pattern`` is None when the query cannot be parsed
+    and ``pattern_fp`` is None when no usable screen can be derived from it.
+    """
+    if not substructure:
+        return None, None
+    # whitespace is never meaningful in a query; normalize_query drops it too
+    substructure = "".join(substructure.split())
 
-def _substructure_search_rdkit(molecules: list[str], substructure: str, limit: Optional[int] = None):
     pattern = Chem.MolFromSmarts(substructure)
     is_smarts = pattern is not None
     if not pattern:
         pattern = Chem.MolFromSmiles(substructure)
     if not pattern:
-        return []
+        return None, None
 
     pattern_fp = None
     try:
         if is_smarts:
-            try:
-                Chem.SanitizeMol(pattern)
-                pattern_smiles = Chem.MolToSmiles(pattern)
-                pattern_for_fp = Chem.MolFromSmiles(pattern_smiles)
-            except Exception:
-                pattern_for_fp = pattern
+            # query mols are not sanitized; ring membership is needed for ring-bond bits
+            pattern.UpdatePropertyCache(strict=False)
+            Chem.FastFindRings(pattern)
+        pattern_fp = pattern_fingerprint(pattern)
+    except Exception:
+        pattern_fp = None
+
+    return pattern, pattern_fp
+
+
+def query_kind(substructure: str) -> Optional[str]:
+    """``smarts`` or ``smiles``: how :func:`compile_pattern` reads the query (None if it does not parse)."""
+    query = "".join((substructure or "").split())
+    if not query:
+        return None
+    if Chem.MolFromSmarts(query) is not None:
+        return "smarts"
+    return "smiles" if Chem.MolFromSmiles(query) is not None else None
+
+
+def normalize_query(substructure: str) -> Optional[str]:
+    """Stable cache identity for a query, or None if it does not parse.
+
+    Whitespace is dropped and query atoms are renumbered by canonical rank before writing
+    SMARTS back out, so ``CCO`` / ``OCC`` / ``C(O)C`` share one key. The output is still a
+    faithful serialization of the query, so different queries never collide.
+    """
+    if not substructure:
+        return None
+    query = "".join(substructure.split())
+    try:
+        pattern = Chem.MolFromSmarts(query)
+        if pattern is not None:
+            pattern.UpdatePropertyCache(strict=False)
+            ranks = list(Chem.CanonicalRankAtoms(pattern, breakTies=True))
+            order = sorted(range(pattern.GetNumAtoms()), key=lambda i: ranks[i])
+            return "sma:" + Chem.MolToSmarts(Chem.RenumberAtoms(pattern, order))
+        canonical = canonicalize_smiles(query)
+        return "smi:" + canonical if canonical else None
+    except Exception:
+        return None
+
+
+def substructure_search(molecules: list[str], substructure: str, limit: Optional[int] = None):
+    if not substructure:
+        return []
+
+    return _substructure_search_rdkit(molecules, substructure, limit)
+
 
+def iter_match_rows(rows, pattern):
+    """Yield the SMILES of ``(id, smiles, mol_pkl)`` rows matching ``pattern``, in row order."""
+    timer = ScanTimer()
+    try:
+        for _, smiles, mol_pkl in rows:
+            timer.start()
+            mol = mol_from_row(smiles, mol_pkl)
+            timer.lap("parse")
+            if mol is None:
+                continue
             try:
-                if pattern_for_fp is not None:
-                    pattern_fp = Chem.RDKFingerprint(pattern_for_fp, fpSize=2048)
+                found = mol.HasSubstructMatch(pattern)
             except Exception:
-                pattern_fp = None
-        else:
-            pattern_for_fp = pattern
+                found = False
+            timer.lap("match")
+            if found:
+                yield smiles
+    finally:
+        timer.observe()
+
+
+def match_rows(rows, pattern, limit: Optional[int] = None):
+    """Exact substructure match of ``(id, smiles, mol_pkl)`` rows that passed the screen; returns hit SMILES."""
+    return list(islice(iter_match_rows(rows, pattern), limit))
+
+
+def explain_match_rows(rows, pattern, limit: Optional[int] = None, slowest: int = 10) -> tuple[list[str], dict]:
+    """:func:`match_rows` timing every molecule: returns ``(hits, stats)``.
+
+    ``stats`` holds how many rows were scanned and parsed, the seconds spent parsing and
+    matching, and the ``slowest`` individual matches as ``(smiles, seconds)``, slowest first.
+    """
+    hits = []
+    scanned = parsed = 0
+    parse_s = match_s = 0.0
+    slow: list[tuple[float, int, str]] = []
+    for i, (_, smiles, mol_pkl) in enumerate(rows):
+        scanned += 1
+        start = time.perf_counter()
+        mol = mol_from_row(smiles, mol_pkl)
+        built = time.perf_counter()
+        parse_s += built - start
+        if mol is None:
+            continue
+        parsed += 1
+        try:
+            found = mol.HasSubstructMatch(pattern)
+        except Exception:
+            found = False
+        elapsed = time.perf_counter() - built
+        match_s += elapsed
+        if len(slow) < slowest:
+            heapq.heappush(slow, (elapsed, i, smiles))
+        elif slow and elapsed > slow[0][0]:
+            heapq.heapreplace(slow, (elapsed, i, smiles))
+        if found:
+            hits.append(smiles)
+            if limit is not None and len(hits) >= limit:
+                break
+    stats = {
+        "scanned": scanned,
+        "parsed": parsed,
+        "parse_s": parse_s,
+        "match_s": match_s,
+        "slowest": [(smiles, seconds) for seconds, _, smiles in sorted(slow, reverse=True)],
+    }
+    return hits, stats
 
+
+def match_rows_many(rows, patterns: list, members: list[list[int]], limit: Optional[int] = None) -> list[list[str]]:
+    """Match ``(id, smiles, mol_pkl)`` rows against several patterns, building each molecule once.
+
+    ``members[i]`` lists the patterns (positions in ``patterns``) to try on ``rows[i]``, i.e. the
+    ones whose screen it passed. Returns the hit SMILES of each pattern in row order, at most
+    ``limit`` per pattern.
+    """
+    hits: list[list[str]] = [[] for _ in patterns]
+    timer = ScanTimer()
+    for (_, smiles, mol_pkl), wanted in zip(rows, members):
+        if limit is not None:
+            wanted = [p for p in wanted if len(hits[p]) < limit]
+        if not wanted:
+            continue
+        timer.start()
+        mol = mol_from_row(smiles, mol_pkl)
+        timer.lap("parse")
+        if mol is None:
+            continue
+        for p in wanted:
             try:
-                pattern_fp = Chem.RDKFingerprint(pattern_for_fp, fpSize=2048)
+                if mol.HasSubstructMatch(patterns[p]):
+                    hits[p].append(smiles)
             except Exception:
-                pattern_fp = None
-    except Exception:
-        pattern_fp = None
+                continue
+        timer.lap("match")
+    timer.observe()
+    return hits
+
+
+def iter_substructure_search(molecules: Iterable[str], substructure: str):
+    """Generator form of the search: yields each matching SMILES as soon as it is found."""
+    pattern, pattern_fp = compile_pattern(substructure)
+    if not pattern:
+        return
 
-    hits = []
     for smiles in molecules:
         try:
             mol = Chem.MolFromSmiles(smiles)
@@ -62,16 +346,17 @@ def _substructure_search_rdkit(molecules: list[str], substructure: str, limit: O
 
             if pattern_fp is not None:
                 try:
-                    mol_fp = Chem.RDKFingerprint(mol, fpSize=2048)
+                    mol_fp = pattern_fingerprint(mol)
                     if not DataStructs.AllProbeBitsMatch(pattern_fp, mol_fp):
                         continue
                 except Exception:
                     pass
 
             if mol.HasSubstructMatch(pattern):
-                hits.append(smiles)
-                if limit is not None and len(hits) >= limit:
-                    break
+                yield smiles
         except Exception:
             continue
-    return hits
+
+
+def _substructure_search_rdkit(molecules: list[str], substructure: str, limit: Optional[int] = None):
+    return list(islice(iter_substructure_search(molecules, substructure), limit))
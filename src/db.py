@@ -2,7 +2,7 @@ import asyncio
 from contextlib import asynccontextmanager
 from uuid import uuid4
 
-from sqlalchemy import Column, String, text
+from sqlalchemy import DDL, BigInteger, Column, Float, Integer, LargeBinary, String, event, text
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.ext.asyncio import (
     AsyncEngine,
@@ -12,7 +12,16 @@ from sqlalchemy.ext.asyncio import (
 )
 from sqlalchemy.orm import declarative_base
 
-from .settings import DATABASE_URL
+from .settings import (
+    DATABASE_REPLICA_URL,
+    DATABASE_URL,
+    DB_MAX_OVERFLOW,
+    DB_POOL_PRE_PING,
+    DB_POOL_RECYCLE,
+    DB_POOL_SIZE,
+    DB_POOL_TIMEOUT,
+    DB_STATEMENT_CACHE_SIZE,
+)
 
 
 def _ensure_async_driver(url: str) -> str:
@@ -28,13 +37,50 @@ def _ensure_async_driver(url: str) -> str:
 
 
 DATABASE_URL = _ensure_async_driver(DATABASE_URL)
+DATABASE_REPLICA_URL = _ensure_async_driver(DATABASE_REPLICA_URL) if DATABASE_REPLICA_URL else None
 
-engine: AsyncEngine = create_async_engine(
-    DATABASE_URL,
-    pool_pre_ping=True,
-)
+
+def _engine_options(url: str) -> dict:
+    """Pool and driver settings for ``url``; SQLite keeps SQLAlchemy's default pool, which takes no sizing."""
+    options = {"pool_pre_ping": DB_POOL_PRE_PING}
+    if url.startswith("sqlite"):
+        return options
+    options.update(
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+    )
+    if "+asyncpg" in url:
+        options["connect_args"] = {"prepared_statement_cache_size": DB_STATEMENT_CACHE_SIZE}
+    return options
+
+
+def _fp_contains(fingerprint, query):
+    if fingerprint is None or query is None:
+        return None
+    q = int.from_bytes(query, "little")
+    return int(int.from_bytes(fingerprint, "little") & q == q)
+
+
+def _register_sqlite_functions(dbapi_connection, _connection_record):
+    # Postgres gets fp_contains from the migration / DDL below; SQLite needs a Python UDF.
+    dbapi_connection.create_function("fp_contains", 2, _fp_contains, deterministic=True)
+
+
+def _create_engine(url: str) -> AsyncEngine:
+    new_engine = create_async_engine(url, **_engine_options(url))
+    if new_engine.dialect.name == "sqlite":
+        event.listen(new_engine.sync_engine, "connect", _register_sqlite_functions)
+    return new_engine
+
+
+engine: AsyncEngine = _create_engine(DATABASE_URL)
+# reads that tolerate replication lag (listings, lookups, searches); the primary when no replica is set
+read_engine: AsyncEngine = _create_engine(DATABASE_REPLICA_URL) if DATABASE_REPLICA_URL else engine
 
 SessionLocal = async_sessionmaker(bind=engine, expire_on_commit=False, class_=AsyncSession)
+ReadSessionLocal = async_sessionmaker(bind=read_engine, expire_on_commit=False, class_=AsyncSession)
 Base = declarative_base()
 
 
@@ -42,7 +88,43 @@ class Molecule(Base):
     __tablename__ = "molecules"
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid4)
-    smiles = Column(String(4096), nullable=False, unique=True)
+    smiles = Column(String(4096), nullable=False)
+    # blake2b of the canonical SMILES; the unique index lives here rather than on the wide smiles column
+    smiles_key = Column(String(32), nullable=False, unique=True, index=True)
+    fingerprint = Column(LargeBinary, nullable=True)
+    mol_pkl = Column(LargeBinary, nullable=True)
+    morgan_fp = Column(LargeBinary, nullable=True)
+    # descriptors (see chemistry.DESCRIPTORS), indexed for property-range filters
+    mw = Column(Float, nullable=True, index=True)
+    clogp = Column(Float, nullable=True, index=True)
+    hbd = Column(Integer, nullable=True, index=True)
+    hba = Column(Integer, nullable=True, index=True)
+    tpsa = Column(Float, nullable=True, index=True)
+    heavy_atoms = Column(Integer, nullable=True, index=True)
+
+
+class MoleculeChange(Base):
+    """Append-only journal of written molecule ids; ``seq`` is the change marker indexes refresh from."""
+    __tablename__ = "molecule_changes"
+
+    # SQLite only autoincrements an INTEGER PRIMARY KEY
+    seq = Column(BigInteger().with_variant(Integer, "sqlite"), primary_key=True, autoincrement=True)
+    molecule_id = Column(UUID(as_uuid=True), nullable=False)
+
+
+# fp_contains(fp, q): true when every bit set in q is also set in fp
+FP_CONTAINS_PG_DDL = """
+CREATE OR REPLACE FUNCTION fp_contains(fp bytea, q bytea) RETURNS boolean AS $$
+    SELECT (('x' || encode(fp, 'hex'))::bit(2048) & ('x' || encode(q, 'hex'))::bit(2048))
+           = ('x' || encode(q, 'hex'))::bit(2048)
+$$ LANGUAGE sql IMMUTABLE STRICT PARALLEL SAFE
+"""
+
+event.listen(
+    Molecule.__table__,
+    "after_create",
+    DDL(FP_CONTAINS_PG_DDL).execute_if(dialect="postgresql"),
+)
 
 
 async def _wait_for_db(max_attempts: int = 30, delay_seconds: float = 1.0):
@@ -61,8 +143,8 @@ async def init_db():
 
 
 @asynccontextmanager
-async def db_session_scope():
-    session: AsyncSession = SessionLocal()
+async def _session_scope(factory: async_sessionmaker):
+    session: AsyncSession = factory()
     try:
         async with session.begin():
             yield session
@@ -73,11 +155,25 @@ async def db_session_scope():
         await session.close()
 
 
+def db_session_scope():
+    return _session_scope(SessionLocal)
+
+
+def read_session_scope():
+    """Session on the read replica (the primary without one); never write through it."""
+    return _session_scope(ReadSessionLocal)
+
+
 async def get_db():
     async with db_session_scope() as session:
         yield session
 
 
+async def get_read_db():
+    async with read_session_scope() as session:
+        yield session
+
+
 # for testing purposes
 async def _create_all_async():
     async with engine.begin() as conn:
@@ -0,0 +1,61 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from fastapi import HTTPException
+
+from src.metrics import CPU_JOBS_IN_FLIGHT, CPU_JOBS_REJECTED
+from src.settings import CPU_MAX_IN_FLIGHT, CPU_RETRY_AFTER_SECONDS, CPU_WORKERS
+
+_WAIT_INITIAL = 0.01
+_WAIT_MAX = 0.5
+
+
+class CPUExecutor:
+    """Runs RDKit work off the event loop with admission control.
+
+    At most ``limit`` jobs may be queued or running at once; beyond that callers get a
+    503 with ``Retry-After`` instead of piling up behind the pool.
+    """
+
+    def __init__(self, workers: int = CPU_WORKERS, limit: int = CPU_MAX_IN_FLIGHT):
+        self.workers = workers
+        self.limit = limit
+        self.in_flight = 0
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="rdkit")
+
+    def stats(self):
+        return {"in_flight": self.in_flight, "limit": self.limit, "workers": self.workers}
+
+    async def run(self, func, *args, **kwargs):
+        if self.in_flight >= self.limit:
+            CPU_JOBS_REJECTED.inc()
+            raise HTTPException(
+                status_code=503,
+                detail="Server is busy, retry later",
+                headers={"Retry-After": str(CPU_RETRY_AFTER_SECONDS)},
+            )
+        # only touched from the event loop thread, so a plain counter is enough
+        self.in_flight += 1
+        CPU_JOBS_IN_FLIGHT.inc()
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._pool, partial(func, *args, **kwargs))
+        finally:
+            self.in_flight -= 1
+            CPU_JOBS_IN_FLIGHT.dec()
+
+    async def run_when_free(self, func, *args, **kwargs):
+        """:meth:`run` for work that must not fail halfway (bulk ingest): waits for a free slot instead of a 503."""
+        delay = _WAIT_INITIAL
+        while self.in_flight >= self.limit:
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, _WAIT_MAX)
+        return await self.run(func, *args, **kwargs)
+
+
+cpu_executor = CPUExecutor()
+
+
+async def run_cpu(func, *args, **kwargs):
+    return await cpu_executor.run(func, *args, **kwargs)
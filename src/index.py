@@ -0,0 +1,401 @@
+import asyncio
+import logging
+import threading
+import time
+import weakref
+from itertools import groupby
+from typing import Optional
+
+import numpy as np
+from sqlalchemy import delete, event, func, insert, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from src.chemistry import FP_SIZE, fingerprint_to_bytes, smiles_fingerprint, smiles_similarity_fingerprint
+from src.db import Molecule, MoleculeChange, db_session_scope
+from src.metrics import record_screen
+from src.parallel import current_search_engine
+from src.settings import CHANGE_LOG_KEEP, INDEX_REFRESH_INTERVAL, SEARCH_CACHE_PATCH_MAX
+from src.similarity import SimilarityMatrix
+
+logger = logging.getLogger("app")
+
+FP_WORDS = FP_SIZE // 64
+REFRESH_BATCH = 1000
+CHANGE_GAP_GRACE_SECONDS = 60
+CHANGE_PRUNE_INTERVAL_SECONDS = 3600
+
+
+def _fp_words(fp: Optional[bytes]) -> np.ndarray:
+    if fp is None or len(fp) != FP_SIZE // 8:
+        return np.zeros(FP_WORDS, dtype=np.uint64)
+    return np.frombuffer(fp, dtype="<u8").astype(np.uint64, copy=False)
+
+
+def screen_rows_many(rows: list, pattern_fps: list) -> tuple[list[tuple], list[list[int]]]:
+    """:meth:`MoleculeIndex.candidate_rows_many` over fetched ``(id, smiles, mol_pkl, fingerprint)`` rows.
+
+    Rows without a stored fingerprint pass every screen, as in the SQL screen.
+    """
+    fps = np.stack([_fp_words(row[3]) for row in rows]) if rows else np.zeros((0, FP_WORDS), dtype=np.uint64)
+    missing = np.array([row[3] is None for row in rows], dtype=bool)
+    passed = np.zeros((len(rows), len(pattern_fps)), dtype=bool)
+    for p, pattern_fp in enumerate(pattern_fps):
+        if pattern_fp is None:
+            passed[:, p] = True
+            continue
+        q = _fp_words(fingerprint_to_bytes(pattern_fp))
+        passed[:, p] = ((fps & q) == q).all(axis=1) | missing
+        record_screen(len(rows), int(passed[:, p].sum()))
+    union = np.flatnonzero(passed.any(axis=1))
+    members = [np.flatnonzero(mask).tolist() for mask in passed[union]]
+    return [tuple(rows[i][:3]) for i in union], members
+
+
+class MoleculeIndex:
+    """Process-resident substructure screen: packed fingerprints as one ``uint64`` matrix.
+
+    Row ``i`` of the matrix belongs to ``ids[i]`` / ``smiles[i]``. Removal swaps the last row
+    into the freed slot, so row order is not stable across writes.
+    """
+
+    def __init__(self, capacity: int = 1024):
+        self._lock = threading.Lock()
+        self._fps = np.zeros((capacity, FP_WORDS), dtype=np.uint64)
+        self._ids: list = []
+        self._smiles: list[str] = []
+        self._pkls: list = []
+        self._pos: dict = {}
+        self._sim = SimilarityMatrix(capacity)
+        self.loaded = False
+        # change marker: highest molecule_changes.seq applied, plus unseen lower seqs still in flight
+        self.last_seq = 0
+        self._gaps: dict[int, float] = {}
+        self.refreshed_at = 0.0
+
+    def __len__(self):
+        return len(self._ids)
+
+    def clear(self):
+        with self._lock:
+            self._fps = np.zeros((1024, FP_WORDS), dtype=np.uint64)
+            self._ids = []
+            self._smiles = []
+            self._pkls = []
+            self._pos = {}
+            self._sim = SimilarityMatrix()
+            self.loaded = False
+            self.last_seq = 0
+            self._gaps = {}
+
+    def _reserve(self, size: int):
+        if size <= self._fps.shape[0]:
+            return
+        capacity = max(size, self._fps.shape[0] * 2)
+        fps = np.zeros((capacity, FP_WORDS), dtype=np.uint64)
+        fps[:len(self._ids)] = self._fps[:len(self._ids)]
+        self._fps = fps
+        self._sim.reserve(capacity)
+
+    def _upsert(self, id, smiles: str, fp: Optional[bytes], mol_pkl: Optional[bytes]) -> int:
+        """Write everything but the similarity row (callers set those in bulk); returns the row."""
+        if fp is None:
+            fp = smiles_fingerprint(smiles)
+        row = self._pos.get(id)
+        if row is None:
+            row = len(self._ids)
+            self._reserve(row + 1)
+            self._ids.append(id)
+            self._smiles.append(smiles)
+            self._pkls.append(mol_pkl)
+            self._pos[id] = row
+        else:
+            self._smiles[row] = smiles
+            self._pkls[row] = mol_pkl
+        self._fps[row] = _fp_words(fp)
+        return row
+
+    def _remove(self, id):
+        row = self._pos.pop(id, None)
+        if row is None:
+            return
+        last = len(self._ids) - 1
+        if row != last:
+            self._ids[row] = self._ids[last]
+            self._smiles[row] = self._smiles[last]
+            self._pkls[row] = self._pkls[last]
+            self._fps[row] = self._fps[last]
+            self._sim.move_row(last, row)
+            self._pos[self._ids[row]] = row
+        else:
+            self._sim.clear_row(row)
+        self._ids.pop()
+        self._smiles.pop()
+        self._pkls.pop()
+
+    def upsert_many(self, rows):
+        """:meth:`upsert` of ``(id, smiles, fingerprint, mol_pkl, morgan_fp)`` rows under one lock."""
+        with self._lock:
+            sim_fps = {}
+            for id, smiles, fp, mol_pkl, sim_fp in rows:
+                sim_fps[self._upsert(id, smiles, fp, mol_pkl)] = sim_fp
+            self._sim.set_rows(
+                list(sim_fps), [fp or smiles_similarity_fingerprint(self._smiles[row]) for row, fp in sim_fps.items()]
+            )
+
+    def remove_many(self, ids):
+        with self._lock:
+            for id in ids:
+                self._remove(id)
+
+    def build(self, rows):
+        """Replace the index contents with ``(id, smiles, fingerprint, mol_pkl, morgan_fp)`` rows."""
+        rows = list(rows)
+        with self._lock:
+            self._fps = np.zeros((max(len(rows), 1024), FP_WORDS), dtype=np.uint64)
+            self._ids = []
+            self._smiles = []
+            self._pkls = []
+            self._pos = {}
+            sim_fps = {}
+            for id, smiles, fp, mol_pkl, sim_fp in rows:
+                sim_fps[self._upsert(id, smiles, fp, mol_pkl)] = sim_fp
+            self._sim = SimilarityMatrix.from_fingerprints(
+                [sim_fps[row] or smiles_similarity_fingerprint(self._smiles[row]) for row in range(len(self._ids))]
+            )
+            self.loaded = True
+
+    async def load(self, db: AsyncSession):
+        # read the marker first: changes racing the load are re-applied by the next refresh
+        last_seq = (await db.execute(select(func.max(MoleculeChange.seq)))).scalar() or 0
+        res = await db.execute(
+            select(Molecule.id, Molecule.smiles, Molecule.fingerprint, Molecule.mol_pkl, Molecule.morgan_fp)
+        )
+        self.build(res.all())
+        self.last_seq, self._gaps = last_seq, {}
+        self.refreshed_at = time.monotonic()
+        logger.info("Loaded %d molecules into the search index", len(self))
+
+    def has_applied(self, seq: int) -> bool:
+        """Whether every journaled change up to ``seq`` is in the index (none of them still a gap)."""
+        return seq <= self.last_seq and not any(gap <= seq for gap in self._gaps)
+
+    async def refresh(self, db: AsyncSession) -> Optional[list[tuple]]:
+        """Apply molecules changed since the last load/refresh, per the ``molecule_changes`` journal.
+
+        Changed rows are re-read, so each id ends up in its current state whatever the order of
+        the writes. Returns the applied ops, or None when the journal had been pruned past
+        ``last_seq`` and the index was reloaded from scratch instead.
+        """
+        low, high = (await db.execute(select(func.min(MoleculeChange.seq), func.max(MoleculeChange.seq)))).one()
+        if low is not None and low > self.last_seq + 1:
+            await self.load(db)
+            return None
+        now = time.monotonic()
+        # a seq allocated but not yet committed shows up as a gap; rolled back ones are given up on
+        self._gaps = {seq: seen for seq, seen in self._gaps.items() if now - seen < CHANGE_GAP_GRACE_SECONDS}
+        if (high or 0) <= self.last_seq and not self._gaps:
+            return []
+
+        cond = MoleculeChange.seq > self.last_seq
+        if self._gaps:
+            cond = or_(cond, MoleculeChange.seq.in_(list(self._gaps)))
+        changes = (await db.execute(select(MoleculeChange.seq, MoleculeChange.molecule_id).where(cond))).all()
+        seqs = {seq for seq, _ in changes}
+        top = max(seqs | {self.last_seq})
+        for seq in range(self.last_seq + 1, top):
+            if seq not in seqs:
+                self._gaps[seq] = now
+        for seq in seqs:
+            self._gaps.pop(seq, None)
+        self.last_seq = top
+
+        ids = list(dict.fromkeys(id for _, id in changes))
+        current = {}
+        for start in range(0, len(ids), REFRESH_BATCH):
+            res = await db.execute(
+                select(Molecule.id, Molecule.smiles, Molecule.fingerprint, Molecule.mol_pkl, Molecule.morgan_fp)
+                .where(Molecule.id.in_(ids[start:start + REFRESH_BATCH]))
+            )
+            current.update((row[0], tuple(row)) for row in res.all())
+        ops = [("upsert", *current[id]) if id in current else ("remove", id, None, None, None, None) for id in ids]
+        _apply_ops(self, None, ops)
+        return ops
+
+    def screen(self, pattern_fp=None, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """Row numbers whose fingerprint contains every bit of ``pattern_fp`` (all rows if None).
+
+        With ``rows`` (ascending row numbers) only those rows are screened.
+        """
+        n = len(self._ids)
+        if pattern_fp is None:
+            return np.arange(n) if rows is None else rows
+        q = _fp_words(fingerprint_to_bytes(pattern_fp))
+        if rows is not None:
+            passed = rows[((self._fps[rows] & q) == q).all(axis=1)]
+        else:
+            passed = np.flatnonzero(((self._fps[:n] & q) == q).all(axis=1))
+        record_screen(n if rows is None else len(rows), len(passed))
+        return passed
+
+    def candidate_rows(self, pattern_fp=None, id_range: Optional[tuple] = None, only_ids=None) -> list[tuple]:
+        """``(id, smiles, mol_pkl)`` rows passing the screen, ready for :func:`match_rows`.
+
+        With ``id_range=(lo, hi)`` only ids in ``[lo, hi)`` are kept, sorted by id like the SQL screen.
+        With ``only_ids`` (e.g. the result of a SQL property filter) only those molecules are screened.
+        """
+        with self._lock:
+            ids, smiles, pkls = self._ids, self._smiles, self._pkls
+            subset = None
+            if only_ids is not None:
+                pos = self._pos
+                subset = np.array(sorted(pos[id] for id in only_ids if id in pos), dtype=np.int64)
+            rows = [(ids[i], smiles[i], pkls[i]) for i in self.screen(pattern_fp, subset)]
+        if id_range is not None:
+            lo, hi = id_range
+            rows = sorted(
+                (row for row in rows if (lo is None or row[0] >= lo) and (hi is None or row[0] < hi)),
+                key=lambda row: row[0],
+            )
+        return rows
+
+    def candidate_rows_many(self, pattern_fps: list) -> tuple[list[tuple], list[list[int]]]:
+        """Screen several patterns at once: ``(rows, members)`` over the union of their candidates.
+
+        ``rows`` are ``(id, smiles, mol_pkl)`` in index order and ``members[i]`` lists the patterns
+        (positions in ``pattern_fps``) whose screen ``rows[i]`` passed.
+        """
+        with self._lock:
+            n = len(self._ids)
+            passed = np.zeros((n, len(pattern_fps)), dtype=bool)
+            for p, pattern_fp in enumerate(pattern_fps):
+                passed[self.screen(pattern_fp), p] = True
+            union = np.flatnonzero(passed.any(axis=1))
+            ids, smiles, pkls = self._ids, self._smiles, self._pkls
+            rows = [(ids[i], smiles[i], pkls[i]) for i in union]
+        members = [np.flatnonzero(mask).tolist() for mask in passed[union]]
+        return rows, members
+
+    def similar(self, sim_fp: bytes, threshold: float, k: int) -> list[tuple[str, float]]:
+        """Top-``k`` ``(smiles, tanimoto)`` at or above ``threshold``, best first."""
+        with self._lock:
+            return [(self._smiles[row], score) for row, score in self._sim.search(sim_fp, len(self._ids), threshold, k)]
+
+
+molecule_index = MoleculeIndex()
+
+
+def stage_upsert(db: AsyncSession, mol: Molecule):
+    """Queue an index update that is applied only once the session commits."""
+    db.sync_session.info.setdefault("index_ops", []).append(
+        ("upsert", mol.id, mol.smiles, mol.fingerprint, mol.mol_pkl, mol.morgan_fp)
+    )
+
+
+def stage_remove(db: AsyncSession, id, smiles: Optional[str] = None):
+    """Queue an index removal; ``smiles`` (the structure going away) lets cached searches drop it."""
+    db.sync_session.info.setdefault("index_ops", []).append(("remove", id, smiles, None, None, None))
+
+
+def pop_committed_smiles(db: AsyncSession) -> Optional[set]:
+    """SMILES touched by the session's commits since the last call; None if there were too many to track."""
+    return db.sync_session.info.pop("committed_smiles", set())
+
+
+def _journal_smiles(session: Session, ops: list):
+    touched = session.info.get("committed_smiles", set())
+    if touched is None:
+        return
+    touched.update(op[2] for op in ops if op[2] is not None)
+    session.info["committed_smiles"] = touched if len(touched) <= SEARCH_CACHE_PATCH_MAX else None
+
+
+def _apply_ops(index: Optional[MoleculeIndex], engine, ops: list):
+    # runs of the same op are applied in bulk; the order between runs is kept (an update is remove + upsert)
+    for op, run in groupby(ops, key=lambda op: op[0]):
+        rows = [op[1:] for op in run]
+        if op == "upsert":
+            if index is not None:
+                index.upsert_many(rows)
+            if engine is not None:
+                engine.upsert_many([(id, smiles, mol_pkl) for id, smiles, _, mol_pkl, _ in rows])
+        else:
+            ids = [row[0] for row in rows]
+            if index is not None:
+                index.remove_many(ids)
+            if engine is not None:
+                engine.remove_many(ids)
+
+
+@event.listens_for(Session, "before_commit")
+def _journal_changes(session: Session):
+    # same transaction as the write, so other processes see the change marker exactly when the row
+    ops = session.info.get("index_ops")
+    if ops:
+        ids = dict.fromkeys(op[1] for op in ops)
+        session.execute(insert(MoleculeChange), [{"molecule_id": id} for id in ids])
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_index_ops(session: Session):
+    ops = session.info.pop("index_ops", None)
+    if ops:
+        _journal_smiles(session, ops)
+    if not ops or not molecule_index.loaded:
+        return
+    _apply_ops(molecule_index, current_search_engine(), ops)
+
+
+_pruned_at = 0.0
+_refresh_locks: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Lock]" = weakref.WeakKeyDictionary()
+
+
+def _refresh_due(interval: float, seq: Optional[int]) -> bool:
+    if seq is not None:
+        return not molecule_index.has_applied(seq)
+    return time.monotonic() - molecule_index.refreshed_at >= interval
+
+
+async def refresh_molecule_index(db: AsyncSession, interval: float = INDEX_REFRESH_INTERVAL, seq: Optional[int] = None):
+    """Bring the process index (and search engine) up to date with other processes' writes.
+
+    Runs at most once per ``interval`` seconds; with ``seq`` it runs instead whenever the index
+    lacks a change up to ``seq``, unless another refresh started while this one waited its turn.
+    Now and then it also prunes the journal down to the newest CHANGE_LOG_KEEP entries.
+    """
+    global _pruned_at
+    if not molecule_index.loaded or not _refresh_due(interval, seq):
+        return
+    asked = time.monotonic()
+    # one refresh at a time: a slower one applying its rows last would roll newer ones back
+    lock = _refresh_locks.setdefault(asyncio.get_running_loop(), asyncio.Lock())
+    async with lock:
+        if not _refresh_due(interval, seq) or molecule_index.refreshed_at >= asked:
+            return
+        molecule_index.refreshed_at = time.monotonic()
+        try:
+            ops = await molecule_index.refresh(db)
+        except Exception as e:
+            logger.warning("Failed to refresh the search index: %s", e)
+            return
+        engine = current_search_engine()
+        if engine is not None:
+            if ops is None:
+                engine.load(molecule_index.candidate_rows())
+            else:
+                _apply_ops(None, engine, ops)
+
+    if time.monotonic() - _pruned_at >= CHANGE_PRUNE_INTERVAL_SECONDS:
+        _pruned_at = time.monotonic()
+        try:
+            async with db_session_scope() as session:
+                await session.execute(
+                    delete(MoleculeChange).where(MoleculeChange.seq <= molecule_index.last_seq - CHANGE_LOG_KEEP)
+                )
+        except Exception as e:
+            logger.warning("Failed to prune the molecule change journal: %s", e)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_index_ops(session: Session):
+    session.info.pop("index_ops", None)
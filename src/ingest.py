@@ -0,0 +1,309 @@
+import asyncio
+import codecs
+import csv
+import zlib
+from typing import AsyncIterator, Awaitable, Callable, Optional
+from uuid import uuid4
+
+from fastapi import UploadFile
+from sqlalchemy import insert
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.chemistry import molblock_to_smiles, molecule_columns
+from src.db import Molecule
+from src.executor import cpu_executor
+from src.index import stage_upsert
+from src.parallel import current_search_engine
+from src.settings import INGEST_BATCH_SIZE, INGEST_CHUNK_BYTES
+
+# asyncpg and SQLite both cap bound parameters per statement at ~32k
+MAX_BIND_PARAMS = 30_000
+GZIP_MAGIC = b"\x1f\x8b"
+
+
+def prepare_batch(records: list[str], kind: str = "smiles") -> list[Optional[dict]]:
+    """Column values for each record (None for invalid ones). Runs in a worker thread or process."""
+    if kind == "molblock":
+        return [molecule_columns(molblock_to_smiles(block)) for block in records]
+    return [molecule_columns(smiles) for smiles in records]
+
+
+def _split(items: list, parts: int) -> list[list]:
+    size = max(1, -(-len(items) // max(parts, 1)))
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+async def _prepare_parallel(records: list[str], kind: str = "smiles") -> list[Optional[dict]]:
+    engine = current_search_engine()
+    if engine is not None:
+        batches = _split(records, engine.workers)
+        futures = [asyncio.wrap_future(engine.submit(prepare_batch, batch, kind)) for batch in batches]
+    else:
+        batches = _split(records, cpu_executor.workers)
+        # a 503 halfway through a file would leave it partly ingested, so wait for the executor instead
+        futures = [cpu_executor.run_when_free(prepare_batch, batch, kind) for batch in batches]
+    prepared = []
+    for result in await asyncio.gather(*futures):
+        prepared.extend(result)
+    return prepared
+
+
+# dialects with INSERT ... ON CONFLICT DO NOTHING ... RETURNING; others insert row by row
+_INSERT_IGNORE = {"postgresql": pg_insert, "sqlite": sqlite_insert}
+
+
+async def _insert_rows_one_by_one(db: AsyncSession, rows: list[dict]) -> list:
+    """Portable fallback: each row in its own savepoint, duplicates detected by the unique index."""
+    inserted = []
+    for row in rows:
+        try:
+            async with db.begin_nested():
+                await db.execute(insert(Molecule).values(**row))
+        except IntegrityError:
+            continue
+        inserted.append(Molecule(**row))
+    return inserted
+
+
+async def _insert_rows(db: AsyncSession, rows: list[dict]) -> int:
+    """Multi-row INSERT ... ON CONFLICT (smiles_key) DO NOTHING; returns the number of rows created."""
+    if not rows:
+        return 0
+    insert_ignore = _INSERT_IGNORE.get(db.bind.dialect.name)
+    if insert_ignore is None:
+        inserted = await _insert_rows_one_by_one(db, rows)
+    else:
+        stmt = (
+            insert_ignore(Molecule)
+            .values(rows)
+            .on_conflict_do_nothing(index_elements=[Molecule.smiles_key])
+            .returning(Molecule.id, Molecule.smiles, Molecule.fingerprint, Molecule.mol_pkl, Molecule.morgan_fp)
+        )
+        inserted = (await db.execute(stmt)).all()
+    for row in inserted:
+        stage_upsert(db, row)
+    return len(inserted)
+
+
+async def ingest_records(
+        db: AsyncSession,
+        records: AsyncIterator[str],
+        kind: str = "smiles",
+        batch_size: int = INGEST_BATCH_SIZE,
+        on_progress: Optional[Callable[[dict], None]] = None,
+        on_commit: Optional[Callable[[], Awaitable]] = None,
+) -> dict:
+    """Validate, deduplicate and insert records (SMILES or SDF molblocks) in chunks of ``batch_size``.
+
+    Returns ``created`` / ``duplicates`` / ``invalid`` counts. Duplicates are rows whose
+    structure repeats within the chunk or already exists in the table. Every chunk is committed
+    on its own, so transactions stay short and the index updates staged for a chunk are applied
+    (and released) with it instead of piling up until the end of the file. A failure therefore
+    keeps the chunks committed before it. ``on_commit`` is awaited after each chunk's commit.
+    """
+    stats = {"created": 0, "duplicates": 0, "invalid": 0}
+    chunk: list[str] = []
+
+    async def _flush():
+        prepared = await _prepare_parallel(chunk, kind)
+        rows = {}
+        for columns in prepared:
+            if columns is None:
+                stats["invalid"] += 1
+            elif columns["smiles_key"] in rows:
+                stats["duplicates"] += 1
+            else:
+                rows[columns["smiles_key"]] = {"id": uuid4(), **columns}
+        rows = list(rows.values())
+        if rows:
+            step = max(1, min(batch_size, MAX_BIND_PARAMS // len(rows[0])))
+            for start in range(0, len(rows), step):
+                part = rows[start:start + step]
+                created = await _insert_rows(db, part)
+                stats["created"] += created
+                stats["duplicates"] += len(part) - created
+        await db.commit()
+        if on_commit is not None:
+            await on_commit()
+        if on_progress is not None:
+            on_progress(dict(stats))
+
+    async for record in records:
+        chunk.append(record)
+        if len(chunk) >= batch_size:
+            await _flush()
+            chunk = []
+    if chunk:
+        await _flush()
+    return stats
+
+
+# --- streaming parsers: bytes -> (optionally gunzipped) text lines -> records ---
+
+FORMATS = ("auto", "smi", "csv", "tsv", "sdf")
+_EXTENSIONS = {".sdf": "sdf", ".sd": "sdf", ".mol": "sdf", ".csv": "csv", ".tsv": "tsv", ".tab": "tsv"}
+
+
+async def upload_chunks(file: UploadFile, chunk_size: int = INGEST_CHUNK_BYTES) -> AsyncIterator[bytes]:
+    while True:
+        chunk = await file.read(chunk_size)
+        if not chunk:
+            break
+        yield chunk
+
+
+async def file_chunks(path: str, chunk_size: int = INGEST_CHUNK_BYTES, progress: Optional[dict] = None):
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            if progress is not None:
+                progress["bytes_read"] = f.tell()
+            yield chunk
+
+
+async def gunzip_if_needed(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    """Pass chunks through, transparently decompressing (multi-member) gzip streams."""
+    decompressor = None
+    first = True
+    async for chunk in chunks:
+        if first:
+            first = False
+            if chunk[:2] == GZIP_MAGIC:
+                decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        if decompressor is None:
+            yield chunk
+            continue
+        while chunk:
+            data = decompressor.decompress(chunk)
+            if data:
+                yield data
+            chunk = decompressor.unused_data if decompressor.eof else b""
+            if decompressor.eof:
+                decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    if decompressor is not None:
+        tail = decompressor.flush()
+        if tail:
+            yield tail
+
+
+async def text_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    pending = ""
+    async for chunk in chunks:
+        text = pending + decoder.decode(chunk)
+        # hold back a trailing \r so a \r\n split across chunks is not read as two line breaks
+        hold = ""
+        if text.endswith("\r"):
+            text, hold = text[:-1], "\r"
+        lines = text.splitlines()
+        # the last piece may be an incomplete line unless the chunk ended on a newline
+        pending = lines.pop() if lines and not text.endswith(("\n", "\r")) else ""
+        pending += hold
+        for line in lines:
+            yield line
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield pending
+
+
+def _format_from_name(filename: Optional[str]) -> Optional[str]:
+    name = (filename or "").lower()
+    if name.endswith(".gz"):
+        name = name[:-3]
+    for ext, fmt in _EXTENSIONS.items():
+        if name.endswith(ext):
+            return fmt
+    return None
+
+
+def _sniff_format(head: list[str]) -> str:
+    if any(line.strip().endswith(("V2000", "V3000")) or line.strip() == "$$$$" for line in head):
+        return "sdf"
+    first = next((line for line in head if line.strip()), "")
+    for fmt, sep in (("tsv", "\t"), ("csv", ",")):
+        if sep in first and any("smiles" in field.lower() for field in first.split(sep)):
+            return fmt
+    return "smi"
+
+
+def _smiles_column(header: list[str]) -> Optional[int]:
+    names = [name.strip().lower() for name in header]
+    for i, name in enumerate(names):
+        if name in ("smiles", "canonical_smiles", "smi"):
+            return i
+    for i, name in enumerate(names):
+        if "smiles" in name:
+            return i
+    return None
+
+
+async def _smi_records(lines: AsyncIterator[str]):
+    async for line in lines:
+        line = line.strip()
+        if not line or line.lower().startswith("smiles"):
+            continue
+        # .smi files may carry a name after the SMILES
+        yield line.split()[0]
+
+
+async def _delimited_records(lines: AsyncIterator[str], delimiter: str):
+    column = None
+    async for line in lines:
+        if not line.strip():
+            continue
+        fields = next(csv.reader([line], delimiter=delimiter))
+        if column is None:
+            column = _smiles_column(fields)
+            if column is not None:
+                continue
+            column = 0
+        if column < len(fields) and fields[column].strip():
+            yield fields[column].strip()
+
+
+async def _sdf_records(lines: AsyncIterator[str]):
+    block: list[str] = []
+    ended = False
+    async for line in lines:
+        if line.strip() == "$$$$":
+            if block:
+                yield "\n".join(block)
+            block = []
+            ended = False
+        elif not ended:
+            # data items after "M  END" are not needed to build the molecule
+            block.append(line)
+            ended = line.startswith("M  END")
+    if any(line.strip() for line in block):
+        yield "\n".join(block)
+
+
+async def parse_records(chunks: AsyncIterator[bytes], filename: Optional[str] = None, fmt: str = "auto"):
+    """Return ``(kind, records)`` for a byte stream: kind is ``smiles`` or ``molblock``."""
+    lines = text_lines(gunzip_if_needed(chunks))
+    if fmt == "auto":
+        fmt = _format_from_name(filename)
+    head: list[str] = []
+    if fmt is None:
+        async for line in lines:
+            head.append(line)
+            if len(head) >= 5:
+                break
+        fmt = _sniff_format(head)
+
+    async def _replay():
+        for line in head:
+            yield line
+        async for line in lines:
+            yield line
+
+    if fmt == "sdf":
+        return "molblock", _sdf_records(_replay())
+    if fmt in ("csv", "tsv"):
+        return "smiles", _delimited_records(_replay(), "," if fmt == "csv" else "\t")
+    return "smiles", _smi_records(_replay())
@@ -1,8 +1,16 @@
 import logging
+import time
 from contextlib import asynccontextmanager
-from fastapi import FastAPI, Request
-
-from .db import init_db
+from fastapi import FastAPI, Request, Response
+from prometheus_client import CONTENT_TYPE_LATEST
+from starlette.concurrency import run_in_threadpool
+
+from .cache import cache_stats
+from .db import init_db, read_session_scope
+from .executor import cpu_executor
+from .index import molecule_index
+from .metrics import REQUEST_LATENCY, render_metrics
+from .parallel import get_search_engine, shutdown_search_engine
 from .api import router as api_router
 from .settings import setup_logging
 
@@ -12,9 +20,21 @@ logger = setup_logging()
 @asynccontextmanager
 async def lifespan(_app: FastAPI):
     await init_db()
+    try:
+        async with read_session_scope() as db:
+            await molecule_index.load(db)
+    except Exception as e:
+        # e.g. the replica is down or the schema predates the change journal; serve from the SQL screen
+        molecule_index.clear()
+        logger.warning("Failed to build the search index, scanning the DB instead: %s", e)
+    engine = get_search_engine()
+    if engine is not None and molecule_index.loaded:
+        engine.load(molecule_index.candidate_rows())
     logger.info("Application startup complete")
 
     yield
+    molecule_index.clear()
+    shutdown_search_engine()
     logger.info("Application shutdown complete")
 
 
@@ -42,25 +62,42 @@ Store, manage, and search chemical molecules using SMILES notation.
 )
 
 
+def _route_template(request: Request) -> str:
+    """The matched route's path template (``/molecules/{id}``), so metric labels stay bounded."""
+    route = request.scope.get("route")
+    return getattr(route, "path", None) or "unmatched"
+
+
 @app.middleware("http")
 async def log_requests(request: Request, call_next):
-    from time import time
-    start = time()
+    start = time.perf_counter()
     response = await call_next(request)
-    duration = (time() - start) * 1000
+    duration = time.perf_counter() - start
+    REQUEST_LATENCY.labels(request.method, _route_template(request), str(response.status_code)).observe(duration)
     logging.getLogger("app").info(
         "%s %s -> %s (%.2f ms)",
         request.method,
         request.url.path,
         response.status_code,
-        duration,
+        duration * 1000,
     )
     return response
 
 
 @app.get("/", tags=["health"], summary="Health check", description="API health status")
 async def root():
-    return {"service": "cheminformatics", "status": "ok", "version": "1.0.0"}
+    return {
+        "service": "cheminformatics",
+        "status": "ok",
+        "version": "1.0.0",
+        "cpu_jobs": cpu_executor.stats(),
+        "cache": cache_stats(),
+    }
+
+
+@app.get("/metrics", tags=["health"], summary="Prometheus metrics", include_in_schema=False)
+async def metrics():
+    return Response(await run_in_threadpool(render_metrics), media_type=CONTENT_TYPE_LATEST)
 
 
 app.include_router(api_router)
@@ -0,0 +1,135 @@
+"""Prometheus metrics, served at ``/metrics``.
+
+With ``PROMETHEUS_MULTIPROC_DIR`` set, every process (uvicorn workers, search shard processes,
+Celery workers on the same host) writes its samples to files in that directory and any worker
+serving ``/metrics`` reports the sum over all of them. The directory must exist and be emptied
+before the processes start. Without it each process only reports its own samples.
+"""
+import logging
+import time
+from contextlib import contextmanager
+from functools import lru_cache
+
+# settings first: it loads .env, and prometheus_client picks its value storage from the environment on import
+from src.settings import METRICS_BROKER_TIMEOUT, METRICS_QUEUE_DEPTH, PROMETHEUS_MULTIPROC_DIR
+
+from prometheus_client import REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess
+from prometheus_client.core import GaugeMetricFamily
+
+logger = logging.getLogger("app")
+
+# a single search stage ranges from microseconds (cache hit) to minutes (unselective scan)
+_STAGE_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds",
+    "Time to the response headers, by route template",
+    ["method", "route", "status"],
+)
+SEARCH_STAGE = Histogram(
+    "search_stage_duration_seconds",
+    "Time spent in one step of a substructure search; chunked and sharded scans observe parse/match once per call",
+    ["stage"],
+    buckets=_STAGE_BUCKETS,
+)
+CACHE_LOOKUPS = Counter("search_cache_lookups_total", "Search cache lookups by tier and outcome", ["tier", "result"])
+SCREEN_MOLECULES = Counter(
+    "search_screen_molecules_total",
+    "Molecules put through the fingerprint screen (result=screened) and those passing it (result=passed)",
+    ["result"],
+)
+CPU_JOBS_IN_FLIGHT = Gauge(
+    "cpu_jobs_in_flight", "RDKit jobs queued or running on the CPU executor", multiprocess_mode="livesum"
+)
+CPU_JOBS_REJECTED = Counter("cpu_jobs_rejected_total", "CPU jobs turned away with a 503 because the executor was full")
+TASK_DURATION = Histogram(
+    "celery_task_duration_seconds", "Celery task run time", ["task", "state"], buckets=_STAGE_BUCKETS
+)
+
+
+def observe_stage(stage: str, seconds: float):
+    SEARCH_STAGE.labels(stage).observe(seconds)
+
+
+@contextmanager
+def stage_timer(stage: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(stage, time.perf_counter() - start)
+
+
+class ScanTimer:
+    """Accumulates per-molecule stage times over a scan and observes each stage once at the end.
+
+    ``start()`` marks the clock, ``lap(stage)`` charges the time since the last mark to ``stage``.
+    """
+
+    def __init__(self):
+        self.totals: dict[str, float] = {}
+        self._mark = time.perf_counter()
+
+    def start(self):
+        self._mark = time.perf_counter()
+
+    def lap(self, stage: str):
+        now = time.perf_counter()
+        self.totals[stage] = self.totals.get(stage, 0.0) + now - self._mark
+        self._mark = now
+
+    def observe(self):
+        for stage, seconds in self.totals.items():
+            observe_stage(stage, seconds)
+
+
+def record_screen(screened: int, passed: int):
+    SCREEN_MOLECULES.labels("screened").inc(screened)
+    SCREEN_MOLECULES.labels("passed").inc(passed)
+
+
+def _queue_depth_family() -> GaugeMetricFamily:
+    return GaugeMetricFamily("celery_queue_depth", "Messages waiting in a Celery queue", labels=["queue"])
+
+
+class QueueDepthCollector:
+    """Reports the number of messages waiting in each Celery queue, read from the broker at scrape time."""
+
+    def describe(self):
+        # registering must not touch the broker
+        return [_queue_depth_family()]
+
+    def collect(self):
+        from src.celery_app import celery_app
+
+        if not METRICS_QUEUE_DEPTH or celery_app.conf.task_always_eager:
+            return
+        queues = {celery_app.conf.task_default_queue, *(q.name for q in celery_app.conf.task_queues or ())}
+        depth = _queue_depth_family()
+        try:
+            with celery_app.connection_for_read(connect_timeout=METRICS_BROKER_TIMEOUT) as conn:
+                # a scrape should fail fast rather than wait out the broker's reconnect policy
+                conn.ensure_connection(max_retries=1)
+                channel = conn.default_channel
+                for queue in sorted(queues):
+                    depth.add_metric([queue], channel.queue_declare(queue=queue, passive=True).message_count)
+        except Exception as e:
+            logger.warning("Failed to read Celery queue depths: %s", e)
+            return
+        yield depth
+
+
+@lru_cache(maxsize=1)
+def scrape_registry() -> CollectorRegistry:
+    if PROMETHEUS_MULTIPROC_DIR:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    registry.register(QueueDepthCollector())
+    return registry
+
+
+def render_metrics() -> bytes:
+    """The exposition text for a scrape; blocking (reads the broker), so run it off the event loop."""
+    return generate_latest(scrape_registry())
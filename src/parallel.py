@@ -0,0 +1,237 @@
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from typing import Optional
+
+from src.chemistry import compile_pattern, mol_from_row
+from src.metrics import ScanTimer
+from src.settings import SEARCH_CHUNK_SIZE, SEARCH_WORKERS
+
+logger = logging.getLogger("app")
+
+# --- worker side: each shard process keeps its own pre-parsed molecules ---
+
+_MOLS: dict = {}
+
+
+def _shard_load(rows, reset: bool = False):
+    if reset:
+        _MOLS.clear()
+    for id, smiles, mol_pkl in rows:
+        mol = mol_from_row(smiles, mol_pkl)
+        if mol is None:
+            _MOLS.pop(id, None)
+        else:
+            _MOLS[id] = mol
+    return len(_MOLS)
+
+
+def _shard_drop(ids):
+    for id in ids:
+        _MOLS.pop(id, None)
+    return len(_MOLS)
+
+
+@lru_cache(maxsize=256)
+def _shard_pattern(substructure: str):
+    pattern, _ = compile_pattern(substructure)
+    return pattern
+
+
+def _shard_match(substructure: str, rows, limit: Optional[int] = None):
+    """Positions (within ``rows``) of molecules matching ``substructure``, at most ``limit`` of them."""
+    pattern = _shard_pattern(substructure)
+    if pattern is None:
+        return []
+    hits = []
+    timer = ScanTimer()
+    for i, (id, smiles, mol_pkl) in enumerate(rows):
+        timer.start()
+        mol = _MOLS.get(id)
+        if mol is None:
+            mol = mol_from_row(smiles, mol_pkl)
+            timer.lap("parse")
+            if mol is None:
+                continue
+        try:
+            found = mol.HasSubstructMatch(pattern)
+        except Exception:
+            found = False
+        timer.lap("match")
+        if found:
+            hits.append(i)
+            if limit is not None and len(hits) >= limit:
+                break
+    timer.observe()
+    return hits
+
+
+def _shard_match_many(substructures: list[str], rows, members: list[list[int]], limit: Optional[int] = None):
+    """Per pattern, positions (within ``rows``) of matching molecules; ``members`` as in ``match_rows_many``."""
+    patterns = [_shard_pattern(substructure) for substructure in substructures]
+    hits: list[list[int]] = [[] for _ in substructures]
+    timer = ScanTimer()
+    for i, ((id, smiles, mol_pkl), wanted) in enumerate(zip(rows, members)):
+        wanted = [p for p in wanted if patterns[p] is not None and (limit is None or len(hits[p]) < limit)]
+        if not wanted:
+            continue
+        timer.start()
+        mol = _MOLS.get(id)
+        if mol is None:
+            mol = mol_from_row(smiles, mol_pkl)
+            timer.lap("parse")
+            if mol is None:
+                continue
+        for p in wanted:
+            try:
+                if mol.HasSubstructMatch(patterns[p]):
+                    hits[p].append(i)
+            except Exception:
+                continue
+        timer.lap("match")
+    timer.observe()
+    return hits
+
+
+# --- coordinator side ---
+
+
+class ParallelSearchEngine:
+    """Substructure matching sharded across persistent single-process executors.
+
+    Molecules are assigned to a shard by id, so every shard process keeps the parsed mols it
+    owns between searches. Candidates are scanned in rounds of ``workers * chunk_size`` rows;
+    once ``limit`` hits are collected no further rounds are dispatched.
+    """
+
+    def __init__(self, workers: int, chunk_size: int = SEARCH_CHUNK_SIZE):
+        ctx = multiprocessing.get_context("spawn")
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self._shards = [ProcessPoolExecutor(max_workers=1, mp_context=ctx) for _ in range(workers)]
+        self._next = 0
+        # ids whose mol was sent to their shard by load/upsert; each shard runs its calls in submission order
+        self._held: set = set()
+
+    def _shard_of(self, id) -> int:
+        return hash(id) % self.workers
+
+    def _partition(self, rows):
+        parts = [[] for _ in range(self.workers)]
+        for pos, row in enumerate(rows):
+            parts[self._shard_of(row[0])].append((pos, row))
+        return parts
+
+    def load(self, rows):
+        """Replace the parsed molecules held by every shard with ``(id, smiles, mol_pkl)`` rows."""
+        parts = self._partition(rows)
+        self._held = {row[0] for part in parts for _, row in part}
+        futures = [
+            shard.submit(_shard_load, [row for _, row in part], True)
+            for shard, part in zip(self._shards, parts)
+        ]
+        total = sum(f.result() for f in futures)
+        logger.info("Parallel search engine loaded %d molecules across %d workers", total, self.workers)
+
+    def upsert_many(self, rows):
+        """Send ``(id, smiles, mol_pkl)`` rows to their shards, one call per shard."""
+        for shard, part in zip(self._shards, self._partition(rows)):
+            if part:
+                shard.submit(_shard_load, [row for _, row in part])
+                self._held.update(row[0] for _, row in part)
+
+    def remove_many(self, ids):
+        parts = [[] for _ in range(self.workers)]
+        for id in ids:
+            self._held.discard(id)
+            parts[self._shard_of(id)].append(id)
+        for shard, part in zip(self._shards, parts):
+            if part:
+                shard.submit(_shard_drop, part)
+
+    def _shard_rows(self, part):
+        """Rows to ship to a shard: the binary only for molecules it does not hold yet."""
+        held = self._held
+        return [row if row[0] not in held else (row[0], row[1], None) for _, row in part]
+
+    def search(self, substructure: str, rows, limit: Optional[int] = None) -> list[str]:
+        """Match ``(id, smiles, mol_pkl)`` candidate rows and return hit SMILES in candidate order."""
+        rows = list(rows)
+        round_size = len(rows) if limit is None else max(self.workers * self.chunk_size, 1)
+        hits: list[str] = []
+        for start in range(0, len(rows), max(round_size, 1)):
+            batch = rows[start:start + round_size]
+            futures = []
+            for shard, part in zip(self._shards, self._partition(batch)):
+                if not part:
+                    continue
+                positions = [pos for pos, _ in part]
+                futures.append((positions, shard.submit(_shard_match, substructure, self._shard_rows(part), limit)))
+            matched = sorted(positions[i] for positions, f in futures for i in f.result())
+            hits.extend(batch[pos][1] for pos in matched)
+            if limit is not None and len(hits) >= limit:
+                return hits[:limit]
+        return hits
+
+    def search_many(
+            self, substructures: list[str], rows, members: list[list[int]], limit: Optional[int] = None
+    ) -> list[list[str]]:
+        """Batch form of :meth:`search`: one pass over ``rows``, hit SMILES per pattern in candidate order.
+
+        ``members[i]`` lists the patterns to try on ``rows[i]``. Each shard stops a pattern at ``limit``.
+        """
+        rows = list(rows)
+        futures = []
+        for shard, part in zip(self._shards, self._partition(rows)):
+            if not part:
+                continue
+            positions = [pos for pos, _ in part]
+            shard_members = [members[pos] for pos in positions]
+            futures.append(
+                (positions, shard.submit(_shard_match_many, substructures, self._shard_rows(part), shard_members, limit))
+            )
+        found = [(positions, f.result()) for positions, f in futures]
+        hits = []
+        for p in range(len(substructures)):
+            matched = sorted(positions[i] for positions, shard_hits in found for i in shard_hits[p])
+            hits.append([rows[pos][1] for pos in matched][:limit])
+        return hits
+
+    def submit(self, fn, *args):
+        """Run a picklable function on the next shard process, round-robin."""
+        shard = self._shards[self._next % self.workers]
+        self._next += 1
+        return shard.submit(fn, *args)
+
+    def shutdown(self):
+        for shard in self._shards:
+            shard.shutdown(wait=False, cancel_futures=True)
+
+
+_engine: Optional[ParallelSearchEngine] = None
+# searches call get_search_engine from CPU executor threads; only one of them may start the pool
+_engine_lock = threading.Lock()
+
+
+def get_search_engine() -> Optional[ParallelSearchEngine]:
+    """The process-wide engine, or None when ``SEARCH_WORKERS`` is below 2."""
+    global _engine
+    if _engine is None and SEARCH_WORKERS > 1:
+        with _engine_lock:
+            if _engine is None:
+                _engine = ParallelSearchEngine(SEARCH_WORKERS)
+    return _engine
+
+
+def current_search_engine() -> Optional[ParallelSearchEngine]:
+    return _engine
+
+
+def shutdown_search_engine():
+    global _engine
+    with _engine_lock:
+        if _engine is not None:
+            _engine.shutdown()
+            _engine = None
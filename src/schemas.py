@@ -1,7 +1,9 @@
-from typing import Optional
+from typing import Annotated, Optional, Union
 from uuid import UUID
 from pydantic import BaseModel, Field
 
+from src.chemistry import DESCRIPTORS
+
 
 class MoleculeCreate(BaseModel):
     """Create a new molecule."""
@@ -19,25 +21,92 @@ class MoleculeOut(BaseModel):
     smiles: str = Field(..., description="SMILES notation")
 
 
-class TaskRequest(BaseModel):
+class PropertyFilters(BaseModel):
+    """Inclusive descriptor windows; matched in SQL before any substructure matching."""
+    mw_min: Optional[float] = Field(None, ge=0, description="Minimum molecular weight")
+    mw_max: Optional[float] = Field(None, ge=0, description="Maximum molecular weight")
+    clogp_min: Optional[float] = Field(None, description="Minimum Crippen cLogP")
+    clogp_max: Optional[float] = Field(None, description="Maximum Crippen cLogP")
+    hbd_min: Optional[int] = Field(None, ge=0, description="Minimum H-bond donors")
+    hbd_max: Optional[int] = Field(None, ge=0, description="Maximum H-bond donors")
+    hba_min: Optional[int] = Field(None, ge=0, description="Minimum H-bond acceptors")
+    hba_max: Optional[int] = Field(None, ge=0, description="Maximum H-bond acceptors")
+    tpsa_min: Optional[float] = Field(None, ge=0, description="Minimum topological polar surface area")
+    tpsa_max: Optional[float] = Field(None, ge=0, description="Maximum topological polar surface area")
+    heavy_atoms_min: Optional[int] = Field(None, ge=0, description="Minimum heavy atom count")
+    heavy_atoms_max: Optional[int] = Field(None, ge=0, description="Maximum heavy atom count")
+
+    def property_ranges(self) -> Optional[dict]:
+        """``{descriptor: [min, max]}`` for the windows that are set (None for an open side), or None."""
+        ranges = {}
+        for name in DESCRIPTORS:
+            lo, hi = getattr(self, f"{name}_min"), getattr(self, f"{name}_max")
+            if lo is not None or hi is not None:
+                ranges[name] = [lo, hi]
+        return ranges or None
+
+
+class ExplainOptions(BaseModel):
+    """Opt-in diagnostics for a substructure search."""
+    explain: bool = Field(
+        False, description="Report the screening strategy, row counts and time per stage, and the slowest matches "
+                           "(runs uncached, matching serially)"
+    )
+    profile: bool = Field(False, description="Also capture a cProfile of the search (admin only, implies explain)")
+
+
+class TaskRequest(PropertyFilters, ExplainOptions):
     """Async task request."""
-    substructure: str = Field(..., description="SMILES/SMARTS pattern to search")
+    substructure: str = Field(..., max_length=4096, description="SMILES/SMARTS pattern to search")
     limit: Optional[int] = Field(None, ge=1, le=10_000, description="Maximum number of results to return")
+    shards: Optional[int] = Field(
+        None, ge=1, le=256,
+        description="Split the scan into this many id-range subtasks run in parallel by the workers "
+                    "(default SEARCH_TASK_SHARDS)",
+    )
 
 
 class TaskStatus(BaseModel):
     """Task status response."""
     task_id: str = Field(..., description="Task identifier")
-    status: str = Field(..., description="Status: PENDING, SUCCESS, FAILURE")
-    result: Optional[list[str]] = Field(None, description="Results when status is SUCCESS")
+    status: str = Field(..., description="Status: PENDING, PROGRESS, SUCCESS, FAILURE, REVOKED")
+    result: Optional[Union[list[str], list[dict], dict]] = Field(None, description="Results when status is SUCCESS")
+    progress: Optional[dict] = Field(
+        None, description="While running: molecules scanned, candidates and hits so far (per shard when sharded)"
+    )
+    partial: Optional[list[str]] = Field(None, description="Hits found so far while a search is running")
 
 
-class SubstructureQueryParams(BaseModel):
+class SubstructureQueryParams(PropertyFilters, ExplainOptions):
     """Substructure search parameters."""
-    substructure: str = Field(..., description="SMILES/SMARTS pattern")
+    substructure: str = Field(..., max_length=4096, description="SMILES/SMARTS pattern")
     limit: Optional[int] = Field(None, ge=1, le=10_000, description="Maximum number of results to return")
 
 
+class ExplainStage(BaseModel):
+    stage: str = Field(..., description="compile, db_fetch, screen, parse or match")
+    ms: float
+    rows_in: Optional[int] = Field(None, description="Molecules entering the stage")
+    rows_out: Optional[int] = Field(None, description="Molecules left after it")
+
+
+class SlowMatch(BaseModel):
+    smiles: str
+    ms: float = Field(..., description="Time of the HasSubstructMatch call")
+
+
+class SearchExplain(BaseModel):
+    """How a substructure search was executed."""
+    query_type: Optional[str] = Field(None, description="smarts or smiles: how the query was parsed")
+    screen_bits: int = Field(..., description="Bits set in the query's screening fingerprint (0: no screen)")
+    strategy: str = Field(
+        ..., description="index (in-memory fingerprint screen), sql (screen in the candidate query) or none"
+    )
+    stages: list[ExplainStage]
+    slowest_matches: list[SlowMatch]
+    profile: Optional[str] = Field(None, description="cProfile report, top functions by cumulative time")
+
+
 class SubstructureSearchResponse(BaseModel):
     """Substructure search results."""
     substructure: str
@@ -45,3 +114,46 @@ class SubstructureSearchResponse(BaseModel):
     count: int = Field(..., description="Number of matches found")
     hits: list[str] = Field(..., description="Matching SMILES")
     cached: bool = Field(False, description="Result from cache")
+    explain: Optional[SearchExplain] = Field(None, description="Present when explain was requested")
+
+
+class BatchSearchRequest(BaseModel):
+    """Batch substructure search: many patterns in one pass over the library."""
+    substructures: list[Annotated[str, Field(max_length=4096)]] = Field(
+        ..., min_length=1, max_length=1000, description="SMILES/SMARTS patterns", examples=[["c1ccccc1", "C(=O)O"]]
+    )
+    limit: Optional[int] = Field(None, ge=1, le=10_000, description="Maximum number of results per pattern")
+
+
+class BatchSearchResult(BaseModel):
+    substructure: str
+    count: int = Field(..., description="Number of matches found")
+    hits: list[str] = Field(..., description="Matching SMILES")
+    cached: bool = Field(False, description="Result from cache")
+
+
+class BatchSearchResponse(BaseModel):
+    """Batch substructure search results, one entry per pattern in request order."""
+    limit: Optional[int]
+    results: list[BatchSearchResult]
+
+
+class SimilarityQuery(BaseModel):
+    """Similarity search parameters."""
+    smiles: str = Field(..., min_length=1, max_length=4096, description="Query SMILES", examples=["CC(=O)Oc1ccccc1C(=O)O"])
+    threshold: float = Field(0.7, ge=0.0, le=1.0, description="Minimum Tanimoto similarity")
+    k: int = Field(10, ge=1, le=1000, description="Maximum number of results (best first)")
+
+
+class SimilarityHit(BaseModel):
+    smiles: str
+    similarity: float = Field(..., description="Tanimoto similarity of Morgan fingerprints (radius 2, 2048 bits)")
+
+
+class SimilaritySearchResponse(BaseModel):
+    """Similarity search results."""
+    smiles: str
+    threshold: float
+    k: int
+    count: int = Field(..., description="Number of hits returned")
+    hits: list[SimilarityHit] = Field(..., description="Most similar molecules, best first")
@@ -0,0 +1,130 @@
+from typing import Optional
+
+import numpy as np
+
+from src.chemistry import SIM_FP_SIZE
+
+_BLOCK_ROWS = 4096
+_EMPTY = bytes(SIM_FP_SIZE // 8)
+
+
+def _words(rows: int) -> int:
+    return max(1, -(-rows // 64))
+
+
+def _bits(fp: Optional[bytes]) -> np.ndarray:
+    if fp is None or len(fp) != SIM_FP_SIZE // 8:
+        return np.zeros(SIM_FP_SIZE, dtype=np.uint64)
+    return np.unpackbits(np.frombuffer(fp, dtype=np.uint8), bitorder="little").astype(np.uint64)
+
+
+class SimilarityMatrix:
+    """Packed similarity fingerprints stored bit-sliced for Tanimoto scans.
+
+    ``planes[b]`` holds bit ``b`` of every row, 64 rows per ``uint64`` word (row ``r`` is bit
+    ``r % 64`` of word ``r // 64``). Scoring a query therefore reads only the planes of its
+    on bits (~50 of 2048 for Morgan) and adds them up with bit-sliced counters, instead of
+    popcounting the whole row-major matrix. ``counts`` holds each row's popcount.
+    """
+
+    def __init__(self, capacity: int = 1024):
+        self.planes = np.zeros((SIM_FP_SIZE, _words(capacity)), dtype=np.uint64)
+        self.counts = np.zeros(capacity, dtype=np.uint16)
+
+    @classmethod
+    def from_fingerprints(cls, fps: list[Optional[bytes]]) -> "SimilarityMatrix":
+        """Bulk-build from packed fingerprints (row ``i`` = ``fps[i]``), transposing 64-row blocks at once."""
+        n = len(fps)
+        matrix = cls(max(n, 1024))
+        if not n:
+            return matrix
+        padded = -(-n // 64) * 64
+        raw = b"".join(fp if fp is not None and len(fp) == len(_EMPTY) else _EMPTY for fp in fps)
+        packed = np.frombuffer(raw + _EMPTY * (padded - n), dtype=np.uint8).reshape(padded, -1)
+        for start in range(0, padded, _BLOCK_ROWS):
+            bits = np.unpackbits(packed[start:start + _BLOCK_ROWS], axis=1, bitorder="little")
+            stop = min(start + len(bits), n)
+            matrix.counts[start:stop] = bits.sum(axis=1)[:stop - start]
+            # (rows, bits) -> (bits, blocks of 64 rows, 64) -> one uint64 per bit and block
+            blocks = np.packbits(bits.reshape(-1, 64, SIM_FP_SIZE).transpose(2, 0, 1), axis=2, bitorder="little")
+            words = np.ascontiguousarray(blocks).view(np.uint64)[..., 0]
+            matrix.planes[:, start // 64:start // 64 + words.shape[1]] = words
+        return matrix
+
+    def reserve(self, rows: int):
+        if rows > len(self.counts):
+            counts = np.zeros(max(rows, len(self.counts) * 2), dtype=np.uint16)
+            counts[:len(self.counts)] = self.counts
+            self.counts = counts
+        if _words(rows) > self.planes.shape[1]:
+            planes = np.zeros((SIM_FP_SIZE, _words(len(self.counts))), dtype=np.uint64)
+            planes[:, :self.planes.shape[1]] = self.planes
+            self.planes = planes
+
+    def _write(self, row: int, bits: np.ndarray):
+        word, shift = divmod(row, 64)
+        column = self.planes[:, word]
+        column &= ~np.uint64(1 << shift)
+        column |= bits << np.uint64(shift)
+        self.counts[row] = int(bits.sum())
+
+    def set_rows(self, rows: list[int], fps: list[Optional[bytes]]):
+        """Overwrite distinct ``rows`` with packed fingerprints, updating each 64-row word in one go."""
+        if not rows:
+            return
+        self.reserve(max(rows) + 1)
+        rows = np.asarray(rows, dtype=np.int64)
+        order = np.argsort(rows, kind="stable")
+        rows = rows[order]
+        raw = b"".join(fp if fp is not None and len(fp) == len(_EMPTY) else _EMPTY for fp in fps)
+        packed = np.frombuffer(raw, dtype=np.uint8).reshape(len(fps), -1)[order]
+        bits = np.unpackbits(packed, axis=1, bitorder="little")
+        self.counts[rows] = bits.sum(axis=1)
+        words, starts = np.unique(rows // 64, return_index=True)
+        shifted = bits.astype(np.uint64) << (rows % 64).astype(np.uint64)[:, None]
+        # per word: the bits of the rows being written, and those rows' new values
+        masks = np.bitwise_or.reduceat(np.uint64(1) << (rows % 64).astype(np.uint64), starts)
+        values = np.bitwise_or.reduceat(shifted, starts, axis=0)
+        self.planes[:, words] = (self.planes[:, words] & ~masks) | values.T
+
+    def move_row(self, src: int, dst: int):
+        """Copy row ``src`` into ``dst`` and clear ``src`` (swap-removal of ``dst``)."""
+        word, shift = divmod(src, 64)
+        self._write(dst, (self.planes[:, word] >> np.uint64(shift)) & np.uint64(1))
+        self.clear_row(src)
+
+    def clear_row(self, row: int):
+        self._write(row, np.zeros(SIM_FP_SIZE, dtype=np.uint64))
+
+    def intersections(self, fp: bytes, n: int) -> np.ndarray:
+        """``popcount(row & fp)`` for the first ``n`` rows."""
+        on_bits = np.flatnonzero(_bits(fp))
+        words = _words(n)
+        # bit-sliced counters: counters[i] holds bit i of every row's running count
+        counters = [np.zeros(words, dtype=np.uint64) for _ in range(max(1, len(on_bits).bit_length()))]
+        for bit in on_bits:
+            carry = self.planes[bit, :words]
+            for counter in counters:
+                new_carry = counter & carry
+                counter ^= carry
+                carry = new_carry
+                if not carry.any():
+                    break
+        total = np.zeros(words * 64, dtype=np.uint16)
+        for i, counter in enumerate(counters):
+            total += np.unpackbits(counter.view(np.uint8), bitorder="little").astype(np.uint16) << i
+        return total[:n]
+
+    def search(self, fp: bytes, n: int, threshold: float, k: int) -> list[tuple[int, float]]:
+        """Top-``k`` ``(row, tanimoto)`` among the first ``n`` rows scoring at least ``threshold``, best first."""
+        if n == 0:
+            return []
+        common = self.intersections(fp, n).astype(np.float32)
+        union = self.counts[:n].astype(np.float32) + float(_bits(fp).sum()) - common
+        scores = np.divide(common, union, out=np.zeros(n, dtype=np.float32), where=union > 0)
+        rows = np.flatnonzero(scores >= np.float32(threshold))
+        if len(rows) > k:
+            rows = rows[np.argpartition(-scores[rows], k - 1)[:k]]
+        # best first; ties broken by row so results are stable
+        rows = rows[np.lexsort((rows, -scores[rows]))]
+        return [(int(row), float(scores[row])) for row in rows]
@@ -0,0 +1,103 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable, Optional
+from uuid import uuid4
+
+import redis.asyncio as redis
+
+from src.settings import SINGLEFLIGHT_LEASE_SECONDS, SINGLEFLIGHT_WAIT_SECONDS
+
+logger = logging.getLogger("app")
+
+_POLL_INITIAL = 0.05
+_POLL_MAX = 0.5
+
+RELEASE_LEASE_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+
+class SingleFlight:
+    """Coalesces concurrent calls with the same key inside one process.
+
+    The first caller runs ``fn``; everyone arriving while it is in flight awaits the same result.
+    If the caller running ``fn`` is cancelled, one of the waiters takes over with its own ``fn``
+    (which closes over its own request's resources) instead of the whole group failing.
+    """
+
+    def __init__(self):
+        self._inflight: dict[str, asyncio.Future] = {}
+
+    def __len__(self):
+        return len(self._inflight)
+
+    async def do(self, key: str, fn: Callable[[], Awaitable]):
+        while (fut := self._inflight.get(key)) is not None:
+            try:
+                return await asyncio.shield(fut)
+            except asyncio.CancelledError:
+                # our own cancellation propagates; a cancelled leader means the next waiter leads
+                if not fut.cancelled() or asyncio.current_task().cancelling():
+                    raise
+        fut = asyncio.get_running_loop().create_future()
+        self._inflight[key] = fut
+        try:
+            result = await fn()
+        except asyncio.CancelledError:
+            fut.cancel()
+            raise
+        except Exception as e:
+            fut.set_exception(e)
+            # followers re-raise it; mark retrieved so a leader-only failure is not logged twice
+            fut.exception()
+            raise
+        else:
+            fut.set_result(result)
+            return result
+        finally:
+            if self._inflight.get(key) is fut:
+                del self._inflight[key]
+
+
+search_flight = SingleFlight()
+
+
+async def acquire_lease(cache: redis.Redis, name: str, ttl: float = SINGLEFLIGHT_LEASE_SECONDS) -> Optional[str]:
+    """Try to become the one replica computing ``name``; returns the lease token, or None if taken.
+
+    Redis errors fail open (the caller computes) rather than stalling requests.
+    """
+    token = uuid4().hex
+    try:
+        acquired = await cache.set(f"lease:{name}", token, nx=True, px=int(ttl * 1000))
+    except Exception as e:
+        logger.warning("Lease acquisition failed for %s: %s", name, e)
+        return token
+    return token if acquired else None
+
+
+async def release_lease(cache: redis.Redis, name: str, token: str):
+    # atomic, so a lease that expired and was taken over in between is never deleted; best effort
+    try:
+        await cache.eval(RELEASE_LEASE_SCRIPT, 1, f"lease:{name}", token)
+    except Exception:
+        pass
+
+
+async def wait_for(probe: Callable[[], Awaitable], timeout: float = SINGLEFLIGHT_WAIT_SECONDS):
+    """Poll ``probe`` with backoff until it returns a non-None value or ``timeout`` passes."""
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    delay = _POLL_INITIAL
+    while True:
+        value = await probe()
+        if value is not None:
+            return value
+        remaining = deadline - loop.time()
+        if remaining <= 0:
+            return None
+        await asyncio.sleep(min(delay, remaining))
+        delay = min(delay * 2, _POLL_MAX)
@@ -1,25 +1,184 @@
 import asyncio
+import os
+from itertools import chain, islice
 from typing import Optional
+from uuid import UUID, uuid4
+
+import redis.asyncio as redis
+from celery import chord, group, states
+from celery.exceptions import Ignore
 
 from src.celery_app import celery_app
-from src.chemistry import substructure_search
-from src.db import db_session_scope
-from src.utils import _get_smiles_list
+from src.db import SessionLocal, read_session_scope
+from src.index import molecule_index
+from src.ingest import file_chunks, ingest_records, parse_records
+from src.parallel import get_search_engine
+from src.settings import REDIS_URL
+from src.utils import (
+    _cached_batch_search,
+    _bump_committed,
+    _explain_search,
+    _search_shard,
+    _search_with_progress,
+    _shard_bounds,
+    _similarity_search,
+)
+
+
+_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+def _run_async(coro):
+    """Run ``coro`` on this process's long-lived loop, so pooled DB connections survive between tasks."""
+    global _loop
+    if _loop is None or _loop.is_closed():
+        _loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(_loop)
+    return _loop.run_until_complete(coro)
+
+
+def warm_worker_index():
+    """Build the process-resident index once; tasks then only refresh it from the change journal.
+
+    The parallel search engine (with ``SEARCH_WORKERS`` > 1) is started and its shards are
+    loaded from the index, so the first large search does not pay for either.
+    """
+    async def _load():
+        async with read_session_scope() as db:
+            await molecule_index.load(db)
+
+    _run_async(_load())
+    engine = get_search_engine()
+    if engine is not None:
+        engine.load(molecule_index.candidate_rows())
+
+
+@celery_app.task(name="tasks.substructure_search_db", bind=True)
+def substructure_search_db(
+        self,
+        substructure: str,
+        limit: Optional[int] = None,
+        ranges: Optional[dict] = None,
+        explain: bool = False,
+        profile: bool = False,
+):
+    """Hits of ``substructure``; with ``explain`` a ``{"hits", "explain"}`` dict (see ``_explain_search``)."""
+    if explain or profile:
+        async def _explain():
+            async with read_session_scope() as db:
+                return await _explain_search(db, substructure, limit, ranges, profile)
+
+        hits, report = _run_async(_explain())
+        return {"hits": hits, "explain": report}
+
+    def _report(progress: dict):
+        self.update_state(state="PROGRESS", meta=progress)
+
+    async def _run():
+        cache = redis.from_url(REDIS_URL, decode_responses=True)
+        try:
+            async with read_session_scope() as db:
+                return await _search_with_progress(
+                    db, cache, substructure, limit, self.request.id, _report, ranges=ranges
+                )
+        finally:
+            await cache.aclose()
+
+    hits, cancelled = _run_async(_run())
+    if cancelled:
+        self.update_state(state=states.REVOKED, meta={"hits": len(hits), "partial": hits})
+        raise Ignore()
+    return hits
+
+
+@celery_app.task(name="tasks.substructure_batch_search_db")
+def substructure_batch_search_db(substructures: list[str], limit: Optional[int] = None):
+    async def _run():
+        cache = redis.from_url(REDIS_URL, decode_responses=True)
+        try:
+            async with read_session_scope() as db:
+                return await _cached_batch_search(db, cache, substructures, limit)
+        finally:
+            await cache.aclose()
+
+    results = _run_async(_run())
+    return [{"substructure": substructure, "hits": hits} for substructure, (hits, _) in zip(substructures, results)]
+
+
+@celery_app.task(name="tasks.similarity_search_db")
+def similarity_search_db(smiles: str, threshold: float = 0.7, k: int = 10):
+    async def _run():
+        async with read_session_scope() as db:
+            return await _similarity_search(db, smiles, threshold, k)
+
+    hits = _run_async(_run())
+    if hits is None:
+        raise ValueError(f"Invalid SMILES string: {smiles!r}")
+    return [{"smiles": hit, "similarity": score} for hit, score in hits]
+
+
+@celery_app.task(name="tasks.search_shard")
+def search_shard(
+        substructure: str,
+        lo: Optional[str],
+        hi: Optional[str],
+        limit: Optional[int],
+        search_id: str,
+        shard: int,
+        ranges: Optional[dict] = None,
+):
+    async def _run():
+        cache = redis.from_url(REDIS_URL, decode_responses=True)
+        try:
+            async with read_session_scope() as db:
+                id_range = (UUID(lo) if lo else None, UUID(hi) if hi else None)
+                return await _search_shard(db, cache, substructure, id_range, limit, search_id, shard, ranges=ranges)
+        finally:
+            await cache.aclose()
 
+    return _run_async(_run())
+
+
+@celery_app.task(name="tasks.merge_shard_hits")
+def merge_shard_hits(results: list[list[str]], limit: Optional[int] = None):
+    # chord results arrive in header order, i.e. ascending id ranges
+    return list(islice(chain.from_iterable(results), limit))
+
+
+def start_sharded_search(substructure: str, limit: Optional[int], shards: int, ranges: Optional[dict] = None):
+    """Fan a search out as one ``search_shard`` per id range, merged by a chord callback.
+
+    Returns the callback's result; its task id also names the search's progress keys in Redis.
+    """
+    search_id = str(uuid4())
+    header = group(
+        search_shard.s(substructure, lo and str(lo), hi and str(hi), limit, search_id, shard, ranges)
+        for shard, (lo, hi) in enumerate(_shard_bounds(shards))
+    )
+    return chord(header)(merge_shard_hits.s(limit).set(task_id=search_id))
+
+
+@celery_app.task(name="tasks.ingest_file", bind=True)
+def ingest_file(self, path: str, filename: Optional[str] = None, fmt: str = "auto"):
+    total_bytes = os.path.getsize(path)
+    progress = {"bytes_read": 0, "total_bytes": total_bytes}
+
+    def _report(stats: dict):
+        self.update_state(state="PROGRESS", meta={**stats, **progress})
 
-@celery_app.task(name="tasks.substructure_search_db")
-def substructure_search_db(substructure: str, limit: Optional[int] = None):
     async def _run():
-        async with db_session_scope() as db:
-            smiles_list = await _get_smiles_list(db)
-        hits = substructure_search(smiles_list, substructure, limit)
-        if limit is not None:
-            hits = hits[:limit]
-        return hits
-
-    loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
+        kind, records = await parse_records(file_chunks(path, progress=progress), filename, fmt)
+        cache = redis.from_url(REDIS_URL, decode_responses=True)
+        try:
+            async with SessionLocal() as db:
+                stats = await ingest_records(
+                    db, records, kind, on_progress=_report, on_commit=lambda: _bump_committed(db, cache)
+                )
+        finally:
+            await cache.aclose()
+        return stats
+
     try:
-        return loop.run_until_complete(_run())
+        return _run_async(_run())
     finally:
-        loop.close()
+        os.unlink(path)
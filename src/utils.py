@@ -1,53 +1,878 @@
+import asyncio
+import base64
+import cProfile
+import io
 import json
+import logging
 import os
-from typing import Optional
+import pstats
+import tempfile
+import time
+from typing import Callable, Optional
 from uuid import UUID
 
 import redis.asyncio as redis
-from fastapi import HTTPException
-from sqlalchemy import select
+from fastapi import BackgroundTasks, HTTPException, UploadFile
+from starlette.concurrency import run_in_threadpool
+from sqlalchemy import String, cast, func, or_, select
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from src.db import Molecule
+from src.cache import decode_payload, encode_payload, generation_memo, local_cache, query_memo, redis_counters
+from src.chemistry import (
+    DESCRIPTORS,
+    compile_pattern,
+    explain_match_rows,
+    fingerprint_to_bytes,
+    match_rows,
+    match_rows_many,
+    normalize_query,
+    query_kind,
+    smiles_key,
+    smiles_similarity_fingerprint,
+)
+from src.db import Molecule, MoleculeChange, db_session_scope, engine as primary_engine
+from src.executor import run_cpu
+from src.index import MoleculeIndex, molecule_index, pop_committed_smiles, refresh_molecule_index, screen_rows_many
+from src.metrics import stage_timer
+from src.parallel import get_search_engine
 from src.schemas import MoleculeOut
-from src.settings import CACHE_TTL_SECONDS
+from src.settings import (
+    CACHE_TTL_SECONDS,
+    INGEST_CHUNK_BYTES,
+    INGEST_SPOOL_DIR,
+    SEARCH_CACHE_REGISTRY_SIZE,
+    SEARCH_CHUNK_SIZE,
+    SEARCH_STREAM_CHUNK,
+    SEARCH_TASK_STATE_TTL,
+)
+from src.similarity import SimilarityMatrix
+from src.singleflight import acquire_lease, release_lease, search_flight, wait_for
+
+logger = logging.getLogger("app")
+
+PATCH_LOOKUP_BATCH = 1000
+PROGRESS_INTERVAL_SECONDS = 0.5
+EXPLAIN_SLOWEST_MATCHES = 10
+PROFILE_TOP_FUNCTIONS = 40
 
 
 def _to_out(m: Molecule):
     return MoleculeOut(id=m.id, smiles=m.smiles)
 
 
-async def _cache_get_json(cache: redis.Redis, key: str):
-    cached = await cache.get(key)
+async def _cache_get_payload(cache: redis.Redis, key: str):
+    """``(value, json_size)`` stored under ``key``, or None if missing or unreadable."""
+    try:
+        cached = await cache.get(key)
+    except Exception:
+        return None
     if not cached:
         return None
     try:
-        return json.loads(cached)
+        return decode_payload(cached)
     except Exception:
         return None
 
 
-async def _cache_set_json(cache: redis.Redis, key: str, value):
+async def _cache_set_payload(cache: redis.Redis, key: str, value) -> int:
+    payload, size = encode_payload(value)
     try:
-        await cache.setex(key, CACHE_TTL_SECONDS, json.dumps(value))
+        await cache.setex(key, CACHE_TTL_SECONDS, payload)
     except Exception:
         pass
+    return size
+
+
+def _property_predicates(ranges: Optional[dict]) -> list:
+    """SQL predicates for ``{descriptor: [min, max]}`` windows; molecules without descriptors never pass."""
+    predicates = []
+    for name, (lo, hi) in (ranges or {}).items():
+        if name not in DESCRIPTORS:
+            raise ValueError(f"Unknown descriptor {name!r}")
+        column = getattr(Molecule, name)
+        if lo is not None:
+            predicates.append(column >= lo)
+        if hi is not None:
+            predicates.append(column <= hi)
+    return predicates
+
+
+def _id_range_predicates(id_range: Optional[tuple], dialect: str) -> list:
+    lo, hi = id_range or (None, None)
+    column = Molecule.id
+    if dialect == "sqlite":
+        # the UUID column has NUMERIC affinity there, so an all-digit bound such as 80000000...
+        # would be compared as a number (below every id); compare the stored hex as text instead
+        column = cast(Molecule.id, String)
+        lo, hi = lo and lo.hex, hi and hi.hex
+    predicates = []
+    if lo is not None:
+        predicates.append(column >= lo)
+    if hi is not None:
+        predicates.append(column < hi)
+    return predicates
+
 
+async def _get_candidate_rows(
+        db: AsyncSession, pattern_fp=None, id_range: Optional[tuple] = None, ranges: Optional[dict] = None
+):
+    """``(id, smiles, mol_pkl)`` of molecules whose stored fingerprint contains every bit of ``pattern_fp``.
 
-async def _get_smiles_list(db: AsyncSession):
-    stmt = select(Molecule.smiles)
+    Rows without a stored fingerprint are always returned so the exact match still sees them.
+    With ``id_range=(lo, hi)`` only ids in ``[lo, hi)`` are read, in id order (None leaves a side open).
+    ``ranges`` are descriptor windows (see :func:`_property_predicates`).
+    """
+    stmt = select(Molecule.id, Molecule.smiles, Molecule.mol_pkl).where(
+        *_id_range_predicates(id_range, db.bind.dialect.name), *_property_predicates(ranges)
+    )
+    if id_range is not None:
+        stmt = stmt.order_by(Molecule.id)
+    if pattern_fp is not None:
+        query_fp = fingerprint_to_bytes(pattern_fp)
+        stmt = stmt.where(
+            or_(
+                Molecule.fingerprint.is_(None),
+                func.fp_contains(Molecule.fingerprint, query_fp),
+            )
+        )
     res = await db.execute(stmt)
+    return [tuple(row) for row in res.all()]
+
+
+def _match_rows(rows, substructure: str, pattern, limit: Optional[int] = None):
+    engine = get_search_engine()
+    if engine is not None:
+        try:
+            return engine.search(substructure, rows, limit)
+        except Exception as e:
+            logger.warning("Parallel search failed, falling back to serial matching: %s", e)
+    return match_rows(rows, pattern, limit)
+
+
+async def _filtered_ids(db: AsyncSession, ranges: dict, id_range: Optional[tuple] = None) -> list:
+    """Ids of molecules inside the descriptor windows, read through the descriptor indexes."""
+    res = await db.execute(
+        select(Molecule.id).where(*_id_range_predicates(id_range, db.bind.dialect.name), *_property_predicates(ranges))
+    )
     return res.scalars().all()
 
 
-def _make_cache_key(substructure: str, limit: Optional[int]):
-    return f"subsearch:{substructure}|limit={limit}"
+async def _candidate_rows(
+        db: AsyncSession, pattern_fp=None, id_range: Optional[tuple] = None, ranges: Optional[dict] = None
+):
+    """Screened candidates; descriptor ``ranges`` are applied in SQL first, so only their ids are screened."""
+    with stage_timer("db_fetch"):
+        if not molecule_index.loaded:
+            # the screen runs inside the query
+            return await _get_candidate_rows(db, pattern_fp, id_range, ranges)
+        await refresh_molecule_index(db)
+        only_ids = await _filtered_ids(db, ranges, id_range) if ranges else None
+    with stage_timer("screen"):
+        return await run_cpu(molecule_index.candidate_rows, pattern_fp, id_range, only_ids)
+
+
+async def _search_substructure_db(
+        db: AsyncSession, substructure: str, limit: Optional[int] = None, ranges: Optional[dict] = None
+):
+    """Screen and match ``substructure``; RDKit work runs on the CPU executor, not the event loop."""
+    pattern, pattern_fp = await run_cpu(compile_pattern, substructure)
+    if pattern is None:
+        return []
+    rows = await _candidate_rows(db, pattern_fp, ranges=ranges)
+    hits = await run_cpu(_match_rows, rows, substructure, pattern, limit)
+    if limit is not None:
+        hits = hits[:limit]
+    return hits
+
+
+def _profiled(profiler: Optional[cProfile.Profile], func, *args):
+    """Call ``func`` with ``profiler`` collecting (it profiles the calling thread only), if given."""
+    if profiler is None:
+        return func(*args)
+    profiler.enable()
+    try:
+        return func(*args)
+    finally:
+        profiler.disable()
+
+
+def _profile_report(profiler: cProfile.Profile) -> str:
+    out = io.StringIO()
+    pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(PROFILE_TOP_FUNCTIONS)
+    return out.getvalue()
+
+
+def _ms(seconds: float) -> float:
+    return round(seconds * 1000, 3)
+
+
+async def _explain_search(
+        db: AsyncSession,
+        substructure: str,
+        limit: Optional[int] = None,
+        ranges: Optional[dict] = None,
+        profile: bool = False,
+) -> tuple[list[str], dict]:
+    """Run :func:`_search_substructure_db` step by step and report how the time was spent.
+
+    Returns ``(hits, explain)``; ``explain`` has the screening ``strategy`` (``index``: the in-memory
+    fingerprint screen, ``sql``: the screen inside the candidate query, ``none``: no usable
+    fingerprint, every molecule is matched), the ``stages`` with their row counts in and out and
+    milliseconds, and the slowest individual matches. Matching runs serially in-process so every
+    molecule can be timed. With ``profile`` the CPU work runs under cProfile and its top functions
+    are included. The cache is neither read nor written.
+    """
+    profiler = cProfile.Profile() if profile else None
+    stages = []
+    start = time.perf_counter()
+    pattern, pattern_fp = await run_cpu(_profiled, profiler, compile_pattern, substructure)
+    stages.append({"stage": "compile", "ms": _ms(time.perf_counter() - start)})
+    explain = {
+        "query_type": await run_cpu(query_kind, substructure),
+        "screen_bits": pattern_fp.GetNumOnBits() if pattern_fp is not None else 0,
+        "strategy": "none" if pattern_fp is None else "index" if molecule_index.loaded else "sql",
+        "stages": stages,
+        "slowest_matches": [],
+        "profile": None,
+    }
+    if pattern is None:
+        return [], explain
+
+    start = time.perf_counter()
+    if molecule_index.loaded:
+        await refresh_molecule_index(db)
+        library = len(molecule_index)
+        only_ids = await _filtered_ids(db, ranges) if ranges else None
+        stages.append({
+            "stage": "db_fetch", "rows_in": library, "rows_out": library if only_ids is None else len(only_ids),
+            "ms": _ms(time.perf_counter() - start),
+        })
+        start = time.perf_counter()
+        rows = await run_cpu(_profiled, profiler, molecule_index.candidate_rows, pattern_fp, None, only_ids)
+        stages.append({
+            "stage": "screen", "rows_in": stages[-1]["rows_out"], "rows_out": len(rows),
+            "ms": _ms(time.perf_counter() - start),
+        })
+    else:
+        # the screen runs inside the candidate query
+        library = (await db.execute(select(func.count()).select_from(Molecule))).scalar_one()
+        start = time.perf_counter()
+        rows = await _get_candidate_rows(db, pattern_fp, ranges=ranges)
+        stages.append({"stage": "db_fetch", "rows_in": library, "rows_out": len(rows), "ms": _ms(time.perf_counter() - start)})
+
+    hits, stats = await run_cpu(
+        _profiled, profiler, explain_match_rows, rows, pattern, limit, EXPLAIN_SLOWEST_MATCHES
+    )
+    stages.append({"stage": "parse", "rows_in": stats["scanned"], "rows_out": stats["parsed"], "ms": _ms(stats["parse_s"])})
+    stages.append({"stage": "match", "rows_in": stats["parsed"], "rows_out": len(hits), "ms": _ms(stats["match_s"])})
+    explain["slowest_matches"] = [{"smiles": smiles, "ms": _ms(seconds)} for smiles, seconds in stats["slowest"]]
+    if profiler is not None:
+        explain["profile"] = _profile_report(profiler)
+    return hits, explain
+
+
+def _compile_patterns(substructures: list[str]) -> list[tuple]:
+    return [compile_pattern(substructure) for substructure in substructures]
+
+
+def _match_rows_many(rows, members: list[list[int]], substructures: list[str], patterns: list, limit: Optional[int]):
+    engine = get_search_engine()
+    if engine is not None:
+        try:
+            return engine.search_many(substructures, rows, members, limit)
+        except Exception as e:
+            logger.warning("Parallel batch search failed, falling back to serial matching: %s", e)
+    return match_rows_many(rows, patterns, members, limit)
+
+
+async def _candidate_rows_many(db: AsyncSession, pattern_fps: list) -> tuple[list[tuple], list[list[int]]]:
+    """``(rows, members)`` over the union of each pattern's screen candidates (see ``candidate_rows_many``)."""
+    if molecule_index.loaded:
+        with stage_timer("db_fetch"):
+            await refresh_molecule_index(db)
+        with stage_timer("screen"):
+            return await run_cpu(molecule_index.candidate_rows_many, pattern_fps)
+    # one read of the table, screened for every pattern at once rather than one fp_contains scan each
+    with stage_timer("db_fetch"):
+        res = await db.execute(select(Molecule.id, Molecule.smiles, Molecule.mol_pkl, Molecule.fingerprint))
+        rows = [tuple(row) for row in res.all()]
+    with stage_timer("screen"):
+        return await run_cpu(screen_rows_many, rows, pattern_fps)
+
+
+async def _search_substructures_db(
+        db: AsyncSession, substructures: list[str], limit: Optional[int] = None
+) -> list[list[str]]:
+    """Batch form of :func:`_search_substructure_db`: hits per pattern from a single pass over the library.
+
+    Every candidate molecule is built once and tried against all patterns whose screen it passed.
+    Patterns that do not parse get no hits.
+    """
+    compiled = await run_cpu(_compile_patterns, substructures)
+    valid = [i for i, (pattern, _) in enumerate(compiled) if pattern is not None]
+    results: list[list[str]] = [[] for _ in substructures]
+    if not valid:
+        return results
+    rows, members = await _candidate_rows_many(db, [compiled[i][1] for i in valid])
+    hits = await run_cpu(
+        _match_rows_many, rows, members, [substructures[i] for i in valid], [compiled[i][0] for i in valid], limit
+    )
+    for i, found in zip(valid, hits):
+        results[i] = found[:limit]
+    return results
+
+
+async def _iter_search_chunks(
+        db: AsyncSession,
+        substructure: str,
+        limit: Optional[int] = None,
+        chunk_size: int = SEARCH_STREAM_CHUNK,
+        progress: Optional[dict] = None,
+        ranges: Optional[dict] = None,
+):
+    """Yield the hits of each ``chunk_size`` slice of candidates as it is matched (possibly empty lists).
+
+    ``progress``, if given, is kept up to date with ``candidates`` and ``scanned`` counts.
+    """
+    pattern, pattern_fp = await run_cpu(compile_pattern, substructure)
+    if pattern is None:
+        return
+    rows = await _candidate_rows(db, pattern_fp, ranges=ranges)
+    if progress is not None:
+        progress.update(candidates=len(rows), scanned=0)
+    remaining = limit
+    for start in range(0, len(rows), chunk_size):
+        chunk = rows[start:start + chunk_size]
+        hits = await run_cpu(_match_rows, chunk, substructure, pattern, remaining)
+        if progress is not None:
+            progress["scanned"] += len(chunk)
+        yield hits
+        if remaining is not None:
+            remaining -= len(hits)
+            if remaining <= 0:
+                return
+
+
+async def _search_with_progress(
+        db: AsyncSession,
+        cache: redis.Redis,
+        substructure: str,
+        limit: Optional[int],
+        search_id: str,
+        on_progress: Callable[[dict], None],
+        interval: float = PROGRESS_INTERVAL_SECONDS,
+        ranges: Optional[dict] = None,
+) -> tuple[list[str], bool]:
+    """Run a search chunk by chunk, reporting ``scanned`` / ``candidates`` / ``hits`` / ``partial`` hits.
+
+    Reports are throttled to one per ``interval`` seconds. Returns ``(hits, cancelled)``: the scan
+    stops early with the hits so far once the search is cancelled (see :func:`_cancel_search`).
+    """
+    progress = {"scanned": 0, "candidates": 0}
+    hits = []
+    last = 0.0
+    async for found in _iter_search_chunks(db, substructure, limit, SEARCH_CHUNK_SIZE, progress, ranges):
+        hits.extend(found)
+        if time.monotonic() - last >= interval:
+            last = time.monotonic()
+            on_progress({**progress, "hits": len(hits), "partial": hits})
+        if await _search_cancelled(cache, search_id):
+            return hits, True
+    return hits[:limit], False
+
+
+def _cancel_key(search_id: str) -> str:
+    return f"search:{search_id}:cancelled"
+
+
+async def _cancel_search(cache: redis.Redis, search_id: str):
+    """Ask a running search (single task or every shard of a sharded one) to stop at its next chunk."""
+    await cache.setex(_cancel_key(search_id), SEARCH_TASK_STATE_TTL, "1")
+
+
+async def _search_cancelled(cache: redis.Redis, search_id: str) -> bool:
+    try:
+        return bool(await cache.get(_cancel_key(search_id)))
+    except Exception:
+        return False
+
+
+def _similar_rows(rows: list, sim_fp: bytes, threshold: float, k: int) -> list[tuple[str, float]]:
+    """Score ``(smiles, morgan_fp)`` rows read straight from the database (no index loaded)."""
+    fps = [fp if fp is not None else smiles_similarity_fingerprint(smiles) for smiles, fp in rows]
+    matrix = SimilarityMatrix.from_fingerprints(fps)
+    return [(rows[row][0], score) for row, score in matrix.search(sim_fp, len(rows), threshold, k)]
+
+
+async def _similarity_search(db: AsyncSession, smiles: str, threshold: float, k: int) -> Optional[list]:
+    """Top-``k`` ``(smiles, tanimoto)`` for a query SMILES; None if it does not parse."""
+    sim_fp = await run_cpu(smiles_similarity_fingerprint, smiles)
+    if sim_fp is None:
+        return None
+    if molecule_index.loaded:
+        await refresh_molecule_index(db)
+        return await run_cpu(molecule_index.similar, sim_fp, threshold, k)
+    res = await db.execute(select(Molecule.smiles, Molecule.morgan_fp))
+    return await run_cpu(_similar_rows, [tuple(row) for row in res.all()], sim_fp, threshold, k)
+
+
+def _shard_bounds(shards: int) -> list[tuple]:
+    """Split the UUID space into ``shards`` equal ``[lo, hi)`` id ranges.
+
+    Ids are random UUIDs, so equal slices of the key space hold about equal numbers of rows
+    and the bounds need no query. Ranges are open-ended at both extremes.
+    """
+    cuts = [UUID(int=(i << 128) // shards) for i in range(1, shards)]
+    return list(zip([None, *cuts], [*cuts, None]))
+
+
+def _shard_keys(search_id: str) -> tuple[str, str]:
+    """Redis keys shared by the shards of one search: per-shard progress hash, and the hit counter."""
+    return f"search:{search_id}:shards", f"search:{search_id}:hits"
+
+
+async def _search_shard(
+        db: AsyncSession,
+        cache: redis.Redis,
+        substructure: str,
+        id_range: tuple,
+        limit: Optional[int],
+        search_id: str,
+        shard: int,
+        chunk_size: int = SEARCH_CHUNK_SIZE,
+        ranges: Optional[dict] = None,
+) -> list[str]:
+    """Scan one id range of a sharded search, publishing progress and partial hits after every chunk.
+
+    All shards add their hits to one Redis counter; a shard stops at the next chunk boundary
+    once the counter reaches ``limit`` or the search is cancelled, so the rest winds down early.
+    """
+    progress_key, hits_key = _shard_keys(search_id)
+    hits = []
+    state = {"scanned": 0, "candidates": 0, "hits": 0, "partial": hits, "done": False, "cancelled": False}
+
+    async def _publish():
+        try:
+            await cache.hset(progress_key, str(shard), json.dumps(state))
+            await cache.expire(progress_key, SEARCH_TASK_STATE_TTL)
+        except Exception as e:
+            logger.warning("Failed to publish progress of shard %d of search %s: %s", shard, search_id, e)
+
+    async def _should_stop():
+        if await _search_cancelled(cache, search_id):
+            return True
+        if limit is None:
+            return False
+        try:
+            return int(await cache.get(hits_key) or 0) >= limit
+        except Exception:
+            return False
+
+    pattern, pattern_fp = await run_cpu(compile_pattern, substructure)
+    rows = await _candidate_rows(db, pattern_fp, id_range, ranges) if pattern is not None else []
+    state["candidates"] = len(rows)
+    await _publish()
+    for start in range(0, len(rows), chunk_size):
+        if await _should_stop():
+            state["cancelled"] = True
+            break
+        remaining = None if limit is None else limit - len(hits)
+        chunk = rows[start:start + chunk_size]
+        found = await run_cpu(match_rows, chunk, pattern, remaining)
+        hits.extend(found)
+        state["scanned"] += len(chunk)
+        state["hits"] = len(hits)
+        if found and limit is not None:
+            try:
+                await cache.incrby(hits_key, len(found))
+                await cache.expire(hits_key, SEARCH_TASK_STATE_TTL)
+            except Exception:
+                pass
+        await _publish()
+        if remaining is not None and len(found) >= remaining:
+            break
+    state["done"] = True
+    await _publish()
+    return hits
+
+
+async def _shard_progress(cache: redis.Redis, search_id: str) -> Optional[list]:
+    """Per-shard progress of a sharded search, in shard order; None if it is not one (or has expired)."""
+    try:
+        shards = await cache.hgetall(_shard_keys(search_id)[0])
+    except Exception:
+        return None
+    if not shards:
+        return None
+    return [{"shard": int(shard), **json.loads(state)} for shard, state in sorted(shards.items(), key=lambda kv: int(kv[0]))]
+
+
+CELERY_META_PREFIX = "celery-task-meta-"
+
+
+async def _get_task_meta(cache: redis.Redis, task_id: str) -> Optional[dict]:
+    """Task state as stored by the Celery Redis result backend, read without blocking the event loop."""
+    try:
+        raw = await cache.get(CELERY_META_PREFIX + task_id)
+        return json.loads(raw) if raw else None
+    except Exception:
+        return None
+
+
+DATASET_GENERATION_KEY = "dataset:generation"
+# newest molecule_changes seq on the primary as of the last bump
+DATASET_SEQ_KEY = "dataset:seq"
+
+# the seq only ever rises, and with the generation in one step: whoever reads a generation reads
+# a seq covering every write bumped into it
+BUMP_GENERATION_SCRIPT = """
+if tonumber(ARGV[1]) > tonumber(redis.call("get", KEYS[2]) or "0") then
+    redis.call("set", KEYS[2], ARGV[1])
+end
+return {redis.call("incr", KEYS[1]), tonumber(redis.call("get", KEYS[2]) or "0")}
+"""
+
+
+async def _get_dataset_version(cache: redis.Redis) -> tuple[int, int]:
+    """``(generation, seq)``: every committed write bumps the generation, retiring older search cache keys,
+    and ``seq`` is the newest journal entry a search must have seen for its result to be cached.
+
+    Read through :data:`generation_memo`, so cache hits do not pay a Redis round trip for it.
+    """
+    version = generation_memo.get()
+    if version is not None:
+        return version
+    try:
+        generation, seq = await cache.mget([DATASET_GENERATION_KEY, DATASET_SEQ_KEY])
+    except Exception:
+        return 0, 0
+    generation_memo.set(int(generation or 0), int(seq or 0))
+    return int(generation or 0), int(seq or 0)
+
+
+async def _get_generation(cache: redis.Redis) -> int:
+    return (await _get_dataset_version(cache))[0]
+
+
+async def _journal_seq() -> int:
+    async with db_session_scope() as db:
+        return (await db.execute(select(func.max(MoleculeChange.seq)))).scalar() or 0
+
+
+async def _bump_generation(cache: redis.Redis) -> Optional[int]:
+    try:
+        generation, seq = await cache.eval(
+            BUMP_GENERATION_SCRIPT, 2, DATASET_GENERATION_KEY, DATASET_SEQ_KEY, await _journal_seq()
+        )
+        generation_memo.set(int(generation), int(seq))
+        return int(generation)
+    except Exception as e:
+        logger.warning("Failed to bump dataset generation, cached searches may be stale: %s", e)
+        return None
+
+
+async def _caught_up(db: AsyncSession, cache: redis.Redis, ranges: Optional[dict] = None) -> bool:
+    """Whether a search on ``db`` from now on sees every write bumped into the current generation.
+
+    A lagging replica, or an index not refreshed since, serves pre-write hits; those are fine to
+    return but must not be cached under the post-write key. The index is refreshed from ``db`` when
+    it lags; reads that go to SQL (no index, or descriptor ``ranges``) need ``db`` to have the
+    journal entry itself.
+    """
+    _, seq = await _get_dataset_version(cache)
+    if molecule_index.loaded:
+        await refresh_molecule_index(db, seq=seq)
+        if not molecule_index.has_applied(seq):
+            return False
+        if not ranges:
+            return True
+    if db.bind is primary_engine:
+        return True
+    return ((await db.execute(select(func.max(MoleculeChange.seq)))).scalar() or 0) >= seq
+
+
+async def _commit_and_bump(db: AsyncSession, cache: redis.Redis, background_tasks: Optional[BackgroundTasks] = None):
+    """Commit the write first, so no search can cache pre-write results under the new generation.
+
+    Cached results of recently searched patterns are then carried over to the new generation,
+    patched for the molecules this session touched, so hot queries stay warm. With
+    ``background_tasks`` that happens after the response is sent rather than before.
+    """
+    await db.commit()
+    await _bump_committed(db, cache, background_tasks)
+
+
+async def _bump_committed(db: AsyncSession, cache: redis.Redis, background_tasks: Optional[BackgroundTasks] = None):
+    """The bump and patch of :func:`_commit_and_bump`, for a session that has just committed itself."""
+    generation = await _bump_generation(cache)
+    touched = pop_committed_smiles(db)
+    if generation is None or not touched:
+        return
+    if background_tasks is not None:
+        background_tasks.add_task(_patch_cached_searches, cache, generation, touched)
+    else:
+        await _patch_cached_searches(cache, generation, touched)
+
+
+SEARCH_REGISTRY_KEY = "subsearch:registry"
+# normalized query -> query as searched, for every pattern in the registry
+SEARCH_QUERIES_KEY = "subsearch:queries"
+
+
+def _make_cache_key(normalized_query: str, generation: int = 0):
+    return f"subsearch:g{generation}:{normalized_query}"
+
+
+def _cache_key_query(key: str) -> str:
+    return key.split(":", 2)[2]
+
+
+def _ranges_suffix(ranges: Optional[dict]) -> str:
+    """Stable cache-key suffix for descriptor windows (empty without any)."""
+    if not ranges:
+        return ""
+    return "|" + ";".join(
+        f"{name}={'' if lo is None else lo}:{'' if hi is None else hi}" for name, (lo, hi) in sorted(ranges.items())
+    )
+
+
+def _normalize_each(substructures: list[str]) -> list[Optional[str]]:
+    return [normalize_query(substructure) for substructure in substructures]
+
+
+async def _normalize_queries(substructures: list[str]) -> list[Optional[str]]:
+    """``normalize_query`` per pattern: remembered ones inline, the rest in one ``run_cpu`` call."""
+    found = {substructure: query_memo.get(substructure) for substructure in substructures}
+    missing = [substructure for substructure, normalized in found.items() if normalized is query_memo.MISSING]
+    if missing:
+        for substructure, normalized in zip(missing, await run_cpu(_normalize_each, missing)):
+            query_memo.set(substructure, normalized)
+            found[substructure] = normalized
+    return [found[substructure] for substructure in substructures]
+
+
+async def _search_cache_key(cache: redis.Redis, substructure: str, ranges: Optional[dict] = None) -> Optional[str]:
+    """Cache key for a query, shared by every spelling and limit of it; None if it cannot be parsed."""
+    normalized, = await _normalize_queries([substructure])
+    if normalized is None:
+        return None
+    return _make_cache_key(normalized + _ranges_suffix(ranges), await _get_generation(cache))
+
+
+async def _search_cache_get(cache: redis.Redis, key: Optional[str], limit: Optional[int]):
+    """Serve ``limit`` hits from a cached entry that is complete or was truncated at ``limit`` or more.
+
+    The in-process tier is consulted first; entries found in Redis are promoted into it.
+    """
+    if key is None:
+        return None
+    with stage_timer("cache_lookup"):
+        entry = local_cache.get(key)
+        if entry is None:
+            found = await _cache_get_payload(cache, key)
+            redis_counters.record(found is not None and isinstance(found[0], dict))
+            if found is None or not isinstance(found[0], dict):
+                return None
+            entry, size = found
+            local_cache.set(key, entry, size)
+    hits = entry.get("hits") or []
+    if entry.get("complete") or (limit is not None and len(hits) >= limit):
+        return hits[:limit]
+    return None
+
+
+async def _search_cache_set(
+        cache: redis.Redis, key: Optional[str], hits: list, limit: Optional[int], substructure: Optional[str] = None
+):
+    if key is None:
+        return
+    # fewer hits than the limit means the scan reached the end of the library
+    entry = {"hits": hits, "complete": limit is None or len(hits) < limit}
+    size = await _cache_set_payload(cache, key, entry)
+    local_cache.set(key, entry, size)
+    if substructure is not None:
+        await _register_cached_query(cache, _cache_key_query(key), substructure)
+
+
+async def _register_cached_query(cache: redis.Redis, normalized: str, substructure: str):
+    """Remember the SEARCH_CACHE_REGISTRY_SIZE most recently cached patterns for write-time patching."""
+    if SEARCH_CACHE_REGISTRY_SIZE <= 0:
+        return
+    try:
+        await cache.hset(SEARCH_QUERIES_KEY, normalized, substructure)
+        await cache.zadd(SEARCH_REGISTRY_KEY, {normalized: time.time()})
+        evicted = await cache.zrange(SEARCH_REGISTRY_KEY, 0, -SEARCH_CACHE_REGISTRY_SIZE - 1)
+        if evicted:
+            await cache.zrem(SEARCH_REGISTRY_KEY, *evicted)
+            await cache.hdel(SEARCH_QUERIES_KEY, *evicted)
+    except Exception as e:
+        logger.warning("Failed to register cached query: %s", e)
+
+
+def _screen_registered_queries(queries: dict, rows: list, removed: set) -> tuple[dict, list]:
+    """Split registered ``queries`` (normalized -> as searched) by whether a write can change their hits.
+
+    Returns ``(affected, unaffected)``: ``affected`` maps each query that a touched row or a
+    ``removed`` SMILES matches to the rows' hits. ``rows`` are ``(id, smiles, fingerprint, mol_pkl,
+    morgan_fp)``; nothing but them and the removed SMILES is matched.
+    """
+    changed = MoleculeIndex()
+    changed.build(rows)
+    gone = [(None, smiles, None) for smiles in removed]
+    affected, unaffected = {}, []
+    for normalized, substructure in queries.items():
+        pattern, pattern_fp = compile_pattern(substructure)
+        if pattern is None:
+            continue
+        added = match_rows(changed.candidate_rows(pattern_fp), pattern)
+        if added or match_rows(gone, pattern, 1):
+            affected[normalized] = added
+        else:
+            unaffected.append(normalized)
+    return affected, unaffected
+
+
+async def _patch_cached_searches(cache: redis.Redis, generation: int, touched: set):
+    """Carry registered entries from ``generation - 1`` to ``generation``, testing only the ``touched`` SMILES.
+
+    Entries the write cannot change are copied inside Redis; only the others are fetched, patched
+    and stored again. The touched molecules are re-read (in a fresh session) after the generation
+    bump, so whatever state a concurrent write left them in, the patch records the current one.
+    Best effort: entries that are not carried over are recomputed on their next search.
+    """
+    try:
+        registered = await cache.zrevrange(SEARCH_REGISTRY_KEY, 0, -1)
+        if not registered:
+            return
+        queries = {
+            normalized: substructure
+            for normalized, substructure in zip(registered, await cache.hmget(SEARCH_QUERIES_KEY, registered))
+            if substructure
+        }
+        if not queries:
+            return
+
+        keys = [smiles_key(smiles) for smiles in touched]
+        rows = []
+        async with db_session_scope() as db:
+            for start in range(0, len(keys), PATCH_LOOKUP_BATCH):
+                res = await db.execute(
+                    select(Molecule.id, Molecule.smiles, Molecule.fingerprint, Molecule.mol_pkl, Molecule.morgan_fp)
+                    .where(Molecule.smiles_key.in_(keys[start:start + PATCH_LOOKUP_BATCH]))
+                )
+                rows.extend(tuple(row) for row in res.all())
+        removed = touched - {row[1] for row in rows}
+
+        affected, unaffected = await run_cpu(_screen_registered_queries, queries, rows, removed)
+        # no replace: a result cached under the new generation since the bump is already current
+        await asyncio.gather(*(
+            cache.copy(_make_cache_key(normalized, generation - 1), _make_cache_key(normalized, generation))
+            for normalized in unaffected
+        ))
+        if not affected:
+            return
+        payloads = await cache.mget([_make_cache_key(normalized, generation - 1) for normalized in affected])
+        for (normalized, added), payload in zip(affected.items(), payloads):
+            try:
+                entry = decode_payload(payload)[0] if payload else None
+            except ValueError:
+                continue
+            if not isinstance(entry, dict):
+                continue
+            hits = [smiles for smiles in entry["hits"] if smiles not in removed]
+            seen = set(hits)
+            entry = {**entry, "hits": hits + [smiles for smiles in added if smiles not in seen]}
+            key = _make_cache_key(normalized, generation)
+            size = await _cache_set_payload(cache, key, entry)
+            local_cache.set(key, entry, size)
+    except Exception as e:
+        logger.warning("Failed to patch cached searches, they will be recomputed: %s", e)
+
+
+async def _cached_search(
+        db: AsyncSession, cache: redis.Redis, substructure: str, limit: Optional[int], ranges: Optional[dict] = None
+):
+    """Return ``(hits, cached)``, reusing any cached result that covers ``limit``.
+
+    Searches with descriptor ``ranges`` are cached under their own keys but not registered for
+    write-time patching; the next write retires them. Results ``db`` may not be up to date for
+    (see :func:`_caught_up`) are returned without being cached.
+    """
+    key = await _search_cache_key(cache, substructure, ranges)
+    cached = await _search_cache_get(cache, key, limit)
+    if cached is not None:
+        return cached, True
+    if key is None or not await _caught_up(db, cache, ranges):
+        return await _search_substructure_db(db, substructure, limit, ranges), False
+
+    flight = f"{key}|limit={limit}"
+
+    async def _compute():
+        # one computation per key across replicas: the lease holder scans, the others wait for its result
+        token = await acquire_lease(cache, flight)
+        if token is None:
+            hits = await wait_for(lambda: _search_cache_get(cache, key, limit))
+            if hits is not None:
+                return hits, True
+        try:
+            hits = await _search_substructure_db(db, substructure, limit, ranges)
+            await _search_cache_set(cache, key, hits, limit, None if ranges else substructure)
+        finally:
+            if token is not None:
+                await release_lease(cache, flight, token)
+        return hits, False
+
+    return await search_flight.do(flight, _compute)
+
+
+async def _cached_batch_search(
+        db: AsyncSession, cache: redis.Redis, substructures: list[str], limit: Optional[int]
+) -> list[tuple[list[str], bool]]:
+    """``(hits, cached)`` per pattern; cache misses are searched together in one pass.
+
+    Each pattern is cached under the same key as a single search for it, and spellings of one
+    query in the batch are only searched once. As with :func:`_cached_search`, nothing is cached
+    from a ``db`` that may lag the current generation.
+    """
+    normalized = await _normalize_queries(substructures)
+    generation = await _get_generation(cache)
+    keys = [_make_cache_key(query, generation) if query is not None else None for query in normalized]
+    results: list = [None] * len(substructures)
+    pending: dict = {}
+    for i, key in enumerate(keys):
+        cached = await _search_cache_get(cache, key, limit)
+        if cached is not None:
+            results[i] = (cached, True)
+        else:
+            # unparseable patterns are never cached or merged; the search gives them no hits
+            pending.setdefault(key if key is not None else i, []).append(i)
+    if pending:
+        todo = [positions[0] for positions in pending.values()]
+        cacheable = await _caught_up(db, cache)
+        found = await _search_substructures_db(db, [substructures[i] for i in todo], limit)
+        for first, hits in zip(todo, found):
+            if cacheable:
+                await _search_cache_set(cache, keys[first], hits, limit, substructures[first])
+            for i in pending[keys[first] if keys[first] is not None else first]:
+                results[i] = (hits, False)
+    return results
 
 
 def _is_eager_mode() -> bool:
     return os.getenv("CELERY_TASK_ALWAYS_EAGER") == "1"
 
 
+def _encode_cursor(id: UUID) -> str:
+    return base64.urlsafe_b64encode(id.bytes).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: str) -> UUID:
+    try:
+        return UUID(bytes=base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
 async def _get_molecule_by_id(db: AsyncSession, id: str):
     try:
         uuid_val = UUID(id)
@@ -58,3 +883,16 @@ async def _get_molecule_by_id(db: AsyncSession, id: str):
     if mol is None:
         raise HTTPException(status_code=404, detail="Molecule not found")
     return mol
+
+
+async def _spool_upload(file: UploadFile) -> str:
+    """Copy an upload chunk by chunk into INGEST_SPOOL_DIR (shared with the workers); returns the path."""
+    os.makedirs(INGEST_SPOOL_DIR, exist_ok=True)
+    fd, path = tempfile.mkstemp(prefix="ingest-", dir=INGEST_SPOOL_DIR)
+    with os.fdopen(fd, "wb") as out:
+        while True:
+            chunk = await file.read(INGEST_CHUNK_BYTES)
+            if not chunk:
+                break
+            await run_in_threadpool(out.write, chunk)
+    return path
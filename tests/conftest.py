@@ -5,7 +5,6 @@ from pathlib import Path
 import pytest
 from typing import Iterator
 from fastapi.testclient import TestClient
-import time
 
 ROOT = Path(__file__).resolve().parents[1]
 SRC = ROOT / "src"
@@ -20,25 +19,8 @@ os.environ.setdefault(
 
 from src.db import create_all_sync, drop_all_sync  # noqa: E402 # type: ignore
 import src.main as main  # noqa: E402  # type: ignore
-from src.cache import get_cache as cache_get_cache  # noqa: E402  # type: ignore
-
-
-class FakeCache:
-    def __init__(self):
-        self.store = {}
-
-    async def get(self, key: str):
-        item = self.store.get(key)
-        if not item:
-            return None
-        exp, value = item
-        if exp < time.time():
-            del self.store[key]
-            return None
-        return value
-
-    async def setex(self, key: str, ttl: int, value: str):
-        self.store[key] = (time.time() + ttl, value)
+from src.cache import generation_memo, get_cache as cache_get_cache, local_cache, query_memo  # noqa: E402  # type: ignore
+from tests.fakes import FakeCache  # noqa: E402
 
 
 @pytest.fixture(autouse=True)
@@ -53,10 +35,18 @@ def _setup_db():
 
 
 @pytest.fixture()
-def client() -> Iterator[TestClient]:
+def fake_cache() -> FakeCache:
+    # the in-process tier outlives a test; generations restart at 0 with every FakeCache
+    local_cache.clear()
+    generation_memo.clear()
+    query_memo.clear()
+    return FakeCache()
+
+
+@pytest.fixture()
+def client(fake_cache: FakeCache) -> Iterator[TestClient]:
     # Override cache dependency to avoid real Redis in tests
-    fake = FakeCache()
-    main.app.dependency_overrides[cache_get_cache] = lambda: fake
+    main.app.dependency_overrides[cache_get_cache] = lambda: fake_cache
     with TestClient(main.app) as c:
         yield c
     main.app.dependency_overrides.clear()
@@ -0,0 +1,106 @@
+import time
+
+from src.singleflight import RELEASE_LEASE_SCRIPT
+from src.utils import BUMP_GENERATION_SCRIPT
+
+
+class FakeCache:
+    """In-memory stand-in for the subset of the redis.asyncio client the app uses."""
+
+    def __init__(self):
+        self.store = {}
+
+    async def get(self, key: str):
+        item = self.store.get(key)
+        if not item:
+            return None
+        exp, value = item
+        if exp < time.time():
+            del self.store[key]
+            return None
+        return value
+
+    async def setex(self, key: str, ttl: int, value: str):
+        self.store[key] = (time.time() + ttl, value)
+
+    async def set(self, key: str, value: str, nx: bool = False, px: int = None, ex: int = None):
+        if nx and await self.get(key) is not None:
+            return None
+        ttl = px / 1000 if px is not None else ex if ex is not None else float("inf")
+        self.store[key] = (time.time() + ttl, value)
+        return True
+
+    async def delete(self, *keys: str):
+        return sum(self.store.pop(key, None) is not None for key in keys)
+
+    async def expire(self, key: str, ttl: int):
+        if key in self.store:
+            self.store[key] = (time.time() + ttl, self.store[key][1])
+
+    async def hset(self, key: str, field: str, value: str):
+        hash_ = await self.get(key) or {}
+        hash_[field] = value
+        self.store[key] = (self.store.get(key, (float("inf"),))[0], hash_)
+
+    async def hmget(self, key: str, fields):
+        hash_ = await self.get(key) or {}
+        return [hash_.get(field) for field in fields]
+
+    async def hdel(self, key: str, *fields: str):
+        hash_ = await self.get(key) or {}
+        return sum(hash_.pop(field, None) is not None for field in fields)
+
+    async def copy(self, source: str, destination: str):
+        if await self.get(source) is None or await self.get(destination) is not None:
+            return False
+        self.store[destination] = self.store[source]
+        return True
+
+    async def hgetall(self, key: str):
+        return dict(await self.get(key) or {})
+
+    async def incrby(self, key: str, amount: int):
+        value = int(await self.get(key) or 0) + amount
+        self.store[key] = (self.store.get(key, (float("inf"),))[0], str(value))
+        return value
+
+    async def mget(self, keys):
+        return [await self.get(key) for key in keys]
+
+    async def zadd(self, key: str, mapping: dict):
+        zset = await self.get(key) or {}
+        zset.update(mapping)
+        self.store[key] = (float("inf"), zset)
+
+    async def zrange(self, key: str, start: int, end: int):
+        zset = await self.get(key) or {}
+        ranked = sorted(zset, key=zset.get)
+        end = len(ranked) + end if end < 0 else end
+        return ranked[start:end + 1]
+
+    async def zrem(self, key: str, *members: str):
+        zset = await self.get(key) or {}
+        return sum(zset.pop(member, None) is not None for member in members)
+
+    async def zrevrange(self, key: str, start: int, end: int):
+        zset = await self.get(key) or {}
+        ranked = sorted(zset, key=zset.get, reverse=True)
+        return ranked[start:None if end == -1 else end + 1]
+
+    async def incr(self, key: str):
+        value = int(await self.get(key) or 0) + 1
+        self.store[key] = (float("inf"), str(value))
+        return value
+
+    async def eval(self, script: str, numkeys: int, *args):
+        # only the scripts the app ships are emulated
+        if script == BUMP_GENERATION_SCRIPT:
+            generation_key, seq_key, seq = args
+            if int(seq) > int(await self.get(seq_key) or 0):
+                await self.set(seq_key, str(seq))
+            return [await self.incr(generation_key), int(await self.get(seq_key) or 0)]
+        assert script == RELEASE_LEASE_SCRIPT
+        key, token = args
+        if await self.get(key) == token:
+            return await self.delete(key)
+        return 0
@@ -1,5 +1,9 @@
+from uuid import UUID
+
 from fastapi.testclient import TestClient
 
+from src.cache import local_cache
+
 
 def create(client: TestClient, smiles: str):
     r = client.post("/molecules/", json={"smiles": smiles})
@@ -52,6 +56,77 @@ def test_substructure_search_endpoint(client: TestClient):
     assert set(r2.json()) == set(data1)
 
 
+def test_similarity_search_endpoint(client: TestClient):
+    for smiles in ("Cc1ccccc1", "c1ccccc1", "CCO", "CC(=O)Oc1ccccc1C(=O)O"):
+        create(client, smiles)
+
+    r = client.post("/similarity-search", json={"smiles": "c1ccccc1C", "threshold": 0.2, "k": 2})
+    assert r.status_code == 200, r.text
+    hits = r.json()["hits"]
+    assert [hit["smiles"] for hit in hits][0] == "Cc1ccccc1"
+    assert hits[0]["similarity"] == 1.0
+    assert len(hits) <= 2
+    assert all(hit["similarity"] >= 0.2 for hit in hits)
+
+    r = client.post("/similarity-search", json={"smiles": "c1ccccc1C", "threshold": 1.0})
+    assert [hit["smiles"] for hit in r.json()["hits"]] == ["Cc1ccccc1"]
+
+    r = client.post("/similarity-search", json={"smiles": "invalid$$$"})
+    assert r.status_code == 400
+
+
+def test_batch_substructure_search(client: TestClient):
+    for smiles in ("CCO", "c1ccccc1", "CC(=O)Oc1ccccc1C(=O)O", "CC(=O)O"):
+        create(client, smiles)
+    single = client.get("/substructure-search/?substructure=C(=O)O").json()
+
+    payload = {"substructures": ["c1ccccc1", "C(=O)O", "OC=O", "invalid$$$"]}
+    r = client.post("/substructure-search/batch", json=payload)
+    assert r.status_code == 200, r.text
+    results = r.json()["results"]
+    assert [result["substructure"] for result in results] == payload["substructures"]
+    assert set(results[0]["hits"]) == {"c1ccccc1", "CC(=O)Oc1ccccc1C(=O)O"}
+    # shares the cache entry of the single search, whichever way it is spelled
+    assert results[1]["hits"] == results[2]["hits"] == single
+    assert results[1]["cached"] and results[2]["cached"] and not results[0]["cached"]
+    assert results[3] == {"substructure": "invalid$$$", "count": 0, "hits": [], "cached": False}
+
+    r = client.post("/substructure-search", json={"substructure": "c1ccccc1"})
+    assert r.json()["cached"] is True
+    r = client.post("/substructure-search/batch", json={"substructures": ["c1ccccc1"], "limit": 1})
+    assert r.json()["results"][0]["count"] == 1
+
+    assert client.post("/substructure-search/batch", json={"substructures": []}).status_code == 422
+    assert client.post("/tasks/substructure/batch", json=payload).json()["status"] == "SUCCESS"
+
+
+def test_substructure_search_property_filters(client: TestClient, monkeypatch):
+    from src.index import molecule_index
+
+    # benzene 78.1, toluene 92.1, phenol 94.1 (1 donor), aspirin 180.2 (1 donor, TPSA 63.6)
+    for smiles in ("c1ccccc1", "Cc1ccccc1", "Oc1ccccc1", "CC(=O)Oc1ccccc1C(=O)O", "CCO"):
+        create(client, smiles)
+
+    def search(**filters):
+        r = client.post("/substructure-search", json={"substructure": "c1ccccc1", **filters})
+        assert r.status_code == 200, r.text
+        return set(r.json()["hits"]), r.json()["cached"]
+
+    assert search(mw_max=93) == ({"c1ccccc1", "Cc1ccccc1"}, False)
+    assert search(mw_max=93) == ({"c1ccccc1", "Cc1ccccc1"}, True)
+    assert search(hbd_min=1, tpsa_max=30)[0] == {"Oc1ccccc1"}
+    assert search(heavy_atoms_min=10, clogp_min=0)[0] == {"CC(=O)Oc1ccccc1C(=O)O"}
+    # filtered entries never stand in for the unfiltered search
+    assert len(search()[0]) == 4
+
+    # without the in-memory index the windows go into the screening query itself
+    monkeypatch.setattr(molecule_index, "loaded", False)
+    assert search(hba_min=3)[0] == {"CC(=O)Oc1ccccc1C(=O)O"}
+
+    r = client.post("/substructure-search", json={"substructure": "c1ccccc1", "hbd_min": -1})
+    assert r.status_code == 422
+
+
 def test_duplicate_smiles_prevention(client: TestClient):
     r1 = client.post("/molecules/", json={"smiles": "CCO"})
     assert r1.status_code == 201
@@ -62,3 +137,451 @@ def test_duplicate_smiles_prevention(client: TestClient):
     r2 = client.post("/molecules/", json={"smiles": "CCO"})
     assert r2.status_code == 409
     assert "already exists" in r2.json()["detail"]
+
+
+def test_search_index_tracks_writes(client: TestClient):
+    from src.index import molecule_index
+
+    assert molecule_index.loaded
+    m = create(client, "c1ccccc1")
+    create(client, "CCO")
+    assert len(molecule_index) == 2
+    assert client.get("/substructure-search/?substructure=c1ccccc1&limit=5").json() == ["c1ccccc1"]
+
+    client.put(f"/molecules/{m['id']}", json={"smiles": "Cc1ccccc1"})
+    assert client.get("/substructure-search/?substructure=c1ccccc1&limit=6").json() == ["Cc1ccccc1"]
+
+    client.delete(f"/molecules/{m['id']}")
+    assert len(molecule_index) == 1
+    assert client.get("/substructure-search/?substructure=c1ccccc1&limit=7").json() == []
+
+
+def test_startup_survives_index_load_failure(fake_cache, monkeypatch):
+    from src import main
+    from src.cache import get_cache
+    from src.index import MoleculeIndex, molecule_index
+
+    async def _broken_load(self, db):
+        raise RuntimeError("no such table: molecule_changes")
+
+    monkeypatch.setattr(MoleculeIndex, "load", _broken_load)
+    main.app.dependency_overrides[get_cache] = lambda: fake_cache
+    try:
+        with TestClient(main.app) as c:
+            assert not molecule_index.loaded
+            create(c, "c1ccccc1")
+            assert c.get("/substructure-search/?substructure=c1ccccc1").json() == ["c1ccccc1"]
+    finally:
+        main.app.dependency_overrides.clear()
+
+
+def test_index_refreshes_from_change_journal(client: TestClient):
+    import asyncio
+
+    from src.chemistry import molecule_columns
+    from src.db import Molecule, MoleculeChange, db_session_scope
+    from src.index import MoleculeIndex
+
+    # stands in for another replica or a Celery worker that loaded before these writes
+    index = MoleculeIndex()
+
+    def _smiles(index):
+        return [smiles for _, smiles, _ in index.candidate_rows()]
+
+    async def run(fn):
+        async with db_session_scope() as db:
+            return await fn(db)
+
+    create(client, "CCO")
+    asyncio.run(run(index.load))
+    m = create(client, "c1ccccc1")
+    create(client, "CCN")
+    client.put(f"/molecules/{m['id']}", json={"smiles": "Oc1ccccc1"})
+    client.delete(f"/molecules/{create(client, 'CCCC')['id']}")
+
+    ops = asyncio.run(run(index.refresh))
+    assert sorted(_smiles(index)) == ["CCN", "CCO", "Oc1ccccc1"]
+    assert {op for op, *_ in ops} == {"upsert", "remove"}
+    assert asyncio.run(run(index.refresh)) == []
+
+    # a seq committed after a higher one is remembered as a gap and picked up once it lands
+    other = UUID(create(client, "CCCl")["id"])
+    asyncio.run(run(index.refresh))
+    seq = index.last_seq + 1
+
+    async def write(*rows):
+        async with db_session_scope() as db:
+            db.add_all(rows)
+
+    late = Molecule(**molecule_columns("CCS"))
+    asyncio.run(write(late, MoleculeChange(seq=seq + 1, molecule_id=other)))
+    asyncio.run(run(index.refresh))
+    assert "CCS" not in _smiles(index) and list(index._gaps) == [seq]
+    asyncio.run(write(MoleculeChange(seq=seq, molecule_id=late.id)))
+    asyncio.run(run(index.refresh))
+    assert "CCS" in _smiles(index) and not index._gaps
+
+
+def test_cpu_executor_sheds_load_when_full(client: TestClient):
+    from prometheus_client import REGISTRY
+    from src.executor import cpu_executor
+
+    assert client.get("/").json()["cpu_jobs"]["in_flight"] == 0
+    assert REGISTRY.get_sample_value("cpu_jobs_in_flight") == 0
+    rejected = REGISTRY.get_sample_value("cpu_jobs_rejected_total") or 0
+    limit = cpu_executor.limit
+    cpu_executor.limit = 0
+    try:
+        r = client.get("/substructure-search/?substructure=c1ccccc1")
+        assert r.status_code == 503
+        assert r.headers["Retry-After"]
+        assert client.get("/").status_code == 200
+    finally:
+        cpu_executor.limit = limit
+    assert REGISTRY.get_sample_value("cpu_jobs_rejected_total") == rejected + 1
+
+
+def test_canonical_dedup_and_lookup(client: TestClient):
+    m = create(client, "OCC")
+    assert m["smiles"] == "CCO"
+
+    r = client.post("/molecules/", json={"smiles": "C(O)C"})
+    assert r.status_code == 409
+
+    r = client.get("/molecules/lookup", params={"smiles": "C(C)O"})
+    assert r.status_code == 200
+    assert r.json()["id"] == m["id"]
+
+    assert client.get("/molecules/lookup", params={"smiles": "CCN"}).status_code == 404
+    assert client.get("/molecules/lookup", params={"smiles": "invalid$$$"}).status_code == 400
+
+
+def test_bulk_upload_counts(client: TestClient):
+    create(client, "c1ccccc1")
+    content = "smiles\nCCO\nOCC\n\nnot-a-smiles\nc1ccccc1\nCCN\n"
+    r = client.post("/molecules/upload/", files={"file": ("mols.smi", content)})
+    assert r.status_code == 200
+    assert r.json() == {"created": 2, "duplicates": 2, "invalid": 1}
+
+    smiles = {m["smiles"] for m in client.get("/molecules/").json()}
+    assert smiles == {"c1ccccc1", "CCO", "CCN"}
+    assert client.get("/substructure-search/?substructure=CN").json() == ["CCN"]
+
+
+def test_list_keyset_pagination_and_stream(client: TestClient):
+    import json
+
+    created = {create(client, smiles)["id"] for smiles in ["C", "CC", "CCC", "CCCC", "CCCCC"]}
+
+    seen, cursor = [], None
+    while True:
+        params = {"limit": 2} if cursor is None else {"limit": 2, "cursor": cursor}
+        r = client.get("/molecules/", params=params)
+        assert r.status_code == 200
+        seen += [m["id"] for m in r.json()]
+        cursor = r.headers.get("X-Next-Cursor")
+        if cursor is None:
+            break
+    assert seen == sorted(created)
+
+    r = client.get("/molecules/", params={"stream": "true"})
+    streamed = [json.loads(line)["id"] for line in r.text.splitlines()]
+    assert streamed == seen
+
+    assert client.get("/molecules/", params={"cursor": "!!"}).status_code == 400
+
+
+def test_substructure_search_stream(client: TestClient):
+    import json
+
+    for smiles in ["CCO", "c1ccccc1", "Cc1ccccc1", "Oc1ccccc1"]:
+        create(client, smiles)
+
+    r = client.get("/substructure-search/stream", params={"substructure": "c1ccccc1"})
+    assert r.status_code == 200
+    hits = [json.loads(line)["smiles"] for line in r.text.splitlines()]
+    assert set(hits) == {"c1ccccc1", "Cc1ccccc1", "Oc1ccccc1"}
+
+    r = client.get("/substructure-search/stream", params={"substructure": "c1ccccc1", "limit": 2})
+    assert len(r.text.splitlines()) == 2
+    # the completed scan was cached for the regular endpoint too
+    assert client.get("/substructure-search/", params={"substructure": "c1ccccc1", "limit": 2}).json() == \
+        [json.loads(line)["smiles"] for line in r.text.splitlines()]
+
+
+def test_writes_invalidate_cached_searches(client: TestClient):
+    create(client, "c1ccccc1")
+    assert client.get("/substructure-search/?substructure=c1ccccc1").json() == ["c1ccccc1"]
+
+    m = create(client, "Oc1ccccc1")
+    assert set(client.get("/substructure-search/?substructure=c1ccccc1").json()) == {"c1ccccc1", "Oc1ccccc1"}
+
+    client.delete(f"/molecules/{m['id']}")
+    assert client.get("/substructure-search/?substructure=c1ccccc1").json() == ["c1ccccc1"]
+
+
+def test_search_cache_reuse_across_limits_and_spellings(client: TestClient):
+    for smiles in ["CCO", "CCCO", "OCCO", "c1ccccc1"]:
+        create(client, smiles)
+
+    r = client.post("/substructure-search", json={"substructure": "CCO"})
+    assert r.json()["cached"] is False and r.json()["count"] == 3
+
+    # an uncapped result serves every limit and every spelling of the pattern
+    r = client.post("/substructure-search", json={"substructure": " O C C ", "limit": 2})
+    assert r.json()["cached"] is True and r.json()["count"] == 2
+
+    # a result truncated at 1 cannot serve limit=2
+    r = client.post("/substructure-search", json={"substructure": "c1ccccc1", "limit": 1})
+    assert r.json()["cached"] is False
+    r = client.post("/substructure-search", json={"substructure": "c1ccccc1", "limit": 2})
+    assert r.json()["cached"] is False and r.json()["hits"] == ["c1ccccc1"]
+    r = client.post("/substructure-search", json={"substructure": "c1ccccc1", "limit": 5})
+    assert r.json()["cached"] is True
+    assert client.get("/substructure-search/", params={"substructure": " c1cc ccc1"}).json() == ["c1ccccc1"]
+
+
+def test_writes_patch_cached_searches(client: TestClient, fake_cache):
+    create(client, "c1ccccc1")
+    create(client, "CCO")
+
+    def search():
+        r = client.post("/substructure-search", json={"substructure": "c1ccccc1"})
+        return r.json()["cached"], set(r.json()["hits"])
+
+    assert search() == (False, {"c1ccccc1"})
+
+    phenol = create(client, "Oc1ccccc1")
+    assert search() == (True, {"c1ccccc1", "Oc1ccccc1"})
+
+    client.put(f"/molecules/{phenol['id']}", json={"smiles": "CCCO"})
+    assert search() == (True, {"c1ccccc1"})
+
+    files = {"file": ("mols.smi", b"Cc1ccccc1\nCCN\n", "text/plain")}
+    assert client.post("/molecules/upload/", files=files).json()["created"] == 2
+    assert search() == (True, {"c1ccccc1", "Cc1ccccc1"})
+
+    benzene = client.get("/molecules/lookup", params={"smiles": "c1ccccc1"}).json()
+    client.delete(f"/molecules/{benzene['id']}")
+    assert search() == (True, {"Cc1ccccc1"})
+
+    # the patched entry agrees with a full rescan
+    fake_cache.store.clear()
+    local_cache.clear()
+    assert search() == (False, {"Cc1ccccc1"})
+
+
+def test_writes_only_fetch_cached_searches_they_affect(client: TestClient, fake_cache, monkeypatch):
+    create(client, "c1ccccc1")
+    create(client, "CCO")
+
+    def search(substructure):
+        r = client.post("/substructure-search", json={"substructure": substructure})
+        return r.json()["cached"], set(r.json()["hits"])
+
+    assert search("c1ccccc1") == (False, {"c1ccccc1"})
+    assert search("CO") == (False, {"CCO"})
+
+    fetched = []
+    mget = fake_cache.mget
+
+    async def _mget(keys):
+        fetched.extend(keys)
+        return await mget(keys)
+
+    monkeypatch.setattr(fake_cache, "mget", _mget)
+    create(client, "CCCl")
+    assert fetched == []
+    # an aliphatic C-O: phenol only changes the benzene result
+    create(client, "Oc1ccccc1")
+    assert fetched == ["subsearch:g3:sma:c1ccccc1"]
+
+    local_cache.clear()
+    assert search("c1ccccc1") == (True, {"c1ccccc1", "Oc1ccccc1"})
+    assert search("CO") == (True, {"CCO"})
+
+
+def test_metrics_endpoint(client: TestClient):
+    from prometheus_client import REGISTRY
+    from src.tasks import substructure_search_db
+
+    def sample(name, **labels):
+        return REGISTRY.get_sample_value(name, labels) or 0
+
+    for smiles in ["CCO", "c1ccccc1", "Cc1ccccc1"]:
+        create(client, smiles)
+    before = {
+        "requests": sample("http_request_duration_seconds_count",
+                           method="POST", route="/substructure-search", status="200"),
+        "misses": sample("search_cache_lookups_total", tier="redis", result="miss"),
+        "hits": sample("search_cache_lookups_total", tier="local", result="hit"),
+        "screened": sample("search_screen_molecules_total", result="screened"),
+        "passed": sample("search_screen_molecules_total", result="passed"),
+        "tasks": sample("celery_task_duration_seconds_count", task="tasks.substructure_search_db", state="SUCCESS"),
+    }
+    stages = {stage: sample("search_stage_duration_seconds_count", stage=stage)
+              for stage in ("cache_lookup", "db_fetch", "screen", "parse", "match")}
+
+    for _ in range(2):
+        r = client.post("/substructure-search", json={"substructure": "c1ccccc1"})
+        assert r.status_code == 200
+    substructure_search_db.apply(args=["CCO"]).get()
+
+    r = client.get("/metrics")
+    assert r.status_code == 200
+    assert r.headers["content-type"].startswith("text/plain")
+    assert sample("http_request_duration_seconds_count",
+                  method="POST", route="/substructure-search", status="200") == before["requests"] + 2
+    assert sample("search_cache_lookups_total", tier="redis", result="miss") > before["misses"]
+    assert sample("search_cache_lookups_total", tier="local", result="hit") == before["hits"] + 1
+    # benzene and toluene pass the benzene screen, ethanol does not
+    assert sample("search_screen_molecules_total", result="screened") - before["screened"] >= 3
+    assert sample("search_screen_molecules_total", result="passed") - before["passed"] >= 2
+    assert sample("celery_task_duration_seconds_count",
+                  task="tasks.substructure_search_db", state="SUCCESS") == before["tasks"] + 1
+    for stage, count in stages.items():
+        assert sample("search_stage_duration_seconds_count", stage=stage) > count, stage
+    assert "search_stage_duration_seconds_bucket" in r.text
+
+
+def test_substructure_search_explain(client: TestClient, monkeypatch):
+    from src import api
+    from src.index import molecule_index
+
+    for smiles in ("c1ccccc1", "Cc1ccccc1", "Oc1ccccc1", "CCO", "CCN"):
+        create(client, smiles)
+
+    r = client.post("/substructure-search", json={"substructure": "c1ccccc1", "explain": True})
+    assert r.status_code == 200, r.text
+    body = r.json()
+    assert body["count"] == 3 and body["cached"] is False
+    explain = body["explain"]
+    assert explain["query_type"] == "smarts" and explain["strategy"] == "index" and explain["screen_bits"] > 0
+    stages = {stage["stage"]: stage for stage in explain["stages"]}
+    assert list(stages) == ["compile", "db_fetch", "screen", "parse", "match"]
+    assert (stages["screen"]["rows_in"], stages["screen"]["rows_out"]) == (5, 3)
+    assert (stages["match"]["rows_in"], stages["match"]["rows_out"]) == (3, 3)
+    assert len(explain["slowest_matches"]) == 3
+    assert explain["profile"] is None
+
+    # the screen runs inside the query without the in-memory index
+    monkeypatch.setattr(molecule_index, "loaded", False)
+    explain = client.post("/substructure-search", json={"substructure": "c1ccccc1", "explain": True}).json()["explain"]
+    assert explain["strategy"] == "sql"
+    assert [stage["stage"] for stage in explain["stages"]] == ["compile", "db_fetch", "parse", "match"]
+    assert (explain["stages"][1]["rows_in"], explain["stages"][1]["rows_out"]) == (5, 3)
+
+    # profiling is for admins only
+    r = client.post("/substructure-search", json={"substructure": "c1ccccc1", "profile": True})
+    assert r.status_code == 403
+    monkeypatch.setattr(api, "ADMIN_TOKEN", "secret")
+    r = client.post("/substructure-search", json={"substructure": "c1ccccc1", "profile": True},
+                    headers={"X-Admin-Token": "wrong"})
+    assert r.status_code == 403
+    r = client.post("/substructure-search", json={"substructure": "c1ccccc1", "profile": True},
+                    headers={"X-Admin-Token": "secret"})
+    assert r.status_code == 200
+    assert "explain_match_rows" in r.json()["explain"]["profile"]
+
+    r = client.post("/tasks/substructure", json={"substructure": "c1ccccc1", "explain": True, "limit": 1})
+    assert r.status_code == 200
+    result = r.json()["result"]
+    assert len(result["hits"]) == 1 and result["explain"]["stages"][-1]["rows_out"] == 1
+
+
+def test_reads_go_to_the_replica(client: TestClient, monkeypatch, tmp_path):
+    import asyncio
+    from uuid import uuid4
+    from sqlalchemy import func, select
+    from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+    from src import db
+    from src.chemistry import molecule_columns
+    from src.index import molecule_index
+
+    replica = db._create_engine(f"sqlite+aiosqlite:///{tmp_path}/replica.db")
+
+    async def _seed():
+        async with replica.begin() as conn:
+            await conn.run_sync(db.Base.metadata.create_all)
+            await conn.execute(db.Molecule.__table__.insert().values(id=uuid4(), **molecule_columns("c1ccccc1")))
+        # pooled connections must not outlive this event loop
+        await replica.dispose()
+
+    asyncio.run(_seed())
+    monkeypatch.setattr(db, "ReadSessionLocal", async_sessionmaker(bind=replica, expire_on_commit=False, class_=AsyncSession))
+    monkeypatch.setattr(molecule_index, "loaded", False)
+
+    created = create(client, "CCO")
+    create(client, "Oc1ccccc1")
+    assert [m["smiles"] for m in client.get("/molecules/").json()] == ["c1ccccc1"]
+    assert client.get(f"/molecules/{created['id']}").status_code == 404
+    r = client.post("/substructure-search", json={"substructure": "c1ccccc1", "explain": True})
+    assert r.json()["hits"] == ["c1ccccc1"]
+
+    # the replica has yet to replay the writes: its results are served, but not cached under the new generation
+    for _ in range(2):
+        r = client.post("/substructure-search", json={"substructure": "c1ccccc1"})
+        assert (r.json()["hits"], r.json()["cached"]) == (["c1ccccc1"], False)
+    r = client.post("/substructure-search/batch", json={"substructures": ["O", "c1ccccc1"]})
+    assert [(result["hits"], result["cached"]) for result in r.json()["results"]] == [([], False), (["c1ccccc1"], False)]
+
+    async def _replay_journal():
+        async with db.db_session_scope() as session:
+            seq = (await session.execute(select(func.max(db.MoleculeChange.seq)))).scalar()
+        async with replica.begin() as conn:
+            await conn.execute(db.MoleculeChange.__table__.insert().values(seq=seq, molecule_id=uuid4()))
+        await replica.dispose()
+
+    asyncio.run(_replay_journal())
+    for _ in range(2):
+        r = client.post("/substructure-search", json={"substructure": "c1ccccc1"})
+    assert r.json()["cached"] is True
+
+    # writes stay on the primary
+    async def _primary_smiles():
+        async with db.db_session_scope() as session:
+            return (await session.execute(select(db.Molecule.smiles))).scalars().all()
+
+    assert client.put(f"/molecules/{created['id']}", json={"smiles": "CCN"}).status_code == 200
+    assert sorted(asyncio.run(_primary_smiles())) == ["CCN", "Oc1ccccc1"]
+    asyncio.run(replica.dispose())
+
+
+def test_cached_searches_see_other_processes_writes(client: TestClient, fake_cache, monkeypatch):
+    import asyncio
+    import time
+
+    from src.chemistry import molecule_columns
+    from src.db import Molecule, MoleculeChange, db_session_scope
+    from src.index import molecule_index
+    from src.utils import _bump_generation
+
+    create(client, "c1ccccc1")
+    assert molecule_index.loaded
+
+    # another replica's write: journaled and bumped, but never applied to this process's index
+    async def write():
+        async with db_session_scope() as db:
+            phenol = Molecule(**molecule_columns("Oc1ccccc1"))
+            db.add(phenol)
+            await db.flush()
+            db.add(MoleculeChange(molecule_id=phenol.id))
+        await _bump_generation(fake_cache)
+
+    asyncio.run(write())
+    # the throttled refresh would not run for a while yet; the index catches up on the bumped seq instead
+    monkeypatch.setattr(molecule_index, "refreshed_at", time.monotonic())
+    for cached in (False, True):
+        r = client.post("/substructure-search", json={"substructure": "c1ccccc1"})
+        assert r.json()["cached"] is cached
+        assert sorted(r.json()["hits"]) == ["Oc1ccccc1", "c1ccccc1"]
+
+
+def test_engine_pool_options():
+    from src.db import _engine_options
+    from src.settings import DB_POOL_SIZE, DB_STATEMENT_CACHE_SIZE
+
+    options = _engine_options("postgresql+asyncpg://u:p@replica/db")
+    assert options["pool_size"] == DB_POOL_SIZE
+    assert options["connect_args"] == {"prepared_statement_cache_size": DB_STATEMENT_CACHE_SIZE}
+    assert set(_engine_options("sqlite+aiosqlite:///x.db")) == {"pool_pre_ping"}
@@ -0,0 +1,169 @@
+import asyncio
+
+from src.cache import COMPRESSED_PREFIX, LocalCache, decode_payload, encode_payload, local_cache, redis_counters
+from src.db import read_session_scope
+from src.singleflight import SingleFlight, acquire_lease, release_lease
+
+
+def test_single_flight_coalesces_concurrent_calls():
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return ["CCO"]
+
+    async def run():
+        flight = SingleFlight()
+        results = await asyncio.gather(*(flight.do("k", compute) for _ in range(5)))
+        assert len(flight) == 0
+        return results
+
+    assert asyncio.run(run()) == [["CCO"]] * 5
+    assert len(calls) == 1
+
+
+def test_single_flight_promotes_a_waiter_when_the_leader_is_cancelled():
+    calls = []
+
+    async def compute(name):
+        calls.append(name)
+        await asyncio.sleep(0.05)
+        return name
+
+    async def run():
+        flight = SingleFlight()
+        leader = asyncio.ensure_future(flight.do("k", lambda: compute("leader")))
+        await asyncio.sleep(0)
+        followers = [asyncio.ensure_future(flight.do("k", lambda i=i: compute(f"follower{i}"))) for i in range(3)]
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        results = await asyncio.gather(*followers)
+        assert leader.cancelled()
+        assert len(flight) == 0
+        return results
+
+    # the first waiter takes over and the others share its result
+    assert asyncio.run(run()) == ["follower0"] * 3
+    assert calls == ["leader", "follower0"]
+
+
+def test_release_lease_only_deletes_own_token(fake_cache):
+    async def run():
+        token = await acquire_lease(fake_cache, "k", ttl=60)
+        await release_lease(fake_cache, "k", "someone-else")
+        assert await acquire_lease(fake_cache, "k") is None
+        await release_lease(fake_cache, "k", token)
+        assert await acquire_lease(fake_cache, "k") is not None
+
+    asyncio.run(run())
+
+
+def test_lease_waiters_read_leader_result(fake_cache):
+    from src import utils
+
+    async def run():
+        key = await utils._search_cache_key(fake_cache, "CCO")
+        token = await acquire_lease(fake_cache, f"{key}|limit=None")
+        assert token is not None
+        assert await acquire_lease(fake_cache, f"{key}|limit=None") is None
+
+        async def leader():
+            await asyncio.sleep(0.1)
+            await utils._search_cache_set(fake_cache, key, ["CCO", "CCCO"], None)
+            await release_lease(fake_cache, f"{key}|limit=None", token)
+
+        # the waiter never queries the database: it is served the leader's cached result
+        async with read_session_scope() as db:
+            hits, _ = await asyncio.gather(utils._cached_search(db, fake_cache, "OCC", None), leader())
+        return hits
+
+    assert asyncio.run(run()) == (["CCO", "CCCO"], True)
+
+
+def test_payload_encoding_round_trip():
+    small = {"hits": ["CCO"], "complete": True}
+    payload, _ = encode_payload(small)
+    assert not payload.startswith(COMPRESSED_PREFIX)
+    assert decode_payload(payload)[0] == small
+
+    large = {"hits": [f"CCCCCCCCC{'C' * (i % 7)}O" for i in range(2000)], "complete": False}
+    payload, size = encode_payload(large)
+    assert payload.startswith(COMPRESSED_PREFIX)
+    assert len(payload) < size / 4
+    assert decode_payload(payload) == (large, size)
+
+
+def test_local_cache_evicts_least_recently_used():
+    cache = LocalCache(max_bytes=100, max_entries=3, ttl=60)
+    for key in "abc":
+        cache.set(key, key.upper(), 10)
+    assert cache.get("a") == "A"
+    cache.set("d", "D", 10)
+    assert cache.get("b") is None
+    assert [cache.get(key) for key in "acd"] == ["A", "C", "D"]
+
+    cache.set("big", "X", 90)
+    assert cache.get("big") == "X"
+    assert cache.size <= 100
+    assert cache.stats()["evictions"] == 3
+    cache.set("huge", "Y", 101)
+    assert cache.get("huge") is None
+
+
+def test_search_cache_tiers(fake_cache):
+    from src import utils
+
+    async def run():
+        key = await utils._search_cache_key(fake_cache, "CCO")
+        await utils._search_cache_set(fake_cache, key, ["CCO"], None)
+        await utils._normalize_queries(["OCC"])
+        local_cache.clear()
+        before = (local_cache.hits, redis_counters.hits)
+        assert await utils._search_cache_get(fake_cache, key, None) == ["CCO"]
+        assert await utils._search_cache_get(fake_cache, key, None) == ["CCO"]
+        return local_cache.hits - before[0], redis_counters.hits - before[1]
+
+    # the first read is served by Redis and promoted, the second never leaves the process
+    assert asyncio.run(run()) == (1, 1)
+
+
+def test_local_hit_needs_neither_redis_nor_the_cpu_pool(fake_cache, monkeypatch):
+    from src import utils
+
+    async def run():
+        key = await utils._search_cache_key(fake_cache, "CCO")
+        await utils._search_cache_set(fake_cache, key, ["CCO"], None)
+        await utils._normalize_queries(["OCC"])
+
+        async def _unavailable(*args, **kwargs):
+            raise AssertionError("local hit left the event loop")
+
+        monkeypatch.setattr(fake_cache, "get", _unavailable)
+        monkeypatch.setattr(utils, "run_cpu", _unavailable)
+        return await utils._cached_search(None, fake_cache, "OCC", None)
+
+    assert asyncio.run(run()) == (["CCO"], True)
+
+
+def test_query_normalization_misses_share_one_cpu_job(fake_cache, monkeypatch):
+    from src import utils
+
+    jobs = []
+    run_cpu = utils.run_cpu
+
+    async def _counting(func, *args):
+        jobs.append(args)
+        return await run_cpu(func, *args)
+
+    monkeypatch.setattr(utils, "run_cpu", _counting)
+
+    async def run():
+        first = await utils._normalize_queries(["CCO", "OCC", "invalid$$$", "CCO"])
+        again = await utils._normalize_queries(["OCC", "invalid$$$"])
+        return first, again
+
+    first, again = asyncio.run(run())
+    assert first[0] == first[1] == first[3] and first[2] is None
+    assert again == [first[1], None]
+    assert jobs == [(["CCO", "OCC", "invalid$$$"],)]
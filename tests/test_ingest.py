@@ -0,0 +1,124 @@
+import asyncio
+import gzip
+import io
+from uuid import uuid4
+
+from fastapi.testclient import TestClient
+
+from src.ingest import parse_records
+
+SDF = """ethanol
+     RDKit          2D
+
+  3  2  0  0  0  0  0  0  0  0999 V2000
+    0.0000    0.0000    0.0000 C   0  0  0  0  0  0  0  0  0  0  0  0
+    1.2990    0.7500    0.0000 C   0  0  0  0  0  0  0  0  0  0  0  0
+    2.5981   -0.0000    0.0000 O   0  0  0  0  0  0  0  0  0  0  0  0
+  1  2  1  0
+  2  3  1  0
+M  END
+>  <name>
+ethanol
+
+$$$$
+"""
+
+
+def _records(data: bytes, filename=None, fmt="auto", chunk_size=7):
+    async def _chunks():
+        for i in range(0, len(data), chunk_size):
+            yield data[i:i + chunk_size]
+
+    async def _run():
+        kind, records = await parse_records(_chunks(), filename, fmt)
+        return kind, [r async for r in records]
+
+    return asyncio.run(_run())
+
+
+def test_parse_records_formats_across_chunk_boundaries():
+    assert _records(b"smiles\r\nCCO ethanol\r\nc1ccccc1\r\n") == ("smiles", ["CCO", "c1ccccc1"])
+    assert _records(gzip.compress(b"id,SMILES\n1,CCO\n2,\"c1ccccc1\"\n"), "mols.csv.gz") == ("smiles", ["CCO", "c1ccccc1"])
+    assert _records(b"name\tsmiles\na\tCCN\n") == ("smiles", ["CCN"])
+    kind, blocks = _records(SDF.encode() * 2)
+    assert kind == "molblock" and len(blocks) == 2 and blocks[0].endswith("M  END")
+
+
+def test_upload_gzipped_sdf(client: TestClient):
+    data = gzip.compress(SDF.encode())
+    r = client.post("/molecules/upload/", files={"file": ("mols.sdf.gz", io.BytesIO(data))})
+    assert r.status_code == 200
+    assert r.json() == {"created": 1, "duplicates": 0, "invalid": 0}
+    assert client.get("/molecules/lookup", params={"smiles": "OCC"}).status_code == 200
+
+
+def test_row_by_row_insert_skips_duplicates(client: TestClient):
+    from src.chemistry import molecule_columns
+    from src.db import db_session_scope
+    from src.ingest import _insert_rows_one_by_one
+
+    create = client.post("/molecules/", json={"smiles": "CCO"})
+    assert create.status_code == 201
+
+    async def _run():
+        async with db_session_scope() as db:
+            rows = [{"id": uuid4(), **molecule_columns(smiles)} for smiles in ("OCC", "CCN", "c1ccccc1")]
+            return [mol.smiles for mol in await _insert_rows_one_by_one(db, rows)]
+
+    assert asyncio.run(_run()) == ["CCN", "c1ccccc1"]
+    assert client.get("/molecules/lookup", params={"smiles": "CCN"}).status_code == 200
+
+
+def test_ingest_commits_and_indexes_every_batch(client: TestClient):
+    from src.db import SessionLocal
+    from src.index import molecule_index
+    from src.ingest import ingest_records
+
+    async def _run():
+        async def _smiles():
+            for smiles in ("CCO", "CCN", "OCC", "c1ccccc1", "Cc1ccccc1", "invalid$$$", "CCCl"):
+                yield smiles
+
+        seen, committed = [], []
+        async with SessionLocal() as db:
+            def _progress(stats):
+                # staged index updates are applied at each commit, not held until the end
+                seen.append((stats["created"], len(molecule_index), "index_ops" in db.sync_session.info))
+
+            async def _committed():
+                committed.append(len(molecule_index))
+
+            stats = await ingest_records(db, _smiles(), batch_size=2, on_progress=_progress, on_commit=_committed)
+        return stats, seen, committed
+
+    stats, seen, committed = asyncio.run(_run())
+    assert stats == {"created": 5, "duplicates": 1, "invalid": 1}
+    assert seen == [(2, 2, False), (3, 3, False), (4, 4, False), (5, 5, False)]
+    assert committed == [2, 3, 4, 5]
+    hits = client.get("/substructure-search/?substructure=c1ccccc1").json()
+    assert sorted(hits) == ["Cc1ccccc1", "c1ccccc1"]
+
+
+def test_ingest_waits_for_a_full_executor(client: TestClient, monkeypatch):
+    from src import ingest
+    from src.db import SessionLocal
+    from src.executor import cpu_executor
+
+    monkeypatch.setattr(ingest, "current_search_engine", lambda: None)
+    monkeypatch.setattr(cpu_executor, "in_flight", cpu_executor.limit)
+
+    async def _run():
+        async def _smiles():
+            for smiles in ("CCO", "CCN", "c1ccccc1"):
+                yield smiles
+
+        async def _release():
+            await asyncio.sleep(0.05)
+            cpu_executor.in_flight = 0
+
+        async with SessionLocal() as db:
+            stats, _ = await asyncio.gather(ingest.ingest_records(db, _smiles(), batch_size=2), _release())
+        return stats
+
+    # searches get a 503 from a full executor; an upload halfway through a file waits for it instead
+    assert asyncio.run(_run()) == {"created": 3, "duplicates": 0, "invalid": 0}
@@ -15,3 +15,137 @@ def test_substructure_search_basic():
 def test_substructure_invalid_input():
     assert substructure_search(["CCO"], "") == []
     assert substructure_search(["CCO"], "invalid$$$") == []
+
+
+def test_stored_fingerprint_screen_matches_rdkit():
+    from rdkit import Chem
+    from rdkit.Chem import DataStructs
+    from src.chemistry import compile_pattern, fingerprint_to_bytes, smiles_fingerprint
+    from src.db import _fp_contains
+
+    _, pattern_fp = compile_pattern("c1ccccc1")
+    query = fingerprint_to_bytes(pattern_fp)
+    for smiles in ["CCO", "c1ccccc1", "CC(=O)Oc1ccccc1C(=O)O"]:
+        expected = DataStructs.AllProbeBitsMatch(pattern_fp, Chem.PatternFingerprint(Chem.MolFromSmiles(smiles), fpSize=2048))
+        assert bool(_fp_contains(smiles_fingerprint(smiles), query)) == expected
+
+
+def test_fingerprint_screen_keeps_every_match():
+    from src.chemistry import compile_pattern, fingerprint_to_bytes, mol_from_row, smiles_fingerprint
+    from src.db import _fp_contains
+
+    molecules = ["Cc1ccc2[nH]ccc2c1", "c1ccc(-c2ccccn2)cc1", "CNc1ccccc1", "Nc1ccncc1", "CC(=O)Nc1ccc(O)cc1",
+                 "FC(F)(F)c1ccccc1", "O=C1CCCN1", "c1ccc2ccccc2c1", "CCOC(=O)c1cccs1", "Brc1cnc2[nH]ccc2c1"]
+    # generic atoms/bonds, aromatic bonds outside a sanitizable ring and recursive SMARTS
+    for query in ["c1ccc2[nH]ccc2c1", "[#6]-[#7]", "c:n", "cC", "[c,n]1ccccc1", "[#6]~[#7]", "*~*~*",
+                  "[$(C=O)]N", "[C;!R]N", "[#7;R]", "c-c", "C(F)(F)F"]:
+        pattern, pattern_fp = compile_pattern(query)
+        assert pattern_fp is not None
+        for smiles in molecules:
+            if mol_from_row(smiles).HasSubstructMatch(pattern):
+                assert _fp_contains(smiles_fingerprint(smiles), fingerprint_to_bytes(pattern_fp)), (query, smiles)
+
+
+def test_parallel_engine_matches_serial_search():
+    from uuid import uuid4
+    from src.chemistry import molecule_columns
+    from src.parallel import ParallelSearchEngine
+
+    molecules = ["CCO", "c1ccccc1", "CC(=O)O", "CC(=O)Oc1ccccc1C(=O)O", "Cc1ccccc1", "CCN"] * 5
+    rows = [(uuid4(), smiles, None) for smiles in molecules]
+    engine = ParallelSearchEngine(2, chunk_size=2)
+    try:
+        engine.load(rows[:10])
+        assert engine.search("c1ccccc1", rows) == substructure_search(molecules, "c1ccccc1")
+        assert engine.search("c1ccccc1", rows, limit=4) == substructure_search(molecules, "c1ccccc1", 4)
+        patterns = ["c1ccccc1", "C(=O)O", "N"]
+        members = [list(range(len(patterns)))] * len(rows)
+        assert engine.search_many(patterns, rows, members, limit=3) == [
+            substructure_search(molecules, pattern, 3) for pattern in patterns
+        ]
+        # rows the shards do not hold are built from their binary, not re-parsed from SMILES
+        unloaded = (uuid4(), "CCO", molecule_columns("c1ccccc1")["mol_pkl"])
+        assert engine.search("c1ccccc1", [unloaded]) == ["CCO"]
+        assert engine.search_many(["c1ccccc1"], [unloaded], [[0]]) == [["CCO"]]
+    finally:
+        engine.shutdown()
+
+
+def test_match_rows_uses_stored_binaries():
+    from src.chemistry import compile_pattern, match_rows, molecule_columns
+
+    rows = [(i, smiles, molecule_columns(smiles)["mol_pkl"]) for i, smiles in enumerate(["CCO", "c1ccccc1"])]
+    rows.append((2, "Cc1ccccc1", None))
+    pattern, _ = compile_pattern("c1ccccc1")
+    assert match_rows(rows, pattern) == ["c1ccccc1", "Cc1ccccc1"]
+
+
+def test_batch_screen_and_match_equal_single_searches():
+    from uuid import uuid4
+    from src.chemistry import compile_pattern, match_rows, match_rows_many, molecule_columns
+    from src.index import MoleculeIndex, screen_rows_many
+
+    molecules = ["CCO", "c1ccccc1", "CC(=O)O", "CC(=O)Oc1ccccc1C(=O)O", "Cc1ccccc1", "CCN", "OCCN"]
+    stored = [
+        (uuid4(), smiles, columns["fingerprint"], columns["mol_pkl"], columns["morgan_fp"])
+        for smiles, columns in ((smiles, molecule_columns(smiles)) for smiles in molecules)
+    ]
+    index = MoleculeIndex()
+    index.build(stored)
+    compiled = [compile_pattern(query) for query in ["c1ccccc1", "[OX2H]", "CN", "[Si]"]]
+    rows, members = index.candidate_rows_many([fp for _, fp in compiled])
+    for limit in (None, 1):
+        hits = match_rows_many(rows, [pattern for pattern, _ in compiled], members, limit)
+        assert hits == [match_rows(index.candidate_rows(fp), pattern, limit) for pattern, fp in compiled]
+    assert hits[-1] == []
+
+    # the SQL fallback screens fetched rows the same way; rows without a fingerprint pass every screen
+    fetched = [(id, smiles, pkl, fp) for id, smiles, fp, pkl, _ in stored] + [(uuid4(), "CCCl", None, None)]
+    screened, screened_members = screen_rows_many(fetched, [fp for _, fp in compiled])
+    assert dict(zip(rows, members)) == dict(zip(screened[:-1], screened_members[:-1]))
+    assert screened[-1][1] == "CCCl" and screened_members[-1] == [0, 1, 2, 3]
+
+
+def test_normalize_query():
+    from src.chemistry import normalize_query
+
+    assert normalize_query("CCO") == normalize_query("OCC") == normalize_query(" C(O)C ")
+    assert normalize_query("[#8]-[#6]") == normalize_query("[#6]-[#8]")
+    assert normalize_query("c1ccccc1") != normalize_query("C1=CC=CC=C1")
+    assert normalize_query("invalid$$$") is None
+
+
+def test_similarity_matrix_matches_rdkit_tanimoto():
+    from rdkit import Chem, DataStructs
+    from rdkit.Chem import AllChem
+
+    from src.chemistry import MORGAN_RADIUS, SIM_FP_SIZE, smiles_similarity_fingerprint
+    from src.similarity import SimilarityMatrix
+
+    smiles = ["CCO", "CCN", "c1ccccc1", "Cc1ccccc1", "CC(=O)Oc1ccccc1C(=O)O", "CCCCCCCC"] * 15 + ["C1CCNCC1"]
+    fps = [smiles_similarity_fingerprint(s) for s in smiles]
+    query = "Cc1ccccc1O"
+    rd = [AllChem.GetMorganFingerprintAsBitVect(Chem.MolFromSmiles(s), MORGAN_RADIUS, nBits=SIM_FP_SIZE)
+          for s in smiles + [query]]
+    expected = DataStructs.BulkTanimotoSimilarity(rd[-1], rd[:-1])
+
+    bulk = SimilarityMatrix.from_fingerprints(fps)
+    incremental = SimilarityMatrix(capacity=4)
+    # out of order, in batches that split 64-row words, with a row written twice
+    order = list(range(len(fps)))[::-1]
+    incremental.set_rows([0], [fps[5]])
+    for start in range(0, len(order), 37):
+        incremental.set_rows(order[start:start + 37], [fps[row] for row in order[start:start + 37]])
+    query_fp = smiles_similarity_fingerprint(query)
+    for matrix in (bulk, incremental):
+        scores = dict(matrix.search(query_fp, len(fps), 0.0, len(fps)))
+        assert [round(scores.get(row, 0.0), 5) for row in range(len(fps))] == [round(s, 5) for s in expected]
+
+    top = bulk.search(query_fp, len(fps), 0.3, 3)
+    assert len(top) == 3
+    assert all(score >= 0.3 for _, score in top)
+    assert [score for _, score in top] == sorted((score for _, score in top), reverse=True)
+
+    # swap-removal: the last row takes the place of row 0
+    bulk.move_row(len(fps) - 1, 0)
+    assert bulk.search(smiles_similarity_fingerprint("C1CCNCC1"), len(fps), 1.0, 5) == [(0, 1.0)]
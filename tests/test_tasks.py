@@ -17,3 +17,138 @@ def test_celery_task_endpoints(client: TestClient):
     assert r2.status_code == 200
     data = r2.json()
     assert data["status"] in ("SUCCESS", "PENDING")
+
+
+def test_ingest_file_task(client: TestClient, tmp_path):
+    from src.tasks import ingest_file
+
+    path = tmp_path / "mols.smi"
+    path.write_text("CCO\nOCC\nc1ccccc1\nbad$$$\n")
+    res = ingest_file.apply(args=[str(path), "mols.smi"])
+    assert res.get() == {"created": 2, "duplicates": 1, "invalid": 1}
+    assert not path.exists()
+    assert client.get("/molecules/lookup", params={"smiles": "c1ccccc1"}).status_code == 200
+
+
+def test_sharded_search(client: TestClient, fake_cache):
+    for smiles in ["CCO", "c1ccccc1", "Oc1ccccc1", "Cc1ccccc1", "CCN", "Nc1ccccc1"]:
+        client.post("/molecules/", json={"smiles": smiles})
+
+    r = client.post("/tasks/substructure", json={"substructure": "c1ccccc1", "shards": 4})
+    assert r.status_code == 200
+    progress = client.get(f"/tasks/{r.json()['task_id']}").json()["progress"]
+    assert [shard["shard"] for shard in progress["shards"]] == [0, 1, 2, 3]
+    assert all(shard["done"] for shard in progress["shards"])
+    assert progress["scanned"] == sum(shard["candidates"] for shard in progress["shards"])
+    assert progress["hits"] == 4
+
+    # the chord merges shard results in id order
+    from src.tasks import start_sharded_search
+
+    hits = start_sharded_search("c1ccccc1", None, 4).get()
+    ids = {m["smiles"]: m["id"] for m in client.get("/molecules/").json()}
+    assert hits == sorted(hits, key=ids.get) and len(hits) == 4
+    assert len(start_sharded_search("c1ccccc1", 2, 4).get()) == 2
+    # descriptor windows reach every shard: aniline and phenol are the aromatics with a donor
+    assert set(start_sharded_search("c1ccccc1", None, 4, {"hbd": [1, None]}).get()) == {"Oc1ccccc1", "Nc1ccccc1"}
+
+
+def test_sql_id_ranges_follow_uuid_order(client: TestClient):
+    import asyncio
+    from uuid import UUID
+
+    from src.chemistry import molecule_columns
+    from src.db import Molecule, db_session_scope
+    from src.utils import _filtered_ids, _get_candidate_rows, _shard_bounds
+
+    ids = {smiles: UUID(prefix * 8 + "-aaaa-4aaa-8aaa-aaaaaaaaaaaa") for smiles, prefix in (("CCO", "2"), ("CCN", "a"))}
+
+    async def run():
+        async with db_session_scope() as db:
+            db.add_all(Molecule(id=id, **molecule_columns(smiles)) for smiles, id in ids.items())
+        async with db_session_scope() as db:
+            return [
+                ([row[1] for row in await _get_candidate_rows(db, None, bounds)],
+                 await _filtered_ids(db, {"hbd": [1, None]}, bounds))
+                for bounds in _shard_bounds(2)
+            ]
+
+    # the bound between the two shards is 80000000-..., all digits
+    assert asyncio.run(run()) == [(["CCO"], [ids["CCO"]]), (["CCN"], [ids["CCN"]])]
+
+
+def test_shard_stops_once_limit_is_reached(client: TestClient, fake_cache):
+    import asyncio
+
+    from src.db import db_session_scope
+    from src.utils import _search_shard, _shard_keys
+
+    client.post("/molecules/", json={"smiles": "c1ccccc1"})
+
+    async def run():
+        await fake_cache.incrby(_shard_keys("s1")[1], 3)
+        async with db_session_scope() as db:
+            return await _search_shard(db, fake_cache, "c1ccccc1", (None, None), 3, "s1", 0)
+
+    assert asyncio.run(run()) == []
+    state = asyncio.run(fake_cache.hgetall(_shard_keys("s1")[0]))
+    assert '"cancelled": true' in state["0"]
+
+
+def test_task_status_reads_backend_progress(client: TestClient, fake_cache):
+    import json
+
+    fake_cache.store["celery-task-meta-t1"] = (float("inf"), json.dumps({
+        "status": "PROGRESS",
+        "result": {"scanned": 2000, "candidates": 5000, "hits": 2, "partial": ["CCO", "OCCO"]},
+    }))
+    data = client.get("/tasks/t1").json()
+    assert data["status"] == "PROGRESS"
+    assert data["progress"] == {"scanned": 2000, "candidates": 5000, "hits": 2}
+    assert data["partial"] == ["CCO", "OCCO"]
+
+    fake_cache.store["celery-task-meta-t1"] = (float("inf"), json.dumps({"status": "SUCCESS", "result": ["CCO"]}))
+    data = client.get("/tasks/t1").json()
+    assert (data["status"], data["result"], data["partial"]) == ("SUCCESS", ["CCO"], None)
+
+
+def test_cancelled_search_stops_with_partial_hits(client: TestClient, fake_cache):
+    import asyncio
+
+    from src.db import db_session_scope
+    from src.utils import _search_with_progress
+
+    for smiles in ["c1ccccc1", "Oc1ccccc1", "CCO"]:
+        client.post("/molecules/", json={"smiles": smiles})
+    assert client.delete("/tasks/s2").json()["status"] == "REVOKED"
+
+    reports = []
+
+    async def run():
+        async with db_session_scope() as db:
+            return await _search_with_progress(db, fake_cache, "c1ccccc1", None, "s2", reports.append)
+
+    hits, cancelled = asyncio.run(run())
+    assert cancelled and set(hits) == {"c1ccccc1", "Oc1ccccc1"}
+    assert reports[0]["scanned"] == reports[0]["candidates"] == 2
+    assert reports[0]["partial"] == hits
+
+
+def test_search_task_returns_hits(client: TestClient):
+    from src.tasks import substructure_search_db
+
+    for smiles in ["c1ccccc1", "Oc1ccccc1", "CCO"]:
+        client.post("/molecules/", json={"smiles": smiles})
+    assert set(substructure_search_db.apply(args=["c1ccccc1"]).get()) == {"c1ccccc1", "Oc1ccccc1"}
+    assert substructure_search_db.apply(args=["c1ccccc1", None, {"mw": [None, 80]}]).get() == ["c1ccccc1"]
+
+
+def test_batch_search_task_returns_hits_per_pattern(client: TestClient):
+    from src.tasks import substructure_batch_search_db
+
+    for smiles in ["c1ccccc1", "Oc1ccccc1", "CCO"]:
+        client.post("/molecules/", json={"smiles": smiles})
+    result = substructure_batch_search_db.apply(args=[["c1ccccc1", "[OX2H]"]]).get()
+    assert [entry["substructure"] for entry in result] == ["c1ccccc1", "[OX2H]"]
+    assert set(result[0]["hits"]) == {"c1ccccc1", "Oc1ccccc1"}
+    assert set(result[1]["hits"]) == {"Oc1ccccc1", "CCO"}